@@ -0,0 +1,355 @@
+import time
+import asyncio
+import logging
+import collections
+import numpy as np
+import metrics
+from sub_counter import CounterRules, SEEN_MESSAGE_IDS
+
+# Event kinds, as stored in the kind column
+CHAT = 0
+SUB = 1
+RESUB = 2
+GIFT = 3
+CHEER = 4
+KINDS = {
+    "channel.chat.message": CHAT,
+    "channel.subscribe": SUB,
+    "channel.subscription.message": RESUB,
+    "channel.subscription.gift": GIFT,
+    "channel.cheer": CHEER,
+}
+EVENT_TYPES = tuple(KINDS)
+
+# Per-bucket aggregates, in timeline column order
+COLUMNS = ("messages", "subs", "resubs", "gifted", "bits", "points")
+MESSAGES, SUBS, RESUBS, GIFTED, BITS, POINTS = range(len(COLUMNS))
+
+CHUNK_ROWS = 8192
+BUCKET_SECONDS = 60
+WINDOW_SECONDS = 600
+REFRESH_SECONDS = 1.0
+TOP_CHATTERS = 5
+NO_CHATTER = -1
+
+log = logging.getLogger(__name__)
+refresh_seconds = metrics.histogram("analytics_refresh_seconds", "Time to fold new events and publish a snapshot")
+
+
+class ChunkBuffer:
+    """
+    Preallocated columns for up to rows events. Rows are appended one at a
+    time; unfolded() returns the ones not yet aggregated as array views.
+    """
+
+    __slots__ = ("ts", "kind", "chatter", "amount", "points", "size", "folded")
+
+    def __init__(self, rows=CHUNK_ROWS):
+        self.ts = np.empty(rows, np.float64)
+        self.kind = np.empty(rows, np.int8)
+        self.chatter = np.empty(rows, np.int64)
+        self.amount = np.empty(rows, np.float64)
+        self.points = np.empty(rows, np.float64)
+        self.size = 0
+        self.folded = 0  # rows already added to the aggregates
+
+    def unfolded(self):
+        start, end = self.folded, self.size
+        self.folded = end
+        return (self.ts[start:end], self.kind[start:end], self.chatter[start:end],
+                self.amount[start:end], self.points[start:end])
+
+    def reset(self):
+        self.size = 0
+        self.folded = 0
+
+
+class _Bucket:
+    """Aggregates for one bucket_seconds slice, and its per-chatter message counts to subtract when it expires."""
+
+    __slots__ = ("totals", "chatters")
+
+    def __init__(self):
+        self.totals = np.zeros(len(COLUMNS))
+        self.chatters = []  # [(codes, counts)], one pair per fold that touched the bucket
+
+
+class Snapshot:
+    """
+    Stream stats at one refresh. Never changed after it is published, so
+    readers on the loop can keep a reference instead of copying it.
+
+    timeline is a read-only (buckets, COLUMNS) array, oldest bucket first,
+    starting at bucket_start (epoch seconds); frame() wraps it in a pandas
+    DataFrame without copying. eta_seconds is the projected time until the
+    counter's goal at the current points rate, None without a goal or rate.
+    """
+
+    __slots__ = ("at", "window_seconds", "bucket_seconds", "bucket_start", "timeline", "totals", "events",
+                 "messages_per_minute", "unique_chatters", "top_chatters", "subs_per_minute",
+                 "bits_per_minute", "points_per_minute", "count", "goal", "eta_seconds")
+
+    def __init__(self, **values):
+        for name in self.__slots__:
+            setattr(self, name, values.get(name))
+
+    def __getitem__(self, column):
+        """Window total of one of COLUMNS, e.g. snapshot["messages"]."""
+        return self.totals[COLUMNS.index(column)]
+
+    def frame(self):
+        import pandas as pd
+
+        index = pd.date_range(pd.Timestamp(self.bucket_start, unit="s", tz="UTC"), periods=len(self.timeline),
+                              freq=pd.Timedelta(seconds=self.bucket_seconds))
+        return pd.DataFrame(self.timeline, index=index, columns=COLUMNS, copy=False)
+
+    def as_dict(self):
+        values = {name: getattr(self, name) for name in self.__slots__ if name not in ("timeline", "totals")}
+        values.update(zip(COLUMNS, self.totals.tolist()))
+        return values
+
+
+class StreamAnalytics:
+    """
+    Live chat and sub stats over the last window_seconds: messages per
+    minute, unique and top chatters, sub/gift/cheer rates and, given the
+    sub_counter.SubCounter, time to its goal.
+
+    Events are appended to a columnar ChunkBuffer. Each refresh folds only
+    the rows added since the last one into per-bucket aggregates with NumPy
+    (bincount per bucket, unique per bucket and chatter), and expiring a
+    bucket subtracts what it added, so a refresh costs the same after a
+    million events as after ten. The result is published as a Snapshot in
+    snapshot, replaced (never modified) every refresh_seconds.
+
+    handle() is a sync Dispatcher handler; start() must be called from
+    inside the running event loop.
+    """
+
+    event_types = EVENT_TYPES
+
+    def __init__(self, window_seconds=WINDOW_SECONDS, bucket_seconds=BUCKET_SECONDS, refresh_seconds=REFRESH_SECONDS,
+                 counter=None, rules=None, top=TOP_CHATTERS, chunk_rows=CHUNK_ROWS):
+        self.bucket_seconds = bucket_seconds
+        self.window_buckets = max(int(window_seconds // bucket_seconds), 1)
+        self.window_seconds = self.window_buckets * bucket_seconds
+        self.refresh_seconds = refresh_seconds
+        self.counter = counter
+        self.rules = rules or (counter.rules if counter is not None else CounterRules())
+        self.top = top
+        self.started_at = time.time()
+        self.events = 0
+
+        self._chunk = ChunkBuffer(chunk_rows)
+        self._buckets = {}  # bucket number -> _Bucket
+        self._totals = np.zeros(len(COLUMNS))
+        self._codes = {}  # chatter user id -> code
+        self._logins = []  # code -> login
+        self._chatter_counts = np.zeros(1024, np.int64)  # code -> messages in the window
+        self._seen = collections.OrderedDict()
+        self._task = None
+        self.snapshot = None
+        self.refresh()
+
+    @classmethod
+    def from_config(cls, config, **kwargs):
+        kwargs.setdefault("window_seconds", config.analytics_window_seconds)
+        return cls(**kwargs)
+
+    # ----------------------------
+    # Recording
+    # ----------------------------
+    def register(self, dispatcher):
+        for sub_type in self.event_types:
+            dispatcher.register("notification", sub_type, self.handle)
+
+    def handle(self, notification):
+        """Dispatcher handler for chat and the sub_counter event types."""
+        message_id = notification.message_id
+        if message_id in self._seen:
+            return
+        self._seen[message_id] = None
+        if len(self._seen) > SEEN_MESSAGE_IDS:
+            self._seen.popitem(last=False)
+
+        sub_type = notification.subscription_type
+        event = notification.event
+        if sub_type == "channel.chat.message":
+            self.record(CHAT, event.chatter_user_id, event.chatter_user_login)
+            return
+        if sub_type == "channel.subscribe" and event.get("is_gift"):
+            return  # counted from the channel.subscription.gift summary
+        if sub_type == "channel.subscription.gift":
+            amount = int(event.get("total") or 0)
+        elif sub_type == "channel.cheer":
+            amount = int(event.get("bits") or 0)
+        else:
+            amount = 1
+        self.record(KINDS[sub_type], event.get("user_id"), event.get("user_login"), amount,
+                    self.rules.points(sub_type, event))
+
+    def record(self, kind, chatter_id=None, login=None, amount=1.0, points=0.0, at=None):
+        """Append one event; at is epoch seconds (default: now)."""
+        if chatter_id is None:
+            code = NO_CHATTER
+        else:
+            code = self._codes.get(chatter_id)
+            if code is None:
+                code = self._codes[chatter_id] = len(self._logins)
+                self._logins.append(login or chatter_id)
+
+        chunk = self._chunk
+        i = chunk.size
+        chunk.ts[i] = time.time() if at is None else at
+        chunk.kind[i] = kind
+        chunk.chatter[i] = code
+        chunk.amount[i] = amount
+        chunk.points[i] = points
+        chunk.size = i + 1
+        self.events += 1
+        if chunk.size == len(chunk.ts):
+            self._fold()
+            chunk.reset()
+
+    # ----------------------------
+    # Aggregating
+    # ----------------------------
+    def _fold(self):
+        ts, kind, chatter, amount, points = self._chunk.unfolded()
+        if not len(ts):
+            return
+        bucket = (ts // self.bucket_seconds).astype(np.int64)
+        # Events too late for the window are dropped
+        horizon = self._newest_bucket(ts.max()) - self.window_buckets + 1
+        if bucket.min() < horizon:
+            keep = bucket >= horizon
+            bucket, kind, chatter, amount, points = bucket[keep], kind[keep], chatter[keep], amount[keep], points[keep]
+            if not len(bucket):
+                return
+
+        numbers, slot = np.unique(bucket, return_inverse=True)
+        n = len(numbers)
+        is_chat = kind == CHAT
+        sums = np.empty((n, len(COLUMNS)))
+        sums[:, MESSAGES] = np.bincount(slot, is_chat, n)
+        sums[:, SUBS] = np.bincount(slot, kind == SUB, n)
+        sums[:, RESUBS] = np.bincount(slot, kind == RESUB, n)
+        sums[:, GIFTED] = np.bincount(slot, np.where(kind == GIFT, amount, 0.0), n)
+        sums[:, BITS] = np.bincount(slot, np.where(kind == CHEER, amount, 0.0), n)
+        sums[:, POINTS] = np.bincount(slot, points, n)
+        self._totals += sums.sum(axis=0)
+
+        # Messages per (bucket, chatter): one sort of a combined key instead of a Python loop over messages
+        codes = chatter[is_chat]
+        if len(codes):
+            if len(self._logins) > len(self._chatter_counts):
+                grown = np.zeros(max(len(self._logins), 2 * len(self._chatter_counts)), np.int64)
+                grown[:len(self._chatter_counts)] = self._chatter_counts
+                self._chatter_counts = grown
+            keys, counts = np.unique((slot[is_chat].astype(np.int64) << 32) | codes, return_counts=True)
+            np.add.at(self._chatter_counts, keys & 0xFFFFFFFF, counts)
+            edges = np.searchsorted(keys >> 32, np.arange(n + 1))
+        else:
+            keys = counts = edges = None
+
+        for j, number in enumerate(numbers.tolist()):
+            entry = self._buckets.get(number)
+            if entry is None:
+                entry = self._buckets[number] = _Bucket()
+            entry.totals += sums[j]
+            if edges is not None and edges[j] < edges[j + 1]:
+                entry.chatters.append((keys[edges[j]:edges[j + 1]] & 0xFFFFFFFF, counts[edges[j]:edges[j + 1]]))
+
+    def _newest_bucket(self, ts):
+        return max(int(ts // self.bucket_seconds), max(self._buckets, default=0))
+
+    def _expire(self, horizon):
+        for number in [b for b in self._buckets if b < horizon]:
+            entry = self._buckets.pop(number)
+            self._totals -= entry.totals
+            for codes, counts in entry.chatters:
+                np.subtract.at(self._chatter_counts, codes, counts)
+
+    def refresh(self, now=None):
+        """Fold new events, drop expired buckets and publish a new snapshot."""
+        start = time.perf_counter()
+        now = time.time() if now is None else now
+        self._fold()
+        current = self._newest_bucket(now)
+        horizon = current - self.window_buckets + 1
+        self._expire(horizon)
+
+        timeline = np.zeros((self.window_buckets, len(COLUMNS)))
+        for number, entry in self._buckets.items():
+            timeline[number - horizon] = entry.totals
+        timeline.flags.writeable = False
+        totals = self._totals.copy()
+        totals.flags.writeable = False
+
+        # Rates over the time actually covered, but at least one bucket so the first seconds don't extrapolate
+        minutes = max(min(self.window_seconds, now - self.started_at), self.bucket_seconds) / 60
+        # Rank only the chatters active in the window, not everyone seen this stream
+        active = np.flatnonzero(self._chatter_counts)
+        unique = len(active)
+        top = ()
+        if unique:
+            counts = self._chatter_counts[active]
+            k = min(self.top, unique)
+            best = np.argpartition(counts, -k)[-k:]
+            best = best[np.argsort(-counts[best], kind="stable")]
+            top = tuple((self._logins[code], int(count)) for code, count in zip(active[best].tolist(),
+                                                                                counts[best].tolist()))
+
+        count = goal = eta = None
+        points_per_minute = float(totals[POINTS] / minutes)
+        if self.counter is not None:
+            count, goal = self.counter.count, self.counter.goal
+            if goal is not None:
+                remaining = goal - count
+                if remaining <= 0:
+                    eta = 0.0
+                elif points_per_minute > 0:
+                    eta = remaining / points_per_minute * 60
+
+        self.snapshot = Snapshot(
+            at=now,
+            window_seconds=self.window_seconds,
+            bucket_seconds=self.bucket_seconds,
+            bucket_start=horizon * self.bucket_seconds,
+            timeline=timeline,
+            totals=totals,
+            events=self.events,
+            messages_per_minute=float(totals[MESSAGES] / minutes),
+            unique_chatters=unique,
+            top_chatters=top,
+            subs_per_minute=float((totals[SUBS] + totals[RESUBS] + totals[GIFTED]) / minutes),
+            bits_per_minute=float(totals[BITS] / minutes),
+            points_per_minute=points_per_minute,
+            count=count,
+            goal=goal,
+            eta_seconds=eta,
+        )
+        refresh_seconds.observe(time.perf_counter() - start)
+        return self.snapshot
+
+    # ----------------------------
+    # Lifecycle
+    # ----------------------------
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+        return self
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.refresh_seconds)
+            try:
+                self.refresh()
+            except Exception:
+                log.exception("Refreshing stream analytics failed")
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
@@ -0,0 +1,74 @@
+"""
+Micro-benchmark: cost of ChatArchive.put() on the event loop versus writing
+each message to SQLite inline, and how fast the writer thread drains a
+raid-sized burst into each backend.
+
+    python -m benchmarks.bench_archive [messages]
+"""
+import os
+import sys
+import json
+import time
+import sqlite3
+import tempfile
+from chat_archive import ChatArchive, SqliteBackend, JsonlBackend, _row
+from eventsub_dispatch import ChatMessage, Notification
+from benchmarks.bench_dispatch import chat_frame
+
+
+def make_notifications(n):
+    return [Notification(json.loads(chat_frame(i)), ChatMessage) for i in range(n)]
+
+
+def inline_sqlite(notifications, path):
+    """What a naive handler would do: one INSERT and commit per message on the loop."""
+    backend = SqliteBackend(path)
+    backend.open()
+    start = time.perf_counter()
+    for notification in notifications:
+        backend.write([_row((notification.timestamp, notification.event))])
+    elapsed = time.perf_counter() - start
+    backend.close()
+    return elapsed
+
+
+def archived(notifications, backend):
+    archive = ChatArchive(backend, flush_seconds=0.05).start()
+    start = time.perf_counter()
+    for notification in notifications:
+        archive.put(notification)
+    put_seconds = time.perf_counter() - start
+    archive.flush()
+    drained_seconds = time.perf_counter() - start
+    archive.close()
+    return put_seconds, drained_seconds
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    notifications = make_notifications(n)
+
+    with tempfile.TemporaryDirectory() as scratch:
+        inline_n = min(n, 5_000)
+        inline = inline_sqlite(notifications[:inline_n], os.path.join(scratch, "inline.db"))
+        print(f"{'inline sqlite per message':28s} {inline / inline_n * 1e6:9.1f} us/msg on the loop"
+              f"  {inline_n / inline:10,.0f} msg/s")
+
+        for name, backend in (
+            ("ChatArchive sqlite", SqliteBackend(os.path.join(scratch, "chat.db"))),
+            ("ChatArchive jsonl.gz", JsonlBackend(os.path.join(scratch, "chat_logs"))),
+        ):
+            put_seconds, drained_seconds = archived(notifications, backend)
+            print(f"{name:28s} {put_seconds / n * 1e6:9.2f} us/msg on the loop"
+                  f"  {n / drained_seconds:10,.0f} msg/s written")
+
+        db = sqlite3.connect(os.path.join(scratch, "chat.db"))
+        stored = db.execute("SELECT COUNT(*) FROM chat_messages").fetchone()[0]
+        plan = db.execute("EXPLAIN QUERY PLAN SELECT * FROM chat_messages WHERE chatter_login = ? "
+                          "ORDER BY sent_at DESC LIMIT 100", ("user7",)).fetchall()
+        db.close()
+        print(f"{stored} rows stored; chatter lookup plan: {plan[0][-1]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+Micro-benchmark: EventSub frames/sec through the old json.loads + if/elif
+handler versus eventsub_dispatch.Dispatcher (stdlib json and orjson).
+
+    python -m benchmarks.bench_dispatch [frames]
+"""
+import sys
+import json
+import time
+import random
+import asyncio
+import eventsub_dispatch
+from eventsub_dispatch import Dispatcher
+
+
+def chat_frame(i):
+    return json.dumps({
+        "metadata": {
+            "message_id": f"chat-{i}",
+            "message_type": "notification",
+            "message_timestamp": "2024-01-01T00:00:00.000Z",
+            "subscription_type": "channel.chat.message",
+            "subscription_version": "1",
+        },
+        "payload": {
+            "subscription": {"id": "sub", "type": "channel.chat.message", "version": "1", "status": "enabled"},
+            "event": {
+                "broadcaster_user_id": "1", "broadcaster_user_login": "streamer", "broadcaster_user_name": "Streamer",
+                "chatter_user_id": str(i % 500), "chatter_user_login": f"user{i % 500}", "chatter_user_name": f"User{i % 500}",
+                "message_id": f"m-{i}", "message_type": "text", "color": "#FF0000",
+                "message": {"text": f"hello chat {i} PogChamp", "fragments": [{"type": "text", "text": f"hello chat {i}"}]},
+                "badges": [{"set_id": "subscriber", "id": "12", "info": "12"}],
+            },
+        },
+    }, separators=(",", ":"))
+
+
+def keepalive_frame(i):
+    return json.dumps({
+        "metadata": {"message_id": f"ka-{i}", "message_type": "session_keepalive",
+                     "message_timestamp": "2024-01-01T00:00:00.000Z"},
+        "payload": {},
+    }, separators=(",", ":"))
+
+
+def follow_frame(i):
+    return json.dumps({
+        "metadata": {"message_id": f"f-{i}", "message_type": "notification",
+                     "message_timestamp": "2024-01-01T00:00:00.000Z",
+                     "subscription_type": "channel.follow", "subscription_version": "2"},
+        "payload": {"subscription": {"id": "sub2", "type": "channel.follow"},
+                    "event": {"user_id": str(i), "user_login": f"f{i}", "user_name": f"F{i}"}},
+    }, separators=(",", ":"))
+
+
+def make_frames(n):
+    rng = random.Random(42)
+    makers = [chat_frame] * 7 + [keepalive_frame] * 2 + [follow_frame]
+    return [rng.choice(makers)(i) for i in range(n)]
+
+
+async def legacy(frames):
+    """The original twitch_listener body: full decode then an if/elif chain."""
+    handled = 0
+    for msg in frames:
+        data = json.loads(msg)
+        mtype = data["metadata"]["message_type"]
+        if mtype == "session_welcome":
+            pass
+        elif mtype == "notification":
+            event_type = data["metadata"]["subscription_type"]
+            event = data["payload"]["event"]
+            if event_type == "channel.chat.message":
+                user = event["chatter_user_name"]
+                msg_text = event["message"]["text"]
+                broadcaster_user_name = event["broadcaster_user_name"]
+                handled += bool(user and msg_text and broadcaster_user_name)
+            elif event_type == "":
+                pass
+        elif mtype == "session_reconnect":
+            pass
+    return handled
+
+
+async def dispatcher(frames):
+    handled = 0
+    d = Dispatcher()
+
+    @d.on("notification", "channel.chat.message")
+    def on_chat(notification):
+        nonlocal handled
+        chat = notification.event
+        handled += bool(chat.chatter_user_name and chat.text and chat.broadcaster_user_name)
+
+    for msg in frames:
+        await d.dispatch_raw(msg)
+    return handled
+
+
+def measure(fn, frames, repeat=5):
+    """Best frames/sec over a few runs, to keep scheduler noise out of the numbers."""
+    best = 0.0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        handled = asyncio.run(fn(frames))
+        best = max(best, len(frames) / (time.perf_counter() - start))
+    return best, handled
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    frames = make_frames(n)
+    results = {}
+
+    results["legacy if/elif + json"] = measure(legacy, frames)
+
+    fast_loads, peek = eventsub_dispatch.loads, eventsub_dispatch.PEEK_BEFORE_DECODE
+    eventsub_dispatch.loads, eventsub_dispatch.PEEK_BEFORE_DECODE = json.loads, True
+    results["dispatcher + json"] = measure(dispatcher, frames)
+    eventsub_dispatch.loads, eventsub_dispatch.PEEK_BEFORE_DECODE = fast_loads, peek
+    if fast_loads is not json.loads:
+        results["dispatcher + orjson"] = measure(dispatcher, frames)
+
+    baseline = results["legacy if/elif + json"][0]
+    for name, (fps, handled) in results.items():
+        print(f"{name:24s} {fps:12,.0f} frames/s  x{fps / baseline:.2f}  ({handled} handled)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,248 @@
+"""
+End-to-end benchmark against fakes.twitch_server: the real twitch_listener,
+subscription bootstrap, EventPipeline and TitleWriter talk to a local
+stand-in for Helix, OAuth and EventSub, so numbers are repeatable offline.
+
+Measures event -> handler latency (p50/p90/p99) at a steady rate, frames/sec
+when flooded, Helix calls per title change and the delivery gap across a
+session_reconnect handoff. Results are printed as JSON for comparing runs.
+
+    python -m benchmarks.bench_e2e [--events 5000] [--rate 500] [--output results.json]
+"""
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import tempfile
+import contextlib
+from datetime import datetime, timezone
+
+BROADCASTER = "streamer"
+BOT = "chatbot"
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(int(len(values) * pct / 100), len(values) - 1)]
+
+
+def latency_summary(samples):
+    return {
+        "count": len(samples),
+        "p50_ms": percentile(samples, 50) * 1000 if samples else None,
+        "p90_ms": percentile(samples, 90) * 1000 if samples else None,
+        "p99_ms": percentile(samples, 99) * 1000 if samples else None,
+        "max_ms": max(samples) * 1000 if samples else None,
+    }
+
+
+class Receiver:
+    """Pipeline handler that timestamps every chat message it gets."""
+
+    def __init__(self):
+        self.arrivals = []  # (received_at, sent_at)
+        self.expected = 0
+        self.done = asyncio.Event()
+
+    def reset(self, expected):
+        self.arrivals = []
+        self.expected = expected
+        self.done.clear()
+
+    async def handle(self, event):
+        self.arrivals.append((time.perf_counter(), float(event["message"])))
+        if len(self.arrivals) >= self.expected:
+            self.done.set()
+
+    def latencies(self):
+        return [received - sent for received, sent in self.arrivals]
+
+
+def timed_chat(broadcaster_id):
+    from fakes.twitch_server import chat_event
+    # The send time rides in the message text, so it survives every layer up to the handler
+    return lambda i: chat_event(i, broadcaster_id, text=repr(time.perf_counter()))
+
+
+async def wait_for(receiver, timeout):
+    try:
+        await asyncio.wait_for(receiver.done.wait(), timeout)
+    except asyncio.TimeoutError:
+        pass
+
+
+async def bench_latency(server, receiver, make_event, events, rate):
+    receiver.reset(events)
+    await server.emit("channel.chat.message", make_event, events, rate=rate)
+    await wait_for(receiver, 10)
+    return dict(latency_summary(receiver.latencies()), rate_per_second=rate, sent=events)
+
+
+async def bench_throughput(server, receiver, make_event, events):
+    receiver.reset(events)
+    start = time.perf_counter()
+    await server.emit("channel.chat.message", make_event, events)
+    await wait_for(receiver, 30)
+    elapsed = (receiver.arrivals[-1][0] if receiver.arrivals else time.perf_counter()) - start
+    return {
+        "sent": events,
+        "received": len(receiver.arrivals),
+        "frames_per_second": len(receiver.arrivals) / elapsed if elapsed > 0 else None,
+    }
+
+
+async def bench_reconnect(server, receiver, make_event, events, rate):
+    receiver.reset(events)
+    session = server.active_session()
+    emitting = asyncio.create_task(server.emit("channel.chat.message", make_event, events, rate=rate))
+    await asyncio.sleep(events / rate / 2)
+    reconnect_at = time.perf_counter()
+    await server.send_reconnect(session)
+    await asyncio.wait_for(session.welcomed.wait(), 10)
+    handoff_seconds = time.perf_counter() - reconnect_at
+    await emitting
+    await wait_for(receiver, 10)
+
+    received = [r for r, _ in receiver.arrivals]
+    gaps = [b - a for a, b in zip(received, received[1:])]
+    return {
+        "sent": events,
+        "received": len(received),
+        "lost": events - len(received),
+        "handoff_ms": handoff_seconds * 1000,
+        "max_gap_ms": max(gaps) * 1000 if gaps else None,
+        "expected_gap_ms": 1000 / rate,
+    }
+
+
+async def bench_title(server, auth, broadcaster_id, changes):
+    from title_writer import TitleWriter
+
+    writer = TitleWriter(auth, broadcaster_id, coalesce_seconds=0.05)
+    before = server.calls.copy()
+    await writer.sync_async()
+    titles = [f"Subathon {n}/{changes}" for n in range(changes)]
+    for title in titles:
+        # Each change arrives twice and then once more after it is written, like a noisy caller
+        await writer.set_title_async(title)
+        await writer.set_title_async(title)
+        await writer.flush_async()
+        await writer.set_title_async(title)
+    await writer.close_async()
+
+    calls = server.calls - before
+    helix = sum(n for (_, path), n in calls.items() if path.startswith("/helix"))
+    return {
+        "title_changes": changes,
+        "set_title_calls": changes * 3,
+        "patches": calls[("PATCH", "/helix/channels")],
+        "helix_calls": helix,
+        "helix_calls_per_change": helix / changes,
+        "final_title_matches": server.titles.get(broadcaster_id) == titles[-1],
+    }
+
+
+async def run(args):
+    from fakes.twitch_server import FakeTwitchServer
+
+    server = await FakeTwitchServer(port=args.port).start()
+    broadcaster_id = server.user_id(BROADCASTER)
+    server.user_id(BOT)
+
+    import metrics
+    import helix_client
+    import twitch_functions
+    from scopes import SCOPES
+    from twitch_auth import TwitchAuth
+    from event_pipeline import EventPipeline
+    from helix_scheduler import scheduler
+
+    # A long-lived token on disk, so TwitchAuth never starts a device flow
+    server.granted_scopes = list(SCOPES)
+    with open(f"twitch_token-{broadcaster_id}.json", "w") as f:
+        json.dump({"access_token": "fake", "refresh_token": "fake", "expires_in": 14400, "scope": SCOPES,
+                   "expires_at": datetime.fromtimestamp(time.time() + 14400, timezone.utc).isoformat()}, f)
+    auth = TwitchAuth(scopes=SCOPES, broadcaster_id=broadcaster_id)
+
+    receiver = Receiver()
+    pipeline = EventPipeline(receiver.handle, workers=4, maxsize=args.events, rate_per_second=None)
+    pipeline.start()
+    make_event = timed_chat(broadcaster_id)
+
+    results = {"python": sys.version.split()[0], "events": args.events}
+    # twitch_listener prints every chat line; keep that I/O out of the numbers
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        listener = asyncio.create_task(twitch_functions.twitch_listener(auth, pipeline))
+        setup_start = time.perf_counter()
+        await server.wait_for_subscription("channel.chat.message")
+        results["connect_and_subscribe_ms"] = (time.perf_counter() - setup_start) * 1000
+
+        results["latency"] = await bench_latency(server, receiver, make_event, args.events, args.rate)
+        results["throughput"] = await bench_throughput(server, receiver, make_event, args.events)
+        results["reconnect"] = await bench_reconnect(server, receiver, make_event, min(args.events, args.rate * 4), args.rate)
+        results["title"] = await bench_title(server, auth, broadcaster_id, args.title_changes)
+
+        listener.cancel()
+        await asyncio.gather(listener, return_exceptions=True)
+        await pipeline.stop()
+        await scheduler.close()
+        await helix_client.close_async()
+        auth.close()
+        await server.stop()
+
+    results["server_calls"] = {f"{method} {path}": n for (method, path), n in sorted(server.calls.items())}
+    results["metrics"] = metrics.snapshot()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--events", type=int, default=5000)
+    parser.add_argument("--rate", type=int, default=500, help="events/sec for the latency and reconnect runs")
+    parser.add_argument("--title-changes", type=int, default=20)
+    parser.add_argument("--port", type=int, default=0, help="fake server port (default: any free port)")
+    parser.add_argument("--output", help="also write the JSON results to this file")
+    args = parser.parse_args()
+    args.port = args.port or free_port()
+
+    base = f"127.0.0.1:{args.port}"
+    # Must be set before the project modules are imported, they read these at import time
+    os.environ.update({
+        "TWITCH_API_BASE": f"http://{base}/helix",
+        "TWITCH_AUTH_BASE": f"http://{base}/oauth2",
+        "TWITCH_EVENTSUB_URL": f"ws://{base}/ws",
+        "TWITCH_CLIENT_ID": "bench",
+        "TWITCH_CLIENT_SECRET": "bench",
+        "BROADCASTER_USERNAME": BROADCASTER,
+        "BOT_USERNAME": BOT,
+    })
+    for key, value in {"MAX_SUBS": "100", "UPDATE_INTERVAL_MINUTES": "30", "BASE_SUBS": "1",
+                       "LINEAR": "True", "title": "Subathon  subs", "insert_after": "9"}.items():
+        os.environ.setdefault(key, value)
+
+    # Token and user caches go to a scratch directory, not the working tree
+    output = os.path.abspath(args.output) if args.output else None
+    with tempfile.TemporaryDirectory() as scratch:
+        os.chdir(scratch)
+        results = asyncio.run(run(args))
+
+    text = json.dumps(results, indent=2)
+    print(text)
+    if output:
+        with open(output, "w") as f:
+            f.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
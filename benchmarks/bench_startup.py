@@ -0,0 +1,86 @@
+"""
+Cold-start benchmark: wall time of fresh interpreter runs of the CLI, plus
+what each one imports, compared with a bare interpreter and with importing
+the full listener stack.
+
+    python -m benchmarks.bench_startup [runs] [--output results.json]
+"""
+import os
+import sys
+import json
+import shutil
+import argparse
+import tempfile
+import statistics
+import subprocess
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MAIN = os.path.join(ROOT, "main.py")
+
+CASES = {
+    "python -c pass": [sys.executable, "-c", "pass"],
+    "main.py --help": [sys.executable, MAIN, "--help"],
+    "main.py auth --check": [sys.executable, MAIN, "auth", "--check"],
+    "import twitch_functions": [sys.executable, "-c", "import twitch_functions"],
+}
+
+
+def run_once(cmd, cwd, env):
+    start = time.perf_counter()
+    subprocess.run(cmd, cwd=cwd, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+
+def import_profile(cmd, cwd, env, top=5):
+    """Heaviest top-level imports from -X importtime, as {module: ms}."""
+    result = subprocess.run([cmd[0], "-X", "importtime"] + cmd[1:], cwd=cwd, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    modules = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if name.startswith("  ") or not cumulative.strip().isdigit():
+            continue  # nested import, already counted in its parent
+        modules[name.strip()] = int(cumulative) / 1000
+    return dict(sorted(modules.items(), key=lambda kv: -kv[1])[:top])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("runs", nargs="?", type=int, default=10)
+    parser.add_argument("--output", help="also write the JSON results to this file")
+    args = parser.parse_args()
+
+    env = dict(os.environ, PYTHONPATH=ROOT, TWITCH_CLIENT_ID="bench", TWITCH_CLIENT_SECRET="bench",
+               MAX_SUBS="100", BASE_SUBS="1", UPDATE_INTERVAL_MINUTES="30", title="Subathon  subs", insert_after="1")
+    results = {"python": sys.version.split()[0], "runs": args.runs, "cases": {}}
+    with tempfile.TemporaryDirectory() as scratch:
+        shutil.copy(os.path.join(ROOT, ".envexample"), os.path.join(scratch, ".env"))
+        with open(os.path.join(scratch, "twitch_token-1.json"), "w") as f:
+            json.dump({"access_token": "x", "refresh_token": "y", "expires_at": "2020-01-01T00:00:00+00:00",
+                       "scope": []}, f)
+
+        for name, cmd in CASES.items():
+            run_once(cmd, scratch, env)  # warm the filesystem and bytecode caches
+            times = [run_once(cmd, scratch, env) for _ in range(args.runs)]
+            results["cases"][name] = {
+                "median_ms": statistics.median(times) * 1000,
+                "min_ms": min(times) * 1000,
+                "top_imports_ms": import_profile(cmd, scratch, env),
+            }
+
+    baseline = results["cases"]["python -c pass"]["median_ms"]
+    for case in results["cases"].values():
+        case["over_bare_interpreter_ms"] = case["median_ms"] - baseline
+
+    text = json.dumps(results, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,303 @@
+import os
+import gzip
+import json
+import time
+import shutil
+import logging
+import threading
+import collections
+from datetime import datetime, timezone
+import metrics
+
+BACKEND_SQLITE = "sqlite"
+BACKEND_JSONL = "jsonl"
+BACKENDS = (BACKEND_SQLITE, BACKEND_JSONL)
+
+DEFAULT_BATCH_SIZE = 500
+DEFAULT_FLUSH_SECONDS = 1.0
+# Messages held in memory while the disk is slow; past this the oldest are dropped
+DEFAULT_MAX_PENDING = 100_000
+# Start a new JSONL file past this size (or at midnight UTC)
+DEFAULT_ROTATE_BYTES = 64 * 1024 * 1024
+
+log = logging.getLogger(__name__)
+archived_total = metrics.counter("chat_archive_messages_total", "Chat messages by archive outcome", ("result",))
+flush_seconds = metrics.histogram("chat_archive_flush_seconds", "Time to write one batch of chat messages")
+pending_depth = metrics.gauge("chat_archive_pending", "Chat messages waiting to be archived")
+
+
+def _epoch(timestamp):
+    """EventSub timestamps carry nanoseconds, which fromisoformat() can't take on older Pythons."""
+    if not timestamp:
+        return time.time()
+    whole, _, fraction = timestamp.rstrip("Z").partition(".")
+    seconds = datetime.fromisoformat(whole).replace(tzinfo=timezone.utc).timestamp()
+    return seconds + (float(f"0.{fraction}") if fraction else 0.0)
+
+
+def _row(item):
+    timestamp, chat = item
+    return (
+        chat.message_id,
+        _epoch(timestamp),
+        chat.broadcaster_user_id,
+        chat.chatter_user_id,
+        chat.chatter_user_login,
+        chat.text,
+        chat.badges or None,
+    )
+
+
+# ----------------------------
+# Backends (only ever used from the writer thread)
+# ----------------------------
+class SqliteBackend:
+    """
+    One chat_messages table in WAL mode, indexed by chatter and by time.
+    Each batch is a single transaction; redelivered message ids are ignored.
+    """
+
+    SCHEMA = (
+        """CREATE TABLE IF NOT EXISTS chat_messages (
+            message_id TEXT PRIMARY KEY,
+            sent_at REAL NOT NULL,
+            broadcaster_id TEXT NOT NULL,
+            chatter_id TEXT NOT NULL,
+            chatter_login TEXT NOT NULL,
+            text TEXT NOT NULL,
+            badges TEXT
+        )""",
+        "CREATE INDEX IF NOT EXISTS chat_messages_chatter ON chat_messages (chatter_id, sent_at)",
+        "CREATE INDEX IF NOT EXISTS chat_messages_login ON chat_messages (chatter_login, sent_at)",
+        "CREATE INDEX IF NOT EXISTS chat_messages_sent_at ON chat_messages (sent_at)",
+    )
+    INSERT = "INSERT OR IGNORE INTO chat_messages VALUES (?, ?, ?, ?, ?, ?, ?)"
+
+    def __init__(self, path="chat.db"):
+        self.path = path
+        self._db = None
+
+    def open(self):
+        import sqlite3
+
+        self._db = sqlite3.connect(self.path)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        # WAL + NORMAL only syncs at checkpoints: a power cut can lose the last batch, never corrupt the file
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        with self._db:
+            for statement in self.SCHEMA:
+                self._db.execute(statement)
+
+    def write(self, rows):
+        with self._db:
+            self._db.executemany(self.INSERT, (
+                row[:-1] + (json.dumps(row[-1], separators=(",", ":")) if row[-1] else None,) for row in rows
+            ))
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+
+class JsonlBackend:
+    """
+    Appends one JSON object per line to chat-<UTC start time>.jsonl in
+    directory. Files rotate at rotate_bytes or when the UTC day changes, and
+    rotated files are gzipped, so the names double as a coarse time index.
+    There is no per-chatter index; use the SQLite backend for lookups.
+    """
+
+    FIELDS = ("message_id", "sent_at", "broadcaster_id", "chatter_id", "chatter_login", "text", "badges")
+
+    def __init__(self, directory="chat_logs", rotate_bytes=DEFAULT_ROTATE_BYTES, compress=True):
+        self.directory = directory
+        self.rotate_bytes = rotate_bytes
+        self.compress = compress
+        self._file = None
+        self._day = None
+
+    def open(self):
+        os.makedirs(self.directory, exist_ok=True)
+        # Files left uncompressed by a crash are finished off on the next start
+        if self.compress:
+            for name in os.listdir(self.directory):
+                if name.endswith(".jsonl"):
+                    self._compress(os.path.join(self.directory, name))
+
+    def _start_file(self, sent_at):
+        start = datetime.fromtimestamp(sent_at, timezone.utc)
+        self._day = start.date()
+        path = os.path.join(self.directory, f"chat-{start:%Y%m%dT%H%M%S}.jsonl")
+        self._file = open(path, "a", encoding="utf-8")
+
+    def _rotate(self):
+        path = self._file.name
+        self._file.close()
+        self._file = None
+        if self.compress:
+            self._compress(path)
+
+    def _compress(self, path):
+        with open(path, "rb") as src, gzip.open(f"{path}.gz", "wb") as dst:
+            shutil.copyfileobj(src, dst)
+        os.remove(path)
+
+    def write(self, rows):
+        if self._file is None:
+            self._start_file(rows[0][1])
+        elif (self._file.tell() >= self.rotate_bytes
+              or datetime.fromtimestamp(rows[0][1], timezone.utc).date() != self._day):
+            self._rotate()
+            self._start_file(rows[0][1])
+        self._file.write("".join(
+            json.dumps(dict(zip(self.FIELDS, row)), separators=(",", ":"), ensure_ascii=False) + "\n"
+            for row in rows
+        ))
+        self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            self._rotate()
+
+
+def make_backend(kind, path=None):
+    if kind == BACKEND_SQLITE:
+        return SqliteBackend(path or "chat.db")
+    if kind == BACKEND_JSONL:
+        return JsonlBackend(path or "chat_logs")
+    raise ValueError(f"Unknown chat archive backend {kind!r}, expected one of {BACKENDS}")
+
+
+# ----------------------------
+# Archive
+# ----------------------------
+class ChatArchive:
+    """
+    Chat log written from a background thread.
+
+    put() is called from the event loop for every channel.chat.message and
+    only appends to an in-memory deque, so the socket reader never waits on
+    the disk. The writer thread wakes when batch_size messages are waiting or
+    every flush_seconds, turns the batch into rows and hands it to the
+    backend in one write. A failed write is retried with the next batch; if
+    the disk can't keep up, the oldest messages beyond max_pending are dropped.
+    """
+
+    def __init__(self, backend, batch_size=DEFAULT_BATCH_SIZE, flush_seconds=DEFAULT_FLUSH_SECONDS,
+                 max_pending=DEFAULT_MAX_PENDING):
+        self.backend = backend
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self._pending = collections.deque(maxlen=max_pending)
+        self._retry = []
+        self._wake = threading.Event()
+        self._stopping = False
+        self._thread = None
+        self._flushed = threading.Condition()
+        self._written = 0
+        pending_depth.set_function(lambda: len(self._pending))
+
+    @classmethod
+    def from_config(cls, config, kind=None):
+        """Archive for the CHAT_ARCHIVE* settings (kind overrides CHAT_ARCHIVE)."""
+        backend = make_backend(kind or config.chat_archive, config.chat_archive_path)
+        return cls(backend, batch_size=config.chat_archive_batch, flush_seconds=config.chat_archive_flush_seconds)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="chat-archive", daemon=True)
+        self._thread.start()
+        return self
+
+    def put(self, notification):
+        """Queue one channel.chat.message Notification; never blocks."""
+        pending = self._pending
+        if len(pending) == pending.maxlen:
+            archived_total.inc("dropped")
+        pending.append((notification.timestamp, notification.event))
+        if len(pending) == self.batch_size:
+            self._wake.set()
+
+    def flush(self, timeout=None):
+        """Block until everything queued before this call has been written."""
+        with self._flushed:
+            target = self._written + len(self._pending) + len(self._retry)
+            self._wake.set()
+            return self._flushed.wait_for(lambda: self._written >= target, timeout)
+
+    def close(self, timeout=10):
+        """Write out what is queued and stop the writer thread."""
+        if self._thread is None:
+            return
+        self._stopping = True
+        self._wake.set()
+        self._thread.join(timeout)
+        self._thread = None
+        pending_depth.remove()
+
+    def _run(self):
+        try:
+            self.backend.open()
+        except Exception:
+            log.exception("Could not open the chat archive; messages will not be archived")
+            return
+        while True:
+            self._wake.wait(self.flush_seconds)
+            self._wake.clear()
+            stopping = self._stopping
+            while self._pending or self._retry:
+                if not self._write_batch():
+                    break
+                if len(self._pending) < self.batch_size and not stopping:
+                    break
+            if stopping:
+                break
+        self.backend.close()
+
+    def _write_batch(self):
+        pending = self._pending
+        items = [pending.popleft() for _ in range(min(len(pending), self.batch_size))]
+        rows = self._retry + [_row(item) for item in items]
+        start = time.perf_counter()
+        try:
+            self.backend.write(rows)
+        except Exception as e:
+            log.error("Chat archive write of %d messages failed, retrying with the next batch: %s", len(rows), e)
+            archived_total.inc("failed", amount=len(rows))
+            self._retry = rows[-pending.maxlen:]
+            return False
+        flush_seconds.observe(time.perf_counter() - start)
+        archived_total.inc("ok", amount=len(rows))
+        self._retry = []
+        with self._flushed:
+            self._written += len(rows)
+            self._flushed.notify_all()
+        return True
+
+
+def query(path="chat.db", chatter_id=None, chatter_login=None, since=None, until=None, limit=100):
+    """
+    Read back archived messages from a SQLite archive, newest first, as
+    dicts. Uses its own connection, so it can run while the archive writes.
+    """
+    import sqlite3
+
+    clauses, params = [], []
+    for column, value in (("chatter_id", chatter_id), ("chatter_login", chatter_login)):
+        if value is not None:
+            clauses.append(f"{column} = ?")
+            params.append(value)
+    if since is not None:
+        clauses.append("sent_at >= ?")
+        params.append(since)
+    if until is not None:
+        clauses.append("sent_at < ?")
+        params.append(until)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    db = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    db.row_factory = sqlite3.Row
+    try:
+        rows = db.execute(f"SELECT * FROM chat_messages {where} ORDER BY sent_at DESC LIMIT ?", params + [limit])
+        return [dict(row) for row in rows]
+    finally:
+        db.close()
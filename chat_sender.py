@@ -0,0 +1,268 @@
+import time
+import heapq
+import asyncio
+import logging
+import itertools
+import collections
+import helix_client
+import metrics
+from helix_scheduler import scheduler, PRIORITY_DEFAULT
+
+CHAT_URL = f"{helix_client.HELIX_URL}/chat/messages"
+
+# Lower number = sent first
+PRIORITY_MODERATION = 0
+PRIORITY_REPLY = 1
+PRIORITY_ANNOUNCE = 2
+
+# Twitch chat limits: messages per 30 seconds, by what the sending account is in the channel
+WINDOW_SECONDS = 30
+LIMIT_USER = 20
+LIMIT_MODERATOR = 100  # moderator, VIP or the broadcaster
+LIMIT_VERIFIED = 7500  # verified bot
+# Twitch drops a message identical to one sent in the last 30s, so don't spend a slot on it
+DUPLICATE_SECONDS = 30
+# Messages older than this when their turn comes are dropped (announcements go stale)
+MAX_AGE_SECONDS = 60
+MAX_QUEUED = 500
+# Helix rejects longer messages
+MAX_MESSAGE_LENGTH = 500
+# Sends awaiting Twitch at once; one at a time caps out near 30 messages/s, short of LIMIT_VERIFIED
+MAX_IN_FLIGHT = 20
+
+log = logging.getLogger(__name__)
+latency = metrics.histogram("chat_send_latency_seconds", "Time from queueing a chat message to Twitch accepting it",
+                            ("priority",))
+outcomes = metrics.counter("chat_send_total", "Outbound chat messages by outcome", ("result",))
+queued_depth = metrics.gauge("chat_send_queued", "Chat messages waiting to be sent")
+
+
+def limit_for(is_moderator=False, is_verified=False):
+    if is_verified:
+        return LIMIT_VERIFIED
+    return LIMIT_MODERATOR if is_moderator else LIMIT_USER
+
+
+class SlidingWindow:
+    """At most limit events in any window_seconds; delay() says how long until the next is allowed."""
+
+    def __init__(self, limit, window_seconds=WINDOW_SECONDS):
+        self.limit = limit
+        self.window_seconds = window_seconds
+        self._sent = collections.deque()
+
+    def delay(self, now):
+        sent = self._sent
+        while sent and sent[0] <= now - self.window_seconds:
+            sent.popleft()
+        if len(sent) < self.limit:
+            return 0.0
+        return sent[0] + self.window_seconds - now
+
+    def record(self, now):
+        self._sent.append(now)
+
+
+class _Message:
+    __slots__ = ("priority", "text", "reply_to", "queued_at", "future")
+
+    def __init__(self, priority, text, reply_to, future):
+        self.priority = priority
+        self.text = text
+        self.reply_to = reply_to
+        self.queued_at = time.monotonic()
+        self.future = future
+
+
+class ChatSender:
+    """
+    Sends chat messages as sender_id in broadcaster_id's chat through Helix
+    Send Chat Message, never faster than Twitch allows.
+
+    Messages wait in a priority queue (moderation before replies before
+    announcements) and leave it through a sliding-window limiter sized for
+    the sender: LIMIT_USER, LIMIT_MODERATOR when it is a moderator or the
+    broadcaster, LIMIT_VERIFIED for a verified bot. A message identical to
+    one already queued shares its delivery instead of being queued twice,
+    and one identical to a message sent in the last duplicate_seconds is
+    dropped, as Twitch would.
+
+    Up to max_in_flight sends wait on Twitch at once, so messages leave in
+    priority order but may be accepted slightly out of it.
+
+    send() returns a future that resolves to True once Twitch accepted the
+    message, or False if it was dropped; it never has to be awaited.
+    Must be started from inside the running event loop.
+    """
+
+    def __init__(self, auth, broadcaster_id, sender_id=None, is_moderator=None, is_verified=False,
+                 duplicate_seconds=DUPLICATE_SECONDS, max_age=MAX_AGE_SECONDS, max_queued=MAX_QUEUED,
+                 max_in_flight=MAX_IN_FLIGHT):
+        self.auth = auth
+        self.broadcaster_id = broadcaster_id
+        self.sender_id = sender_id or broadcaster_id
+        if is_moderator is None:
+            is_moderator = self.sender_id == broadcaster_id
+        self.window = SlidingWindow(limit_for(is_moderator, is_verified))
+        self.duplicate_seconds = duplicate_seconds
+        self.max_age = max_age
+        self.max_queued = max_queued
+        self.max_in_flight = max_in_flight
+
+        self._heap = []
+        self._order = itertools.count()
+        self._queued = {}  # (text, reply_to) -> _Message still waiting
+        self._recent = {}  # text -> monotonic time it was sent, oldest first
+        self._wake = None
+        self._task = None
+        self._slots = None
+        self._sending = set()
+
+    def start(self):
+        self._wake = asyncio.Event()
+        self._slots = asyncio.Semaphore(self.max_in_flight)
+        self._task = asyncio.get_running_loop().create_task(self._run())
+        queued_depth.set_function(lambda: len(self._heap))
+        return self
+
+    def send(self, text, priority=PRIORITY_ANNOUNCE, reply_to=None):
+        """Queue text; reply_to is the message_id of the chat message it answers."""
+        text = text.strip()[:MAX_MESSAGE_LENGTH]
+        future = asyncio.get_running_loop().create_future()
+        if not text:
+            future.set_result(False)
+            return future
+
+        key = (text, reply_to)
+        queued = self._queued.get(key)
+        if queued is not None:
+            outcomes.inc("coalesced")
+            if priority < queued.priority:
+                # Promote the queued copy; its old heap entry is skipped when popped
+                queued.priority = priority
+                heapq.heappush(self._heap, (priority, next(self._order), queued))
+            return queued.future
+
+        if len(self._queued) >= self.max_queued:
+            outcomes.inc("queue_full")
+            future.set_result(False)
+            return future
+
+        message = _Message(priority, text, reply_to, future)
+        self._queued[key] = message
+        heapq.heappush(self._heap, (priority, next(self._order), message))
+        self._wake.set()
+        return future
+
+    async def reply(self, chat, text):
+        """commands.CommandRouter reply callback: answer chat as a threaded reply."""
+        self.send(text, PRIORITY_REPLY, reply_to=chat.message_id)
+
+    async def close(self):
+        """Stop sending; messages already on their way finish, anything still queued resolves to False."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._sending:
+            await asyncio.gather(*self._sending, return_exceptions=True)
+        for message in self._queued.values():
+            if not message.future.done():
+                message.future.set_result(False)
+        self._queued.clear()
+        self._heap.clear()
+        queued_depth.remove()
+
+    def _next(self):
+        while self._heap:
+            priority, _, message = heapq.heappop(self._heap)
+            # Skip the stale entry left behind when a message was promoted
+            if priority == message.priority and self._queued.get((message.text, message.reply_to)) is message:
+                return message
+        return None
+
+    def _is_recent_duplicate(self, text, now):
+        recent = self._recent
+        horizon = now - self.duplicate_seconds
+        while recent:
+            oldest = next(iter(recent))
+            if recent[oldest] > horizon:
+                break
+            del recent[oldest]
+        return text in recent
+
+    async def _run(self):
+        while True:
+            if not self._heap:
+                self._wake.clear()
+                await self._wake.wait()
+                continue
+            delay = self.window.delay(time.monotonic())
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+
+            message = self._next()
+            if message is None:
+                continue
+            del self._queued[(message.text, message.reply_to)]
+            now = time.monotonic()
+            if now - message.queued_at > self.max_age:
+                outcomes.inc("expired")
+                message.future.set_result(False)
+                continue
+            if self.duplicate_seconds and self._is_recent_duplicate(message.text, now):
+                outcomes.inc("duplicate")
+                message.future.set_result(False)
+                continue
+
+            self.window.record(now)
+            # Claimed before sending, so an identical message is still caught while this one is in flight
+            self._recent.pop(message.text, None)
+            self._recent[message.text] = now
+            await self._slots.acquire()
+            task = asyncio.get_running_loop().create_task(self._deliver(message, now))
+            self._sending.add(task)
+            task.add_done_callback(self._sending.discard)
+
+    async def _deliver(self, message, claimed_at):
+        try:
+            sent = await self._send(message)
+        finally:
+            self._slots.release()
+        if sent:
+            self._recent.pop(message.text, None)
+            self._recent[message.text] = time.monotonic()
+            latency.observe(time.monotonic() - message.queued_at, message.priority)
+        elif self._recent.get(message.text) == claimed_at:
+            del self._recent[message.text]
+        message.future.set_result(sent)
+
+    async def _send(self, message):
+        body = {"broadcaster_id": self.broadcaster_id, "sender_id": self.sender_id, "message": message.text}
+        if message.reply_to:
+            body["reply_parent_message_id"] = message.reply_to
+        try:
+            response = await scheduler.request(
+                "POST",
+                CHAT_URL,
+                priority=PRIORITY_DEFAULT,
+                headers=await self.auth.get_headers_async(json_body=True),
+                json=body,
+            )
+        except Exception as e:
+            outcomes.inc("error")
+            log.error("Sending chat message failed: %s", e)
+            return False
+
+        data = response.json().get("data") if response.status == 200 else None
+        if not data:
+            outcomes.inc("error")
+            log.error("Sending chat message failed (%s): %s", response.status, response.text)
+            return False
+        if not data[0].get("is_sent"):
+            outcomes.inc("rejected")
+            log.warning("Twitch dropped chat message %r: %s", message.text, data[0].get("drop_reason"))
+            return False
+        outcomes.inc("sent")
+        return True
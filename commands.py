@@ -0,0 +1,203 @@
+import time
+import asyncio
+import logging
+import metrics
+
+# Permission levels, lowest first; a command is allowed at its level and above
+EVERYONE = 0
+SUBSCRIBER = 1
+VIP = 2
+MODERATOR = 3
+BROADCASTER = 4
+
+# Highest level each badge grants; any other badge leaves the chatter at EVERYONE
+BADGE_LEVELS = {
+    "subscriber": SUBSCRIBER,
+    "founder": SUBSCRIBER,
+    "vip": VIP,
+    "moderator": MODERATOR,
+    "broadcaster": BROADCASTER,
+}
+# Cooldown tables are swept of expired entries at most this often
+SWEEP_SECONDS = 60
+
+log = logging.getLogger(__name__)
+command_totals = metrics.counter("chat_commands_total", "Chat commands by outcome", ("command", "result"))
+
+
+def permission_level(badges):
+    """Highest permission level granted by a chat message's badges."""
+    level = EVERYONE
+    for badge in badges:
+        level = max(level, BADGE_LEVELS.get(badge["set_id"], EVERYONE))
+    return level
+
+
+class Cooldowns:
+    """
+    key -> expiry table for one cooldown length.
+
+    Every entry lives for the same number of seconds, so re-inserting on use
+    keeps the dict in expiry order and sweeping only looks at the expired
+    head. Checking a key is one dict lookup.
+    """
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self._expires = {}
+        self._next_sweep = 0.0
+
+    def remaining(self, key, now):
+        expires = self._expires.get(key)
+        return expires - now if expires is not None and expires > now else 0.0
+
+    def start(self, key, now):
+        self._expires.pop(key, None)
+        self._expires[key] = now + self.seconds
+        if now >= self._next_sweep:
+            self._sweep(now)
+
+    def _sweep(self, now):
+        expired = []
+        for key, expiry in self._expires.items():
+            if expiry > now:
+                break
+            expired.append(key)
+        for key in expired:
+            del self._expires[key]
+        self._next_sweep = now + SWEEP_SECONDS
+
+    def __len__(self):
+        return len(self._expires)
+
+
+class Command:
+    __slots__ = ("name", "handler", "is_async", "aliases", "permission", "user_cooldown", "global_cooldown")
+
+    def __init__(self, name, handler, aliases=(), permission=EVERYONE, user_cooldown=0, global_cooldown=0):
+        self.name = name
+        self.handler = handler
+        self.is_async = asyncio.iscoroutinefunction(handler)
+        self.aliases = tuple(aliases)
+        self.permission = permission
+        self.user_cooldown = Cooldowns(user_cooldown) if user_cooldown else None
+        self.global_cooldown = Cooldowns(global_cooldown) if global_cooldown else None
+
+
+class CommandContext:
+    """What a command handler gets: the chat message, the name it was called by and the rest of the line."""
+
+    __slots__ = ("chat", "command", "invoked_as", "args", "level")
+
+    def __init__(self, chat, command, invoked_as, args, level):
+        self.chat = chat
+        self.command = command
+        self.invoked_as = invoked_as
+        self.args = args
+        self.level = level
+
+    @property
+    def argv(self):
+        return self.args.split()
+
+
+class CommandRouter:
+    """
+    Routes "!name args" chat messages to registered commands.
+
+    Messages that don't start with prefix are rejected on their first
+    character; commands and aliases are found with one dict lookup on the
+    lowercased first word. Badges are only turned into a permission level
+    when a command needs more than EVERYONE or has cooldowns to bypass.
+    Chatters at cooldown_exempt or above ignore cooldowns.
+
+    A handler is called with a CommandContext and may be sync or async; if
+    it returns a string and reply is set, reply(chat, text) is awaited.
+
+        router = CommandRouter()
+
+        @router.command("subs", aliases=("goal",), user_cooldown=30)
+        def subs(ctx):
+            return f"{counter.count}/{counter.goal} subs"
+
+        router.register(dispatcher)
+    """
+
+    def __init__(self, prefix="!", reply=None, cooldown_exempt=MODERATOR):
+        if len(prefix) != 1:
+            raise ValueError("prefix must be a single character")
+        self.prefix = prefix
+        self.reply = reply
+        self.cooldown_exempt = cooldown_exempt
+        self._commands = {}  # lowercased name or alias -> Command
+
+    def add(self, name, handler, aliases=(), permission=EVERYONE, user_cooldown=0, global_cooldown=0):
+        command = Command(name, handler, aliases, permission, user_cooldown, global_cooldown)
+        for key in (name,) + command.aliases:
+            key = key.lower()
+            if key in self._commands:
+                raise ValueError(f"{self.prefix}{key} is already registered")
+            self._commands[key] = command
+        return command
+
+    def command(self, name, **options):
+        def decorator(handler):
+            self.add(name, handler, **options)
+            return handler
+        return decorator
+
+    def commands(self):
+        """Registered commands, once each (aliases are not repeated)."""
+        return list({id(c): c for c in self._commands.values()}.values())
+
+    def register(self, dispatcher):
+        dispatcher.register("notification", "channel.chat.message", self.handle)
+
+    async def handle(self, notification):
+        """Dispatcher handler for channel.chat.message."""
+        chat = notification.event
+        text = chat.text
+        if not text or text[0] != self.prefix:
+            return None
+        invoked_as, _, args = text[1:].partition(" ")
+        command = self._commands.get(invoked_as.lower())
+        if command is None:
+            return None
+        return await self.run(command, chat, invoked_as, args.strip())
+
+    async def run(self, command, chat, invoked_as, args):
+        needs_level = (command.permission > EVERYONE or command.user_cooldown is not None
+                       or command.global_cooldown is not None)
+        level = permission_level(chat.badges) if needs_level else EVERYONE
+        if level < command.permission:
+            command_totals.inc(command.name, "denied")
+            return None
+
+        if level < self.cooldown_exempt:
+            now = time.monotonic()
+            user = command.user_cooldown
+            shared = command.global_cooldown
+            if ((shared is not None and shared.remaining(None, now))
+                    or (user is not None and user.remaining(chat.chatter_user_id, now))):
+                command_totals.inc(command.name, "cooldown")
+                return None
+            if shared is not None:
+                shared.start(None, now)
+            if user is not None:
+                user.start(chat.chatter_user_id, now)
+
+        ctx = CommandContext(chat, command, invoked_as, args, level)
+        try:
+            result = await command.handler(ctx) if command.is_async else command.handler(ctx)
+        except Exception:
+            command_totals.inc(command.name, "error")
+            log.exception("%s%s failed", self.prefix, command.name)
+            return None
+        command_totals.inc(command.name, "ok")
+
+        if isinstance(result, str) and result:
+            if self.reply is not None:
+                await self.reply(chat, result)
+            else:
+                log.info("%s%s -> %s", self.prefix, command.name, result)
+        return result
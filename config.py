@@ -0,0 +1,168 @@
+import os
+
+
+class ConfigError(ValueError):
+    """One or more settings are missing or malformed; the message lists all of them."""
+
+
+def _bool(raw):
+    value = raw.strip().lower()
+    if value in ("true", "1", "yes", "on"):
+        return True
+    if value in ("false", "0", "no", "off"):
+        return False
+    raise ValueError("expected True or False")
+
+
+def _str(raw):
+    return raw
+
+
+def _values(raw):
+    """ "day=1, game=Minecraft" -> {"day": 1, "game": "Minecraft"}; whole numbers become ints."""
+    values = {}
+    for item in raw.split(","):
+        if not item.strip():
+            continue
+        name, sep, value = item.partition("=")
+        name, value = name.strip(), value.strip()
+        if not sep or not name.isidentifier():
+            raise ValueError(f"expected name=value pairs, got {item.strip()!r}")
+        values[name] = int(value) if value.lstrip("-").isdigit() else value
+    return values
+
+
+# attribute: (environment variable, parser, default). None as default means "no value".
+FIELDS = {
+    "client_id": ("TWITCH_CLIENT_ID", _str, None),
+    "client_secret": ("TWITCH_CLIENT_SECRET", _str, None),
+    "broadcaster_username": ("BROADCASTER_USERNAME", _str, None),
+    "bot_username": ("BOT_USERNAME", _str, None),
+    "token_store": ("TOKEN_STORE", _str, "file"),
+    "token_store_path": ("TOKEN_STORE_PATH", _str, None),
+    "update_interval_minutes": ("UPDATE_INTERVAL_MINUTES", float, 30.0),
+    "title": ("title", _str, None),
+    "insert_after": ("insert_after", int, None),
+    "title_template": ("TITLE_TEMPLATE", _str, None),
+    "title_values": ("TITLE_VALUES", _values, {}),
+    "title0": ("Title0", _str, None),
+    "title1": ("Title1", _str, None),
+    "base_subs": ("BASE_SUBS", int, 0),
+    "max_subs": ("MAX_SUBS", int, None),
+    "linear": ("LINEAR", _bool, True),
+    "base_mult": ("BASE_MULT", float, 2.0),
+    "title_coalesce_seconds": ("TITLE_COALESCE_SECONDS", float, 2.0),
+    "counter_window_seconds": ("COUNTER_WINDOW_SECONDS", float, 5.0),
+    "counter_step": ("COUNTER_STEP", int, 1),
+    "counter_goal_step": ("COUNTER_GOAL_STEP", int, 0),
+    "bits_per_sub": ("BITS_PER_SUB", int, 500),
+    "counter_log": ("COUNTER_LOG", _str, "sub_counter.log"),
+    "counter_snapshot_every": ("COUNTER_SNAPSHOT_EVERY", int, 50),
+    "chat_bot_verified": ("CHAT_BOT_VERIFIED", _bool, False),
+    "chat_bot_moderator": ("CHAT_BOT_MODERATOR", _bool, None),
+    "overlay_dir": ("OVERLAY_DIR", _str, "overlays"),
+    "overlay_font": ("OVERLAY_FONT", _str, None),
+    "overlay_workers": ("OVERLAY_WORKERS", int, 2),
+    "overlay_obs_input": ("OVERLAY_OBS_INPUT", _str, None),
+    "chat_archive": ("CHAT_ARCHIVE", _str, None),
+    "chat_archive_path": ("CHAT_ARCHIVE_PATH", _str, None),
+    "chat_archive_batch": ("CHAT_ARCHIVE_BATCH", int, 500),
+    "chat_archive_flush_seconds": ("CHAT_ARCHIVE_FLUSH_SECONDS", float, 1.0),
+    "analytics_window_seconds": ("ANALYTICS_WINDOW_SECONDS", int, 600),
+    "channels_file": ("CHANNELS_FILE", _str, "channels.json"),
+    "log_level": ("LOG_LEVEL", _str, "INFO"),
+    "metrics_port": ("METRICS_PORT", int, 0),
+    "metrics_dump_seconds": ("METRICS_DUMP_SECONDS", float, 0.0),
+    "websocket_host": ("WEBSOCKET_HOST", _str, None),
+    "websocket_port": ("WEBSOCKET_PORT", int, None),
+    "websocket_password": ("WEBSOCKET_PASSWORD", _str, None),
+}
+
+# Settings each entry point needs before it does anything
+REQUIRED_FOR = {
+    "auth": ("client_id", "client_secret", "broadcaster_username"),
+    "auth --check": ("client_id", "client_secret"),
+    "listen": ("client_id", "client_secret", "broadcaster_username", "bot_username"),
+    "listen --counter": ("client_id", "client_secret", "broadcaster_username", "bot_username", "max_subs"),
+    "title-loop": ("client_id", "client_secret", "broadcaster_username", "max_subs", "update_interval_minutes"),
+    "multi": ("client_id", "client_secret"),
+}
+
+
+class Config:
+    """
+    Settings from .env and the environment, parsed and type-checked once.
+
+    Parsing never raises: malformed values are remembered and reported by
+    require(), so a bad OBS port can't stop `auth` from working, while
+    `title-loop` fails up front with every problem listed instead of an
+    int(None) traceback halfway through.
+    """
+
+    __slots__ = tuple(FIELDS) + ("_errors",)
+
+    def __init__(self, **values):
+        self._errors = {}
+        for name, (_, _, default) in FIELDS.items():
+            setattr(self, name, values.pop(name, default))
+        if values:
+            raise TypeError(f"Unknown settings: {', '.join(values)}")
+
+    @classmethod
+    def from_env(cls, env=None):
+        """Build a Config from env (default os.environ), without touching anything else."""
+        env = os.environ if env is None else env
+        config = cls()
+        for name, (var, parse, _) in FIELDS.items():
+            raw = env.get(var)
+            if raw is None or not raw.strip():
+                continue
+            raw = raw.strip()
+            if len(raw) >= 2 and raw[0] == raw[-1] and raw[0] in "\"'":
+                raw = raw[1:-1]
+            try:
+                setattr(config, name, parse(raw))
+            except ValueError as e:
+                config._errors[name] = f"{var}={raw!r} is invalid ({e})"
+        return config
+
+    def require(self, *names):
+        """Raise ConfigError naming every setting in names that is missing or invalid."""
+        problems = []
+        for name in names:
+            if name in self._errors:
+                problems.append(self._errors[name])
+            elif getattr(self, name) is None:
+                problems.append(f"{FIELDS[name][0]} is not set")
+        if problems:
+            raise ConfigError("Invalid configuration:\n  " + "\n  ".join(problems))
+        return self
+
+    def require_for(self, command):
+        self.require(*REQUIRED_FOR[command])
+        if command in ("title-loop", "listen --counter") and not self.title_template:
+            # A title template replaces title/insert_after
+            self.require("title", "insert_after")
+        if command == "title-loop" and not self.linear:
+            # Only the multiplying counter reads BASE_MULT
+            self.require("base_mult")
+        return self
+
+    def __repr__(self):
+        shown = {name: ("<redacted>" if name in ("client_secret", "websocket_password") and getattr(self, name)
+                        else getattr(self, name)) for name in FIELDS}
+        return f"Config({shown})"
+
+
+_config = None
+
+
+def load_config(dotenv_path=".env", reload=False):
+    """Load .env into the environment (once) and return the shared Config."""
+    global _config
+    if _config is None or reload:
+        from dotenv import load_dotenv
+        if os.path.exists(dotenv_path):
+            load_dotenv(dotenv_path)
+        _config = Config.from_env()
+    return _config
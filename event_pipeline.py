@@ -0,0 +1,173 @@
+import time
+import asyncio
+import logging
+import metrics
+
+OVERFLOW_BLOCK = "block"
+OVERFLOW_DROP_OLDEST = "drop_oldest"
+OVERFLOW_COALESCE = "coalesce"
+OVERFLOW_POLICIES = (OVERFLOW_BLOCK, OVERFLOW_DROP_OLDEST, OVERFLOW_COALESCE)
+
+DEFAULT_WORKERS = 4
+DEFAULT_MAXSIZE = 1000
+
+log = logging.getLogger(__name__)
+lag_seconds = metrics.histogram("pipeline_lag_seconds", "Time items wait in a pipeline queue", ("pipeline",))
+queue_depth = metrics.gauge("pipeline_queue_depth", "Items waiting in a pipeline queue", ("pipeline",))
+item_totals = metrics.counter("pipeline_items_total", "Pipeline items by outcome", ("pipeline", "outcome"))
+
+
+class TokenBucket:
+    """Async token bucket: acquire() returns immediately while tokens remain."""
+
+    def __init__(self, rate_per_second, burst=None):
+        self.rate = rate_per_second
+        self.capacity = burst if burst is not None else max(rate_per_second, 1)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class EventPipeline:
+    """
+    Bounded event queue drained by a pool of worker tasks.
+
+    handler(item) is awaited for each item (sync handlers are called directly).
+    rate_per_second caps throughput with a token bucket, so work runs as soon
+    as it arrives while tokens remain; None means unlimited. When the queue is
+    full, overflow decides what happens to new items:
+
+        block        put() waits for room (backpressure on the producer)
+        drop_oldest  the oldest queued item is discarded
+        coalesce     an item replaces the queued one with the same key(item);
+                     with no such item queued, put() waits for room
+
+    Must be started from inside the running event loop.
+    """
+
+    def __init__(self, handler, workers=DEFAULT_WORKERS, maxsize=DEFAULT_MAXSIZE,
+                 rate_per_second=None, burst=None, overflow=OVERFLOW_BLOCK, key=None, name="events"):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy {overflow!r}, expected one of {OVERFLOW_POLICIES}")
+        if overflow == OVERFLOW_COALESCE and key is None:
+            raise ValueError("The coalesce overflow policy needs a key function")
+        self.handler = handler
+        self.name = name
+        self.is_async = asyncio.iscoroutinefunction(handler)
+        self.workers = workers
+        self.maxsize = maxsize
+        self.overflow = overflow
+        self.key = key
+        self.limiter = TokenBucket(rate_per_second, burst) if rate_per_second else None
+
+        self._queue = None
+        self._latest = {}  # coalesce: key -> newest queued [item, enqueued_at, key] entry
+        self._tasks = []
+
+        self.processed = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.errors = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self._total_lag = 0.0
+
+    def start(self):
+        if self._tasks:
+            return
+        loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(self.maxsize)
+        self._tasks = [loop.create_task(self._worker()) for _ in range(self.workers)]
+        queue_depth.set_function(self._queue.qsize, self.name)
+
+    async def put(self, item):
+        now = time.monotonic()
+        if self.overflow == OVERFLOW_COALESCE:
+            k = self.key(item)
+            queued = self._latest.get(k)
+            if queued is not None and self._queue.full():
+                # Keep the original enqueue time so lag reflects how long the key waited
+                queued[0] = item
+                self.coalesced += 1
+                item_totals.inc(self.name, "coalesced")
+                return
+            entry = [item, now, k]
+            await self._queue.put(entry)
+            self._latest[k] = entry
+            return
+
+        if self.overflow == OVERFLOW_DROP_OLDEST and self._queue.full():
+            self._queue.get_nowait()
+            self._queue.task_done()
+            self.dropped += 1
+            item_totals.inc(self.name, "dropped")
+        await self._queue.put((item, now))
+
+    async def _worker(self):
+        while True:
+            entry = await self._queue.get()
+            try:
+                if self.overflow == OVERFLOW_COALESCE:
+                    item, enqueued_at, k = entry
+                    if self._latest.get(k) is entry:
+                        del self._latest[k]
+                else:
+                    item, enqueued_at = entry
+
+                if self.limiter is not None:
+                    await self.limiter.acquire()
+
+                lag = time.monotonic() - enqueued_at
+                self.last_lag = lag
+                self.max_lag = max(self.max_lag, lag)
+                self._total_lag += lag
+                lag_seconds.observe(lag, self.name)
+
+                if self.is_async:
+                    await self.handler(item)
+                else:
+                    self.handler(item)
+                self.processed += 1
+                item_totals.inc(self.name, "processed")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.errors += 1
+                item_totals.inc(self.name, "errors")
+                log.error("Event handler failed: %r", e)
+            finally:
+                self._queue.task_done()
+
+    async def join(self):
+        """Wait until everything queued so far has been handled."""
+        await self._queue.join()
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        queue_depth.remove(self.name)
+
+    def stats(self):
+        return {
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "processed": self.processed,
+            "dropped": self.dropped,
+            "coalesced": self.coalesced,
+            "errors": self.errors,
+            "last_lag_seconds": self.last_lag,
+            "max_lag_seconds": self.max_lag,
+            "avg_lag_seconds": self._total_lag / (self.processed + self.errors) if self.processed + self.errors else 0.0,
+        }
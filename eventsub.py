@@ -0,0 +1,204 @@
+import os
+import asyncio
+import logging
+import collections
+import websockets
+import metrics
+import eventsub_dispatch
+from eventsub_dispatch import Dispatcher, loads, peek_metadata
+
+TWITCH_WS_URL = os.getenv("TWITCH_EVENTSUB_URL", "wss://eventsub.wss.twitch.tv/ws")
+# Extra slack on top of keepalive_timeout_seconds before a socket is declared dead
+KEEPALIVE_GRACE_SECONDS = 2
+DEFAULT_KEEPALIVE_SECONDS = 10
+RECONNECT_BACKOFF_SECONDS = (1, 2, 5, 10, 30)
+# How many recent message_ids are remembered to drop duplicates across a handoff
+SEEN_MESSAGE_IDS = 1000
+
+_CLOSED = object()
+
+log = logging.getLogger(__name__)
+frames_total = metrics.counter("eventsub_frames_total", "EventSub websocket frames by message type", ("type",))
+reconnects_total = metrics.counter("eventsub_reconnects_total", "EventSub reconnects by cause", ("cause",))
+
+
+class EventSubClient:
+    """
+    EventSub websocket client.
+
+    Handles session_reconnect with the documented handoff (open the new URL,
+    wait for its welcome, then close the old socket) so no events are lost and
+    no subscriptions have to be recreated. A keepalive watchdog based on the
+    welcome's keepalive_timeout_seconds detects dead sockets and reconnects.
+
+    on_welcome(session_id) is awaited for every *new* session, which is when
+    subscriptions have to be created. Notification and revocation frames are
+    routed through dispatcher (see eventsub_dispatch.Dispatcher).
+    """
+
+    def __init__(self, on_welcome=None, dispatcher=None, url=TWITCH_WS_URL):
+        self.url = url
+        self.on_welcome = on_welcome
+        self.dispatcher = dispatcher if dispatcher is not None else Dispatcher()
+        self.session_id = None
+        self.keepalive_timeout = DEFAULT_KEEPALIVE_SECONDS
+        self.reconnects = 0
+        self._ws = None
+        self._frames = None
+        self._pumps = {}
+        self._handoff = None
+        self._seen = collections.OrderedDict()
+
+    # ----------------------------
+    # Connections
+    # ----------------------------
+    async def _open(self, url):
+        """Connect and wait for session_welcome; returns (ws, welcome_data)."""
+        ws = await websockets.connect(url)
+        try:
+            welcome = loads(await asyncio.wait_for(ws.recv(), timeout=DEFAULT_KEEPALIVE_SECONDS))
+        except BaseException:
+            await ws.close()
+            raise
+        if welcome["metadata"]["message_type"] != "session_welcome":
+            await ws.close()
+            raise ConnectionError(f"Expected session_welcome, got {welcome['metadata']['message_type']}")
+        return ws, welcome
+
+    def _adopt(self, ws, welcome):
+        """Make ws the active socket and start pumping its frames."""
+        session = welcome["payload"]["session"]
+        self._ws = ws
+        self.session_id = session["id"]
+        self.keepalive_timeout = session.get("keepalive_timeout_seconds") or DEFAULT_KEEPALIVE_SECONDS
+        self._pumps[ws] = asyncio.create_task(self._pump(ws))
+
+    async def _pump(self, ws):
+        try:
+            async for msg in ws:
+                await self._frames.put((ws, msg))
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            await self._frames.put((ws, _CLOSED))
+
+    async def _retire(self, ws):
+        pump = self._pumps.pop(ws, None)
+        if pump is not None:
+            pump.cancel()
+        await ws.close()
+
+    async def _connect_fresh(self):
+        """Open a brand-new session (subscriptions must be recreated)."""
+        attempt = 0
+        while True:
+            try:
+                ws, welcome = await self._open(self.url)
+                break
+            except (OSError, asyncio.TimeoutError, websockets.WebSocketException, ConnectionError) as e:
+                delay = RECONNECT_BACKOFF_SECONDS[min(attempt, len(RECONNECT_BACKOFF_SECONDS) - 1)]
+                log.warning("EventSub connect failed (%r), retrying in %ss", e, delay)
+                attempt += 1
+                await asyncio.sleep(delay)
+
+        old = self._ws
+        self._adopt(ws, welcome)
+        if old is not None:
+            await self._retire(old)
+        log.info("Connected with session %s", self.session_id)
+        if self.on_welcome:
+            await self.on_welcome(self.session_id)
+
+    async def _handoff_to(self, reconnect_url):
+        """Zero-gap handoff: old socket keeps delivering until the new one is welcomed."""
+        try:
+            ws, welcome = await self._open(reconnect_url)
+        except (OSError, asyncio.TimeoutError, websockets.WebSocketException, ConnectionError) as e:
+            log.warning("Reconnect handoff failed (%r), opening a new session", e)
+            reconnects_total.inc("handoff_failed")
+            await self._connect_fresh()
+            return
+        old = self._ws
+        self._adopt(ws, welcome)
+        self.reconnects += 1
+        reconnects_total.inc("session_reconnect")
+        log.info("Reconnected, session %s carried over", self.session_id)
+        if old is not None:
+            await self._retire(old)
+
+    # ----------------------------
+    # Main loop
+    # ----------------------------
+    def _is_duplicate(self, message_id):
+        if message_id in self._seen:
+            return True
+        self._seen[message_id] = None
+        if len(self._seen) > SEEN_MESSAGE_IDS:
+            self._seen.popitem(last=False)
+        return False
+
+    async def run(self):
+        self._frames = asyncio.Queue()
+        await self._connect_fresh()
+        try:
+            while True:
+                try:
+                    ws, msg = await asyncio.wait_for(
+                        self._frames.get(), timeout=self.keepalive_timeout + KEEPALIVE_GRACE_SECONDS
+                    )
+                except asyncio.TimeoutError:
+                    if self._handoff is not None and not self._handoff.done():
+                        continue
+                    log.warning("No EventSub keepalive received, reconnecting...")
+                    self.reconnects += 1
+                    reconnects_total.inc("keepalive_timeout")
+                    await self._connect_fresh()
+                    continue
+
+                if msg is _CLOSED:
+                    if ws is self._ws and (self._handoff is None or self._handoff.done()):
+                        log.warning("EventSub connection closed, reconnecting...")
+                        self.reconnects += 1
+                        reconnects_total.inc("closed")
+                        await self._connect_fresh()
+                    continue
+
+                await self._handle(msg)
+        finally:
+            for ws in list(self._pumps):
+                await self._retire(ws)
+
+    async def _handle(self, msg):
+        if eventsub_dispatch.PEEK_BEFORE_DECODE:
+            mtype, stype = peek_metadata(msg)
+            if mtype == "session_keepalive":
+                frames_total.inc(mtype)
+                return
+            if mtype == "notification" and self.dispatcher.skippable(mtype, stype):
+                # Nobody listens for this type; skip decoding the body entirely
+                frames_total.inc(mtype)
+                self.dispatcher.dropped += 1
+                return
+
+        # Counted here, once the message type is known for sure
+        data = loads(msg)
+        metadata = data["metadata"]
+        mtype = metadata["message_type"]
+        frames_total.inc(mtype)
+
+        if mtype == "notification":
+            if not self._is_duplicate(metadata["message_id"]):
+                await self.dispatcher.dispatch(data)
+
+        elif mtype == "session_keepalive":
+            return
+
+        elif mtype == "session_reconnect":
+            new_url = data["payload"]["session"]["reconnect_url"]
+            log.info("Reconnect to: %s", new_url)
+            self._handoff = asyncio.create_task(self._handoff_to(new_url))
+
+        elif mtype == "revocation":
+            subscription = data["payload"]["subscription"]
+            log.warning("Subscription %s revoked: %s", subscription["type"], subscription["status"])
+            await self.dispatcher.dispatch(data)
@@ -0,0 +1,151 @@
+import re
+import asyncio
+
+try:
+    import orjson
+
+    loads = orjson.loads
+    # orjson decodes a small frame faster than peek_metadata can scan it
+    PEEK_BEFORE_DECODE = False
+except ImportError:  # in requirements.txt, but stdlib json works the same
+    import json
+
+    loads = json.loads
+    PEEK_BEFORE_DECODE = True
+
+
+_MESSAGE_TYPE = re.compile(r'"message_type"\s*:\s*"([^"]*)"')
+_SUBSCRIPTION_TYPE = re.compile(r'"subscription_type"\s*:\s*"([^"]*)"')
+
+
+def peek_metadata(raw):
+    """
+    Return (message_type, subscription_type) by scanning only the metadata
+    object at the head of a raw frame, without decoding the JSON document.
+    Values are None when they can't be found there; a notification without
+    a subscription_type there has to be decoded to be routed.
+    """
+    if isinstance(raw, (bytes, bytearray)):
+        raw = raw.decode()
+    # Twitch sends metadata first and it only holds flat string values,
+    # so the first } closes it; anything else just falls back to a full decode
+    end = raw.find("}")
+    mtype = _MESSAGE_TYPE.search(raw, 0, end)
+    if mtype is None:
+        return None, None
+    stype = _SUBSCRIPTION_TYPE.search(raw, 0, end)
+    return mtype.group(1), stype.group(1) if stype is not None else None
+
+
+# ----------------------------
+# Event payloads
+# ----------------------------
+class Notification:
+    """One EventSub frame; event is a payload object, or the raw dict if no class is registered."""
+
+    __slots__ = ("message_id", "message_type", "subscription_type", "subscription_version",
+                 "timestamp", "subscription", "event")
+
+    def __init__(self, data, payload_cls=None):
+        metadata = data["metadata"]
+        payload = data["payload"]
+        self.message_id = metadata["message_id"]
+        self.message_type = metadata["message_type"]
+        self.subscription_type = metadata.get("subscription_type")
+        self.subscription_version = metadata.get("subscription_version")
+        self.timestamp = metadata.get("message_timestamp")
+        self.subscription = payload.get("subscription")
+        event = payload.get("event")
+        self.event = payload_cls(event) if payload_cls is not None and event is not None else event
+
+
+class ChatMessage:
+    __slots__ = ("broadcaster_user_id", "broadcaster_user_login", "broadcaster_user_name",
+                 "chatter_user_id", "chatter_user_login", "chatter_user_name",
+                 "message_id", "text", "badges", "color")
+
+    def __init__(self, event):
+        self.broadcaster_user_id = event["broadcaster_user_id"]
+        self.broadcaster_user_login = event["broadcaster_user_login"]
+        self.broadcaster_user_name = event["broadcaster_user_name"]
+        self.chatter_user_id = event["chatter_user_id"]
+        self.chatter_user_login = event["chatter_user_login"]
+        self.chatter_user_name = event["chatter_user_name"]
+        self.message_id = event["message_id"]
+        self.text = event["message"]["text"]
+        self.badges = event.get("badges") or ()
+        self.color = event.get("color")
+
+
+PAYLOAD_TYPES = {
+    "channel.chat.message": ChatMessage,
+}
+
+
+# ----------------------------
+# Dispatcher
+# ----------------------------
+class Dispatcher:
+    """
+    Routes EventSub frames to handlers registered per (message_type, subscription_type).
+
+    Frames nobody registered for are dropped after a single dict lookup; with
+    the stdlib json decoder they are rejected from their metadata alone,
+    before the JSON body is decoded.
+    """
+
+    def __init__(self):
+        self._handlers = {}  # (message_type, subscription_type) -> [(handler, is_async)]
+        self.dispatched = 0
+        self.dropped = 0
+
+    def register(self, message_type, subscription_type, handler):
+        is_async = asyncio.iscoroutinefunction(handler)
+        self._handlers.setdefault((message_type, subscription_type), []).append((handler, is_async))
+
+    def on(self, message_type, subscription_type=None):
+        """Decorator form of register()."""
+        def decorator(handler):
+            self.register(message_type, subscription_type, handler)
+            return handler
+        return decorator
+
+    def wants(self, message_type, subscription_type):
+        return (message_type, subscription_type) in self._handlers
+
+    def skippable(self, message_type, subscription_type):
+        """
+        True if a frame peeked as (message_type, subscription_type) can be
+        dropped without decoding: its route is known and nobody handles it.
+        A notification whose subscription_type isn't in the head is routed
+        after the full decode.
+        """
+        if message_type is None or (subscription_type is None and message_type == "notification"):
+            return False
+        return (message_type, subscription_type) not in self._handlers
+
+    async def dispatch(self, data):
+        """Dispatch an already-decoded frame. Returns True if a handler ran."""
+        metadata = data["metadata"]
+        key = (metadata["message_type"], metadata.get("subscription_type"))
+        handlers = self._handlers.get(key)
+        if handlers is None:
+            self.dropped += 1
+            return False
+
+        notification = Notification(data, PAYLOAD_TYPES.get(key[1]))
+        self.dispatched += 1
+        for handler, is_async in handlers:
+            if is_async:
+                await handler(notification)
+            else:
+                handler(notification)
+        return True
+
+    async def dispatch_raw(self, raw):
+        """Decode and dispatch a raw frame, dropping unwanted ones as early as possible."""
+        if PEEK_BEFORE_DECODE:
+            if self.skippable(*peek_metadata(raw)):
+                self.dropped += 1
+                return False
+        return await self.dispatch(loads(raw))
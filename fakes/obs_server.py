@@ -0,0 +1,177 @@
+"""
+Local stand-in for obs-websocket v5, for exercising OBSWebsocketsManager and
+AsyncOBSWebsocketsManager without a running OBS.
+
+    python -m fakes.obs_server --port 4455 --password TwitchChat9
+"""
+import json
+import base64
+import asyncio
+import hashlib
+import argparse
+import websockets
+
+
+class FakeOBSServer:
+    """
+    Answers requests from an in-memory scene model and records every request.
+
+    scenes maps scene name -> list of source names; scene item IDs are
+    assigned in order. Call drop_connections() to simulate OBS going away.
+    """
+
+    def __init__(self, host="127.0.0.1", port=4455, password="", scenes=None, latency=0.0):
+        self.host = host
+        self.port = port
+        self.password = password
+        self.latency = latency
+        self.requests = []  # (requestType, requestData) in arrival order
+        self.inputs = {}  # inputName -> settings
+        self.items = {}  # (scene, source) -> {"sceneItemId", "enabled", "transform"}
+        self.filters = {}  # (source, filter) -> enabled
+        self.program_scene = None
+        self._connections = set()
+        self._server = None
+        for scene, sources in (scenes or {"Main": ["Sub Counter", "Confetti"]}).items():
+            for source in sources:
+                self.add_item(scene, source, emit=False)
+
+    def add_item(self, scene, source, emit=True):
+        item_id = len(self.items) + 1
+        self.items[(scene, source)] = {"sceneItemId": item_id, "enabled": True, "transform": {}}
+        self.inputs.setdefault(source, {"text": ""})
+        if emit:
+            self.emit("SceneItemCreated", {"sceneName": scene, "sourceName": source, "sceneItemId": item_id})
+        return item_id
+
+    def emit(self, event_type, event_data):
+        message = json.dumps({"op": 5, "d": {"eventType": event_type, "eventIntent": 1, "eventData": event_data}})
+        for ws in list(self._connections):
+            asyncio.ensure_future(ws.send(message))
+
+    async def drop_connections(self):
+        for ws in list(self._connections):
+            await ws.close()
+
+    # ----------------------------
+    # Protocol
+    # ----------------------------
+    async def start(self):
+        self._server = await websockets.serve(self._handler, self.host, self.port)
+        return self
+
+    async def stop(self):
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def _handler(self, ws):
+        hello = {"obsWebSocketVersion": "5.0.0", "rpcVersion": 1}
+        if self.password:
+            hello["authentication"] = {"challenge": "fakechallenge", "salt": "fakesalt"}
+        await ws.send(json.dumps({"op": 0, "d": hello}))
+
+        identify = json.loads(await ws.recv())
+        if self.password and identify["d"].get("authentication") != self._expected_auth():
+            await ws.close(4009, "Authentication failed.")
+            return
+        await ws.send(json.dumps({"op": 2, "d": {"negotiatedRpcVersion": 1}}))
+
+        self._connections.add(ws)
+        try:
+            async for message in ws:
+                # Answer concurrently so pipelined requests really overlap
+                asyncio.ensure_future(self._answer(ws, json.loads(message)))
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            self._connections.discard(ws)
+
+    def _expected_auth(self):
+        secret = base64.b64encode(hashlib.sha256((self.password + "fakesalt").encode()).digest())
+        return base64.b64encode(hashlib.sha256(secret + b"fakechallenge").digest()).decode()
+
+    async def _answer(self, ws, message):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        d = message["d"]
+        if message["op"] == 6:
+            reply = {"op": 7, "d": dict(self._execute(d["requestType"], d.get("requestData", {})),
+                                        requestId=d["requestId"], requestType=d["requestType"])}
+        elif message["op"] == 8:
+            results = []
+            for request in d["requests"]:
+                result = dict(self._execute(request["requestType"], request.get("requestData", {})),
+                              requestType=request["requestType"])
+                results.append(result)
+                if d.get("haltOnFailure") and not result["requestStatus"]["result"]:
+                    break
+            reply = {"op": 9, "d": {"requestId": d["requestId"], "results": results}}
+        else:
+            return
+        try:
+            await ws.send(json.dumps(reply))
+        except websockets.ConnectionClosed:
+            pass
+
+    def _execute(self, request_type, data):
+        self.requests.append((request_type, data))
+        ok = {"requestStatus": {"result": True, "code": 100}}
+        not_found = {"requestStatus": {"result": False, "code": 600, "comment": "No source was found."}}
+
+        def item():
+            return next((v for (scene, _), v in self.items.items()
+                         if scene == data.get("sceneName") and v["sceneItemId"] == data.get("sceneItemId")), None)
+
+        if request_type == "GetSceneItemId":
+            found = self.items.get((data.get("sceneName"), data.get("sourceName")))
+            return dict(ok, responseData={"sceneItemId": found["sceneItemId"]}) if found else not_found
+        if request_type == "GetSceneItemList":
+            items = [{"sourceName": source, "sceneItemId": v["sceneItemId"], "sceneItemEnabled": v["enabled"]}
+                     for (scene, source), v in self.items.items() if scene == data.get("sceneName")]
+            return dict(ok, responseData={"sceneItems": items})
+        if request_type == "SetSceneItemEnabled":
+            target = item()
+            if target is None:
+                return not_found
+            target["enabled"] = data["sceneItemEnabled"]
+            return ok
+        if request_type == "GetSceneItemTransform":
+            target = item()
+            return dict(ok, responseData={"sceneItemTransform": target["transform"]}) if target else not_found
+        if request_type == "SetSceneItemTransform":
+            target = item()
+            if target is None:
+                return not_found
+            target["transform"].update(data["sceneItemTransform"])
+            return ok
+        if request_type == "GetInputSettings":
+            if data.get("inputName") not in self.inputs:
+                return not_found
+            return dict(ok, responseData={"inputSettings": self.inputs[data["inputName"]], "inputKind": "text_gdiplus_v2"})
+        if request_type == "SetInputSettings":
+            self.inputs.setdefault(data["inputName"], {}).update(data["inputSettings"])
+            return ok
+        if request_type == "SetSourceFilterEnabled":
+            self.filters[(data["sourceName"], data["filterName"])] = data["filterEnabled"]
+            return ok
+        if request_type == "SetCurrentProgramScene":
+            self.program_scene = data["sceneName"]
+            return ok
+        if request_type in ("GetInputKindList", "StopStream", "GetVersion"):
+            return dict(ok, responseData={})
+        return {"requestStatus": {"result": False, "code": 204, "comment": f"Unknown request {request_type}"}}
+
+
+async def _main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=4455)
+    parser.add_argument("--password", default="")
+    args = parser.parse_args()
+    await FakeOBSServer(args.host, args.port, args.password).start()
+    print(f"Fake OBS listening on ws://{args.host}:{args.port}")
+    await asyncio.Future()
+
+
+if __name__ == "__main__":
+    asyncio.run(_main())
@@ -0,0 +1,307 @@
+"""
+Local stand-in for the parts of Twitch this project talks to: Helix
+(/helix/users, /helix/channels, /helix/eventsub/subscriptions), the id.twitch.tv
+OAuth endpoints (/oauth2/token, /oauth2/validate, /oauth2/device) and an
+EventSub websocket (/ws).
+
+Point the app at it with:
+
+    TWITCH_API_BASE=http://127.0.0.1:8080/helix
+    TWITCH_AUTH_BASE=http://127.0.0.1:8080/oauth2
+    TWITCH_EVENTSUB_URL=ws://127.0.0.1:8080/ws
+
+    python -m fakes.twitch_server --port 8080
+"""
+import time
+import uuid
+import json
+import asyncio
+import argparse
+import collections
+from datetime import datetime, timezone
+from aiohttp import web, WSMsgType
+
+
+def _now():
+    return datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+def _frame(message_type, payload, subscription=None):
+    metadata = {"message_id": str(uuid.uuid4()), "message_type": message_type, "message_timestamp": _now()}
+    if subscription is not None:
+        metadata["subscription_type"] = subscription["type"]
+        metadata["subscription_version"] = subscription["version"]
+    return json.dumps({"metadata": metadata, "payload": payload}, separators=(",", ":"))
+
+
+class _Session:
+    def __init__(self, session_id):
+        self.id = session_id
+        self.ws = None
+        self.subscriptions = []
+        self.welcomed = asyncio.Event()
+
+
+class FakeTwitchServer:
+    """
+    In-process fake Twitch. Users are created on first lookup, every request
+    is counted per (method, path) in .calls, and Ratelimit-* headers are sent
+    on every Helix response.
+    """
+
+    def __init__(self, host="127.0.0.1", port=8080, keepalive_seconds=10, ratelimit=800, granted_scopes=()):
+        self.host = host
+        self.port = port
+        self.keepalive_seconds = keepalive_seconds
+        self.ratelimit = ratelimit
+        self.calls = collections.Counter()
+        self.granted_scopes = list(granted_scopes)  # what /oauth2/validate reports; a device flow sets it
+        self.users = {}  # login -> id
+        self.titles = {}  # broadcaster_id -> title
+        self.chat_sent = []  # bodies POSTed to /helix/chat/messages
+        self.subscriptions = {}  # id -> subscription
+        self.sessions = {}  # session_id -> _Session
+        self._bucket_remaining = ratelimit
+        self._bucket_reset = time.time() + 60
+        self._runner = None
+
+    @property
+    def base_url(self):
+        return f"http://{self.host}:{self.port}"
+
+    def env(self):
+        """Environment overrides that point the app at this server."""
+        return {
+            "TWITCH_API_BASE": f"{self.base_url}/helix",
+            "TWITCH_AUTH_BASE": f"{self.base_url}/oauth2",
+            "TWITCH_EVENTSUB_URL": f"ws://{self.host}:{self.port}/ws",
+        }
+
+    def user_id(self, login):
+        login = login.lower()
+        if login not in self.users:
+            self.users[login] = str(100000 + len(self.users))
+        return self.users[login]
+
+    # ----------------------------
+    # Lifecycle
+    # ----------------------------
+    async def start(self):
+        app = web.Application(middlewares=[self._count])
+        app.router.add_post("/oauth2/token", self.oauth_token)
+        app.router.add_get("/oauth2/validate", self.oauth_validate)
+        app.router.add_post("/oauth2/device", self.oauth_device)
+        app.router.add_get("/helix/users", self.helix_users)
+        app.router.add_get("/helix/channels", self.helix_get_channel)
+        app.router.add_patch("/helix/channels", self.helix_patch_channel)
+        app.router.add_get("/helix/eventsub/subscriptions", self.helix_list_subscriptions)
+        app.router.add_post("/helix/eventsub/subscriptions", self.helix_create_subscription)
+        app.router.add_post("/helix/chat/messages", self.helix_send_chat)
+        app.router.add_get("/ws", self.eventsub_ws)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        return self
+
+    async def stop(self):
+        for session in list(self.sessions.values()):
+            if session.ws is not None:
+                await session.ws.close()
+        await self._runner.cleanup()
+
+    @web.middleware
+    async def _count(self, request, handler):
+        self.calls[(request.method, request.path)] += 1
+        response = await handler(request)
+        if request.path.startswith("/helix"):
+            now = time.time()
+            if now >= self._bucket_reset:
+                self._bucket_remaining, self._bucket_reset = self.ratelimit, now + 60
+            self._bucket_remaining = max(self._bucket_remaining - 1, 0)
+            response.headers["Ratelimit-Limit"] = str(self.ratelimit)
+            response.headers["Ratelimit-Remaining"] = str(self._bucket_remaining)
+            response.headers["Ratelimit-Reset"] = str(int(self._bucket_reset))
+        return response
+
+    # ----------------------------
+    # OAuth
+    # ----------------------------
+    async def oauth_token(self, request):
+        form = await request.post()
+        token = {"access_token": uuid.uuid4().hex, "expires_in": 14400, "token_type": "bearer"}
+        if form.get("grant_type") != "client_credentials":
+            token["refresh_token"] = uuid.uuid4().hex
+            token["scope"] = []
+        return web.json_response(token)
+
+    async def oauth_validate(self, request):
+        if not request.headers.get("Authorization"):
+            return web.json_response({"status": 401, "message": "invalid access token"}, status=401)
+        return web.json_response({"client_id": "fake", "login": "fake", "user_id": self.user_id("fake"),
+                                  "scopes": self.granted_scopes, "expires_in": 14400})
+
+    async def oauth_device(self, request):
+        form = await request.post()
+        self.granted_scopes = form.get("scopes", "").split()
+        return web.json_response({"device_code": uuid.uuid4().hex, "user_code": "FAKECODE", "expires_in": 1800,
+                                  "interval": 1, "verification_uri": f"{self.base_url}/activate"})
+
+    # ----------------------------
+    # Helix
+    # ----------------------------
+    async def helix_users(self, request):
+        logins = request.query.getall("login", [])
+        return web.json_response({"data": [{"id": self.user_id(l), "login": l.lower(), "display_name": l} for l in logins]})
+
+    async def helix_get_channel(self, request):
+        broadcaster_id = request.query["broadcaster_id"]
+        return web.json_response({"data": [{"broadcaster_id": broadcaster_id, "title": self.titles.get(broadcaster_id, "")}]})
+
+    async def helix_patch_channel(self, request):
+        body = await request.json()
+        if len(body.get("title", "")) > 140:
+            return web.json_response({"status": 400, "message": "title too long"}, status=400)
+        self.titles[request.query["broadcaster_id"]] = body["title"]
+        return web.Response(status=204)
+
+    async def helix_list_subscriptions(self, request):
+        status = request.query.get("status")
+        data = [s for s in self.subscriptions.values() if status is None or s["status"] == status]
+        return web.json_response({"data": data, "total": len(data), "pagination": {}})
+
+    async def helix_create_subscription(self, request):
+        body = await request.json()
+        session = self.sessions.get(body["transport"].get("session_id"))
+        if session is None:
+            return web.json_response({"status": 400, "message": "websocket session not found"}, status=400)
+        for sub in session.subscriptions:
+            if sub["type"] == body["type"] and sub["condition"] == body["condition"]:
+                return web.json_response({"status": 409, "message": "subscription already exists"}, status=409)
+        sub = {
+            "id": str(uuid.uuid4()), "status": "enabled", "type": body["type"], "version": str(body["version"]),
+            "condition": body["condition"], "created_at": _now(), "cost": 0,
+            "transport": {"method": "websocket", "session_id": session.id},
+        }
+        self.subscriptions[sub["id"]] = sub
+        session.subscriptions.append(sub)
+        return web.json_response({"data": [sub], "total": len(self.subscriptions), "max_total_cost": 10}, status=202)
+
+    async def helix_send_chat(self, request):
+        body = await request.json()
+        self.chat_sent.append(body)
+        return web.json_response({"data": [{"message_id": str(uuid.uuid4()), "is_sent": bool(body.get("message"))}]})
+
+    # ----------------------------
+    # EventSub websocket
+    # ----------------------------
+    async def eventsub_ws(self, request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+
+        reconnecting = request.query.get("reconnect")
+        session = self.sessions.get(reconnecting) if reconnecting else None
+        if session is None:
+            session = _Session(uuid.uuid4().hex)
+            self.sessions[session.id] = session
+        old_ws, session.ws = session.ws, ws
+
+        await ws.send_str(_frame("session_welcome", {"session": {
+            "id": session.id, "status": "connected", "connected_at": _now(),
+            "keepalive_timeout_seconds": self.keepalive_seconds,
+            "reconnect_url": None,
+        }}))
+        session.welcomed.set()
+        if old_ws is not None:
+            # Twitch closes the old connection once the new one is welcomed
+            await old_ws.close()
+
+        keepalive = asyncio.ensure_future(self._keepalive(ws))
+        try:
+            async for msg in ws:
+                if msg.type in (WSMsgType.CLOSE, WSMsgType.ERROR):
+                    break
+        finally:
+            keepalive.cancel()
+            if session.ws is ws:
+                session.ws = None
+                for sub in session.subscriptions:
+                    sub["status"] = "websocket_disconnected"
+        return ws
+
+    async def _keepalive(self, ws):
+        while not ws.closed:
+            await asyncio.sleep(self.keepalive_seconds / 2)
+            if not ws.closed:
+                await ws.send_str(_frame("session_keepalive", {}))
+
+    def active_session(self):
+        return next((s for s in self.sessions.values() if s.ws is not None), None)
+
+    async def wait_for_subscription(self, sub_type, timeout=10):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            for session in self.sessions.values():
+                if session.ws is not None and any(s["type"] == sub_type for s in session.subscriptions):
+                    return session
+            await asyncio.sleep(0.01)
+        raise TimeoutError(f"No {sub_type} subscription was created")
+
+    async def notify(self, session, sub_type, event):
+        """Send one notification to every matching subscription on session."""
+        for sub in session.subscriptions:
+            if sub["type"] == sub_type and session.ws is not None:
+                await session.ws.send_str(_frame("notification", {"subscription": sub, "event": event}, sub))
+
+    async def emit(self, sub_type, make_event, count, rate=None):
+        """Emit count notifications, rate per second (None = as fast as possible)."""
+        interval = 1 / rate if rate else 0
+        start = time.perf_counter()
+        for i in range(count):
+            session = self.active_session()
+            if session is not None:
+                await self.notify(session, sub_type, make_event(i))
+            if interval:
+                delay = start + (i + 1) * interval - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+
+    async def send_reconnect(self, session):
+        """Ask the client to move to a new connection for the same session."""
+        url = f"ws://{self.host}:{self.port}/ws?reconnect={session.id}"
+        session.welcomed.clear()
+        await session.ws.send_str(_frame("session_reconnect", {"session": {
+            "id": session.id, "status": "reconnecting", "keepalive_timeout_seconds": None,
+            "reconnect_url": url, "connected_at": _now(),
+        }}))
+
+
+def chat_event(i, broadcaster_id="100000", text=None):
+    """A channel.chat.message event body."""
+    return {
+        "broadcaster_user_id": broadcaster_id, "broadcaster_user_login": "streamer", "broadcaster_user_name": "Streamer",
+        "chatter_user_id": str(200000 + i % 500), "chatter_user_login": f"user{i % 500}",
+        "chatter_user_name": f"User{i % 500}", "message_id": str(uuid.uuid4()), "message_type": "text",
+        "message": {"text": text or f"hello {i}", "fragments": []}, "color": "", "badges": [],
+    }
+
+
+async def _main():
+    parser = argparse.ArgumentParser(description="Local Twitch stand-in")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--keepalive", type=int, default=10)
+    parser.add_argument("--chat-rate", type=float, default=0, help="chat notifications per second to emit")
+    args = parser.parse_args()
+
+    server = await FakeTwitchServer(args.host, args.port, args.keepalive).start()
+    for key, value in server.env().items():
+        print(f"{key}={value}")
+    if args.chat_rate:
+        session = await server.wait_for_subscription("channel.chat.message", timeout=3600)
+        print(f"Emitting {args.chat_rate} chat messages/s to session {session.id}")
+        await server.emit("channel.chat.message", chat_event, count=10 ** 9, rate=args.chat_rate)
+    await asyncio.Future()
+
+
+if __name__ == "__main__":
+    asyncio.run(_main())
@@ -0,0 +1,174 @@
+import os
+import time
+import json
+import logging
+import metrics
+
+# requests, aiohttp and asyncio are imported on first use: together they take
+# longer to import than a token check takes to run
+
+# Overridable so everything can run against a local stand-in (see fakes/twitch_server.py)
+HELIX_URL = os.getenv("TWITCH_API_BASE", "https://api.twitch.tv/helix")
+OAUTH_URL = os.getenv("TWITCH_AUTH_BASE", "https://id.twitch.tv/oauth2")
+
+TIMEOUT_SECONDS = 10
+MAX_RETRIES = 3
+BACKOFF_SECONDS = 0.5
+RETRY_STATUSES = (500, 502, 503, 504)
+# Only these are retried unless the caller opts in: a replayed POST could send a chat message
+# or redeem an OAuth code twice. Helix PATCHes set absolute values, so repeating one is harmless.
+RETRY_METHODS = frozenset({"GET", "HEAD", "OPTIONS", "PUT", "DELETE", "PATCH"})
+POOL_SIZE = 20
+# Headers that must never reach stdout or logs
+SENSITIVE_HEADERS = {"authorization", "client-secret"}
+
+_session = None
+_async_session = None
+_async_loop = None
+
+log = logging.getLogger(__name__)
+request_seconds = metrics.histogram(
+    "helix_request_seconds", "Twitch HTTP request latency", ("method", "endpoint", "status")
+)
+
+
+def endpoint_label(url):
+    """Short, low-cardinality name for url: "/channels", "/oauth2/token", ..."""
+    if url.startswith(HELIX_URL):
+        return url[len(HELIX_URL):].split("?", 1)[0]
+    if url.startswith(OAUTH_URL):
+        return "/oauth2" + url[len(OAUTH_URL):].split("?", 1)[0]
+    return "other"
+
+
+def redact_headers(headers):
+    """Return a copy of headers that is safe to print."""
+    if not headers:
+        return {}
+    return {k: ("<redacted>" if k.lower() in SENSITIVE_HEADERS else v) for k, v in headers.items()}
+
+
+# ----------------------------
+# Sync client (requests)
+# ----------------------------
+def get_session():
+    """Return the shared keep-alive requests.Session, creating it on first use."""
+    global _session
+    if _session is None:
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+
+        retry = Retry(
+            total=MAX_RETRIES,
+            backoff_factor=BACKOFF_SECONDS,
+            status_forcelist=RETRY_STATUSES,
+            allowed_methods=RETRY_METHODS,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE, max_retries=retry)
+        _session = requests.Session()
+        _session.mount("https://", adapter)
+        _session.mount("http://", adapter)
+    return _session
+
+
+def request(method, url, timeout=TIMEOUT_SECONDS, **kwargs):
+    start = time.perf_counter()
+    status = "error"
+    try:
+        response = get_session().request(method, url, timeout=timeout, **kwargs)
+        status = response.status_code
+        return response
+    finally:
+        request_seconds.observe(time.perf_counter() - start, method, endpoint_label(url), status)
+
+
+def get(url, **kwargs):
+    return request("GET", url, **kwargs)
+
+
+def post(url, **kwargs):
+    return request("POST", url, **kwargs)
+
+
+def patch(url, **kwargs):
+    return request("PATCH", url, **kwargs)
+
+
+def close():
+    global _session
+    if _session is not None:
+        _session.close()
+        _session = None
+
+
+# ----------------------------
+# Async client (aiohttp)
+# ----------------------------
+class HelixResponse:
+    """Fully-read aiohttp response, so callers don't have to manage its context."""
+
+    __slots__ = ("status", "headers", "text")
+
+    def __init__(self, status, headers, text):
+        self.status = status
+        self.headers = headers
+        self.text = text
+
+    def json(self):
+        return json.loads(self.text)
+
+
+async def get_async_session():
+    """Return the shared aiohttp.ClientSession for the running loop."""
+    import asyncio
+    import aiohttp
+
+    global _async_session, _async_loop
+    loop = asyncio.get_running_loop()
+    if _async_session is None or _async_session.closed or _async_loop is not loop:
+        _async_loop = loop
+        _async_session = aiohttp.ClientSession(
+            timeout=aiohttp.ClientTimeout(total=TIMEOUT_SECONDS),
+            connector=aiohttp.TCPConnector(limit=POOL_SIZE, keepalive_timeout=60),
+        )
+    return _async_session
+
+
+async def request_async(method, url, retry=None, **kwargs):
+    """
+    Send a request over the shared session, retrying transient failures with
+    backoff. retry defaults to whether method is in RETRY_METHODS; pass
+    retry=True for a POST that is safe to repeat.
+    """
+    import asyncio
+    import aiohttp
+
+    session = await get_async_session()
+    endpoint = endpoint_label(url)
+    if retry is None:
+        retry = method.upper() in RETRY_METHODS
+    max_retries = MAX_RETRIES if retry else 0
+    for attempt in range(max_retries + 1):
+        start = time.perf_counter()
+        try:
+            async with session.request(method, url, **kwargs) as resp:
+                text = await resp.text()
+                request_seconds.observe(time.perf_counter() - start, method, endpoint, resp.status)
+                if resp.status not in RETRY_STATUSES or attempt == max_retries:
+                    return HelixResponse(resp.status, resp.headers, text)
+                log.warning("%s %s returned %s, retrying...", method, endpoint, resp.status)
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+            request_seconds.observe(time.perf_counter() - start, method, endpoint, "error")
+            if attempt == max_retries:
+                raise
+            log.warning("%s %s failed (%r), retrying...", method, endpoint, e)
+        await asyncio.sleep(BACKOFF_SECONDS * (2 ** attempt))
+
+
+async def close_async():
+    global _async_session
+    if _async_session is not None:
+        await _async_session.close()
+        _async_session = None
@@ -0,0 +1,186 @@
+import time
+import asyncio
+import hashlib
+import logging
+import itertools
+import helix_client
+import metrics
+
+# Lower number = dispatched first
+PRIORITY_TITLE = 0
+PRIORITY_DEFAULT = 1
+PRIORITY_BULK = 2
+
+# Helix default bucket for user tokens until real Ratelimit-* headers arrive
+DEFAULT_BUCKET_LIMIT = 800
+DEFAULT_BUCKET_WINDOW_SECONDS = 60
+MAX_REQUEUES = 5
+# Concurrent requests in flight; enough to send a full subscription set in one round trip
+WORKERS = 16
+
+log = logging.getLogger(__name__)
+queue_depth = metrics.gauge("helix_scheduler_queue_depth", "Helix requests waiting for a worker")
+queue_wait = metrics.histogram("helix_scheduler_wait_seconds", "Time Helix requests wait before being sent", ("priority",))
+requeued = metrics.counter("helix_scheduler_requeued_total", "Requests requeued after a 429")
+
+
+class RateBucket:
+    """Token bucket for one auth context, kept in sync with Twitch's Ratelimit-* headers."""
+
+    def __init__(self, limit=DEFAULT_BUCKET_LIMIT):
+        self.limit = limit
+        self.remaining = limit
+        self.reset_at = 0.0
+
+    def reserve(self):
+        """Take a point and return how many seconds to wait before using it."""
+        now = time.time()
+        if now >= self.reset_at and self.remaining <= 0:
+            # Bucket has refilled since the last response we saw
+            self.remaining = self.limit
+            self.reset_at = now + DEFAULT_BUCKET_WINDOW_SECONDS
+        if self.remaining > 0:
+            self.remaining -= 1
+            return 0.0
+        return max(self.reset_at - now, 0.0)
+
+    def update(self, headers):
+        try:
+            self.limit = int(headers["Ratelimit-Limit"])
+            self.remaining = int(headers["Ratelimit-Remaining"])
+            self.reset_at = float(headers["Ratelimit-Reset"])
+        except (KeyError, TypeError, ValueError):
+            pass
+
+
+class _Job:
+    __slots__ = ("priority", "seq", "method", "url", "kwargs", "bucket_key", "future", "submitted_at", "requeues")
+
+    def __init__(self, priority, seq, method, url, kwargs, bucket_key, future):
+        self.priority = priority
+        self.seq = seq  # submission order, kept across requeues so a job doesn't lose its place
+        self.method = method
+        self.url = url
+        self.kwargs = kwargs
+        self.bucket_key = bucket_key
+        self.future = future
+        self.submitted_at = time.monotonic()
+        self.requeues = 0
+
+
+class HelixScheduler:
+    """
+    Async Helix request scheduler.
+
+    Requests are queued by priority (title writes ahead of bulk subscription
+    backfills), paced per auth context by a token bucket fed from the
+    Ratelimit-* response headers, and 429s are requeued at the reset time
+    instead of being dropped.
+    """
+
+    def __init__(self, workers=WORKERS):
+        self.workers = workers
+        self._queue = None
+        self._tasks = []
+        self._loop = None
+        self._seq = itertools.count()
+        self._buckets = {}
+        self._in_flight = 0
+        self._dispatched = 0
+        self._requeued = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+
+    def _ensure_started(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is loop:
+            return
+        # Queues and tasks belong to the loop that created them
+        self._loop = loop
+        self._queue = asyncio.PriorityQueue()
+        self._tasks = [loop.create_task(self._worker()) for _ in range(self.workers)]
+        queue_depth.set_function(self._queue.qsize)
+
+    @staticmethod
+    def bucket_key(headers):
+        """Identify the auth context (token) a request is billed against."""
+        token = (headers or {}).get("Authorization", "")
+        return hashlib.sha1(token.encode()).hexdigest()[:12]
+
+    async def request(self, method, url, priority=PRIORITY_DEFAULT, **kwargs):
+        """Queue a request and wait for its helix_client.HelixResponse."""
+        self._ensure_started()
+        future = self._loop.create_future()
+        job = _Job(priority, next(self._seq), method, url, kwargs, self.bucket_key(kwargs.get("headers")), future)
+        self._queue.put_nowait((priority, job.seq, job))
+        return await future
+
+    def _requeue(self, job):
+        self._queue.put_nowait((job.priority, job.seq, job))
+
+    async def _worker(self):
+        while True:
+            _, _, job = await self._queue.get()
+            if job.future.done():
+                continue
+            bucket = self._buckets.setdefault(job.bucket_key, RateBucket())
+            delay = bucket.reserve()
+            if delay > 0:
+                # Don't sit on the job while the bucket refills: it goes back in the queue at the
+                # reset, competes by priority again and reserves again when a worker takes it
+                self._loop.call_later(delay, self._requeue, job)
+                continue
+
+            waited = time.monotonic() - job.submitted_at
+            self._dispatched += 1
+            self._total_wait += waited
+            self._max_wait = max(self._max_wait, waited)
+            queue_wait.observe(waited, job.priority)
+
+            self._in_flight += 1
+            try:
+                resp = await helix_client.request_async(job.method, job.url, **job.kwargs)
+            except Exception as e:
+                if not job.future.done():
+                    job.future.set_exception(e)
+                continue
+            finally:
+                self._in_flight -= 1
+
+            bucket.update(resp.headers)
+            if resp.status == 429 and job.requeues < MAX_REQUEUES:
+                job.requeues += 1
+                self._requeued += 1
+                requeued.inc()
+                bucket.remaining = 0
+                retry_in = max(bucket.reset_at - time.time(), 1.0)
+                log.warning("Rate limited on %s %s, retrying in %.1fs",
+                            job.method, helix_client.endpoint_label(job.url), retry_in)
+                self._loop.call_later(retry_in, self._requeue, job)
+                continue
+
+            if not job.future.done():
+                job.future.set_result(resp)
+
+    def stats(self):
+        return {
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "in_flight": self._in_flight,
+            "dispatched": self._dispatched,
+            "requeued_429": self._requeued,
+            "avg_wait_seconds": self._total_wait / self._dispatched if self._dispatched else 0.0,
+            "max_wait_seconds": self._max_wait,
+            "buckets": {
+                key: {"limit": b.limit, "remaining": b.remaining, "reset_at": b.reset_at}
+                for key, b in self._buckets.items()
+            },
+        }
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+        self._loop = None
+
+
+scheduler = HelixScheduler()
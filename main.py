@@ -1,41 +1,303 @@
-import os
-from dotenv import load_dotenv
-import asyncio
-from twitch_functions import *
-from twitch_auth import TwitchAuth
-from scopes import SCOPES
-#from chat import main_chat
+"""
+Command line entry point.
 
-load_dotenv()
+    python main.py auth [--check] [--method device|local] [--counter] [--chat]
+    python main.py listen [--rate 1] [--workers 4] [--counter] [--archive sqlite|jsonl] [--commands] [--chat] [--overlay]
+                          [--analytics]
+    python main.py title-loop
+    python main.py multi [--channels channels.json]
 
-# Variables
-BASE_SUBS = int(os.getenv("BASE_SUBS"))
-BOT_USERNAME = (os.getenv("BOT_USERNAME"))
-BROADCASTER_USERNAME = (os.getenv("BROADCASTER_USERNAME"))
-#For messages event sub
-TWITCH_WS_URL = "wss://eventsub.wss.twitch.tv/ws"
-TWITCH_API_URL = "https://api.twitch.tv/helix/eventsub/subscriptions"
+Nothing here touches the network or imports the HTTP/websocket stacks until
+a subcommand that needs them runs, so --help and `auth --check` are instant.
+"""
+import sys
+import argparse
+from config import load_config, ConfigError
 
-BROADCASTER_ID = get_channel_id(BROADCASTER_USERNAME)
-auth = TwitchAuth(scopes=SCOPES, broadcaster_id=BROADCASTER_ID)
 
-def main():
-    #print(auth.get_headers())
-    auth.get_valid_token(validate=True)
-    #update_title_loop(auth)
-    #asyncio.run(main_chat())
-    #asyncio.run(twitch_listener(auth))
+def _resolve_auth(config, subscriptions=False, send_chat=False, background=True):
+    from scopes import scopes_for
+    from twitch_auth import TwitchAuth
+    from twitch_functions import get_channel_id
 
+    broadcaster_id = get_channel_id(config.broadcaster_username)
+    return TwitchAuth(scopes=scopes_for(subscriptions, send_chat), broadcaster_id=broadcaster_id, background=background)
 
-#async def main(auth):
-    #consumer_task = asyncio.create_task(process_messages(rate_per_second=1))
-    #listener_task = asyncio.create_task(twitch_listener(auth))
-    
-    #await asyncio.gather(listener_task, consumer_task)
 
-# Run with your auth object
-# asyncio.run(main(auth))
+def cmd_auth(args, config):
+    if args.check:
+        return check_tokens(config)
+    # No background validation: it would start its own device flow for a token missing scopes, next to ours
+    auth = _resolve_auth(config, subscriptions=args.counter, send_chat=args.chat, background=False)
+    auth.get_valid_token(method=args.method)
+    result = auth.validate_token()
+    if not result["valid"] or result["missing_scopes"]:
+        print(f"Stored token is {'missing scopes ' + ', '.join(result['missing_scopes']) if result['valid'] else 'invalid'}; "
+              "authorizing again.")
+        auth.reauthenticate(args.method)
+    auth.close()
+    return 0
+
+
+def check_tokens(config):
+    """Report every stored token from disk only; exit status 1 if any needs attention."""
+    from scopes import SCOPES
+    from twitch_auth import TwitchAuth
+
+    if config.token_store == "sqlite":
+        from token_store import SqliteTokenStore
+        store_path = config.token_store_path or "tokens.db"
+        tokens = [(f"{store_path} [{key}]", key) for key in SqliteTokenStore.keys(store_path)]
+    else:
+        import os
+        import glob
+        paths = sorted(glob.glob(os.path.join(config.token_store_path or "", "twitch_token-*.json")))
+        tokens = [(path, os.path.basename(path)[len("twitch_token-"):-len(".json")]) for path in paths]
+    if not tokens:
+        print("No stored tokens found; run `python main.py auth` first.")
+        return 1
+    ok = True
+    for path, broadcaster_id in tokens:
+        status = TwitchAuth(scopes=SCOPES, broadcaster_id=broadcaster_id).token_status()
+        if not status["present"]:
+            print(f"{path}: no access token")
+            ok = False
+            continue
+        expires_in = status["expires_in_seconds"]
+        state = f"expires in {expires_in // 60} min" if expires_in > 0 else "expired"
+        if expires_in <= 0 and status["refreshable"]:
+            state += " (will refresh on next use)"
+        elif expires_in <= 0:
+            ok = False
+        if status["missing_scopes"]:
+            state += f", missing scopes: {', '.join(status['missing_scopes'])}"
+            ok = False
+        print(f"{path}: {state}")
+    return 0 if ok else 1
+
+
+def cmd_listen(args, config):
+    import asyncio
+    from twitch_functions import twitch_listener, process_messages
+
+    # Sub events need channel:read:subscriptions and sending chat user:write:chat; only ask for what is used
+    auth = _resolve_auth(config, subscriptions=args.counter or args.analytics, send_chat=args.chat)
+
+    async def run():
+        pipeline = await process_messages(rate_per_second=args.rate, workers=args.workers, overflow=args.overflow)
+        sender = None
+        if args.chat:
+            from chat_sender import ChatSender
+            sender = ChatSender(auth, auth.broadcaster_id, is_moderator=config.chat_bot_moderator,
+                                is_verified=config.chat_bot_verified).start()
+        overlay = _build_overlay(config) if args.overlay else None
+        counter = writer = None
+        if args.counter:
+            counter, writer = await _start_counter(auth, config, sender, overlay)
+        archive = None
+        if args.archive or config.chat_archive:
+            from chat_archive import ChatArchive
+            archive = ChatArchive.from_config(config, args.archive).start()
+        analytics = None
+        if args.analytics:
+            from analytics import StreamAnalytics
+            analytics = StreamAnalytics.from_config(config, counter=counter).start()
+        commands = _build_commands(counter, sender, analytics) if args.commands else None
+        try:
+            await twitch_listener(auth, pipeline, counter, archive, commands, analytics)
+        finally:
+            # twitch_listener has published the counter's last change; write it out before exiting
+            if writer is not None:
+                await writer.close_async()
+            if sender is not None:
+                await sender.close()
+            if overlay is not None:
+                await overlay.close()
+                if overlay.obs is not None:
+                    await overlay.obs.disconnect()
+
+    asyncio.run(run())
+    return 0
+
+
+def _build_overlay(config):
+    """Goal bar image in OVERLAY_DIR, switched in the OVERLAY_OBS_INPUT image source when that is set."""
+    from overlay import OverlayRenderer, PUSH_FILE, PUSH_SETTINGS
+
+    obs = None
+    if config.overlay_obs_input:
+        from obs_async import AsyncOBSWebsocketsManager
+        obs = AsyncOBSWebsocketsManager()
+    renderer = OverlayRenderer(config.overlay_dir, config.overlay_workers, font=config.overlay_font, obs=obs,
+                               push=PUSH_SETTINGS if obs is not None else PUSH_FILE)
+    renderer.add("goal_bar", "goal_bar", input_name=config.overlay_obs_input)
+    return renderer
+
+
+async def _start_counter(auth, config, sender=None, overlay=None):
+    """
+    SubCounter whose changes are written to the title through a TitleWriter,
+    drawn on the goal bar overlay and, when reached, goals announced in chat.
+    Returns the counter and the writer, which the caller closes last.
+    """
+    import logging
+    from sub_counter import SubCounter
+    from title_writer import TitleWriter
+    from title_template import TitleTemplateError
+    from twitch_functions import get_title_template
+
+    writer = TitleWriter(auth, auth.broadcaster_id)
+    template = get_title_template()
+
+    async def on_change(count, goal):
+        # With COUNTER_GOAL_STEP the goal moves past MAX_SUBS, so clamp to the goal being shown
+        goal = goal or config.max_subs
+        if overlay is not None:
+            overlay.update("goal_bar", count=count, goal=goal)
+        try:
+            title = template.render(subs=min(count, goal), goal=goal)
+        except TitleTemplateError as e:
+            # The template was only length-checked at MAX_SUBS; keep the current title
+            logging.getLogger(__name__).error("Not updating the title: %s", e)
+            return
+        await writer.set_title_async(title)
+
+    def on_goal(goal):
+        if sender is not None:
+            sender.send(f"Sub goal reached: {goal} subs!")
+
+    counter = SubCounter.from_config(config, on_change=on_change, on_goal=on_goal)
+    await writer.sync_async()
+    await counter.publish()
+    return counter, writer
+
+
+def _build_commands(counter=None, sender=None, analytics=None):
+    """The built-in chat commands: !commands, plus !subs with the live counter and !stats with analytics."""
+    from commands import CommandRouter
+
+    router = CommandRouter(reply=sender.reply if sender is not None else None)
+
+    @router.command("commands", aliases=("help",), global_cooldown=10)
+    def list_commands(ctx):
+        return " ".join(router.prefix + c.name for c in router.commands())
+
+    if counter is not None:
+        @router.command("subs", aliases=("goal",), user_cooldown=30, global_cooldown=5)
+        def subs(ctx):
+            return f"{counter.count}/{counter.goal} subs" if counter.goal else f"{counter.count} subs"
+
+    if analytics is not None:
+        @router.command("stats", user_cooldown=60, global_cooldown=10)
+        def stats(ctx):
+            snapshot = analytics.snapshot
+            minutes = snapshot.window_seconds // 60
+            text = (f"Last {minutes} min: {snapshot.messages_per_minute:.0f} msgs/min from "
+                    f"{snapshot.unique_chatters} chatters, {snapshot.subs_per_minute:.1f} subs/min")
+            if snapshot.top_chatters:
+                text += f", top chatter {snapshot.top_chatters[0][0]}"
+            if snapshot.eta_seconds:
+                text += f", goal in ~{snapshot.eta_seconds / 60:.0f} min"
+            return text
+
+    return router
+
+
+def cmd_title_loop(args, config):
+    from twitch_functions import update_title_loop
+
+    update_title_loop(_resolve_auth(config))
+    return 0
+
+
+def cmd_multi(args, config):
+    import asyncio
+    from multi_channel import run_multi_channel
+
+    try:
+        asyncio.run(run_multi_channel(args.channels))
+    except ConfigError as e:
+        print(e, file=sys.stderr)
+        return 2
+    return 0
+
+
+COMMANDS = {
+    "auth": cmd_auth,
+    "listen": cmd_listen,
+    "title-loop": cmd_title_loop,
+    "multi": cmd_multi,
+}
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="main.py", description="Twitch title updater and EventSub listener")
+    parser.add_argument("--log-level", help="DEBUG, INFO, WARNING or ERROR (default: LOG_LEVEL or INFO)")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    auth = sub.add_parser("auth", help="authorize the broadcaster account and save its token")
+    auth.add_argument("--check", action="store_true", help="only report stored tokens, no network")
+    auth.add_argument("--method", choices=("device", "local"), default="device")
+    auth.add_argument("--counter", action="store_true",
+                      help="also allow reading subs, for listen --counter and --analytics")
+    auth.add_argument("--chat", action="store_true", help="also allow sending chat, for listen --chat")
+
+    listen = sub.add_parser("listen", help="listen to EventSub chat messages")
+    listen.add_argument("--rate", type=float, default=1, help="messages handled per second, -1 for unlimited")
+    listen.add_argument("--workers", type=int, default=4)
+    listen.add_argument("--overflow", choices=("block", "drop_oldest", "coalesce"), default="block")
+    listen.add_argument("--counter", action="store_true",
+                        help="count subs, gifts, resubs and cheers live and keep the title in sync")
+    listen.add_argument("--archive", choices=("sqlite", "jsonl"),
+                        help="save chat to CHAT_ARCHIVE_PATH (default: CHAT_ARCHIVE, off if unset)")
+    listen.add_argument("--commands", action="store_true", help="answer the built-in !commands in chat")
+    listen.add_argument("--chat", action="store_true",
+                        help="send command replies and sub goal announcements to chat as the broadcaster")
+    listen.add_argument("--overlay", action="store_true",
+                        help="draw the --counter goal bar as an image for OBS (see OVERLAY_* in .envexample)")
+    listen.add_argument("--analytics", action="store_true",
+                        help="keep live chat and sub stats (!stats with --commands)")
+
+    sub.add_parser("title-loop", help="update the title with the sub counter on a timer")
+
+    multi = sub.add_parser("multi", help="serve every channel in channels.json from one process")
+    multi.add_argument("--channels", help="channels file (default: CHANNELS_FILE or channels.json)")
+    return parser
+
+
+def _requirements(args):
+    if args.command == "auth" and args.check:
+        return "auth --check"
+    if args.command == "listen" and args.counter:
+        return "listen --counter"
+    return args.command
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    config = load_config()
+
+    import logging
+
+    logging.basicConfig(
+        level=(args.log_level or config.log_level).upper(),
+        format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+    )
+    try:
+        config.require_for(_requirements(args))
+    except ConfigError as e:
+        print(e, file=sys.stderr)
+        return 2
+
+    if config.metrics_port or config.metrics_dump_seconds:
+        import metrics
+        metrics.start(config.metrics_port, config.metrics_dump_seconds)
+
+    try:
+        return COMMANDS[args.command](args, config)
+    except KeyboardInterrupt:
+        return 130
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
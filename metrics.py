@@ -0,0 +1,245 @@
+import time
+import bisect
+import logging
+import threading
+
+log = logging.getLogger(__name__)
+
+# Seconds; covers a local OBS round trip up to a slow Helix call
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _label_str(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values)) + "}"
+
+
+class Counter:
+    """Monotonic counter, one value per label tuple: counter.inc("200", "GET")."""
+
+    kind = "counter"
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels):
+        return self._values.get(labels, 0)
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, self.labels, key, value) for key, value in self._values.items()]
+
+
+class Histogram:
+    """Cumulative-bucket histogram; observe() is a bisect and three additions."""
+
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}  # labels -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 2)
+            series[i] += 1
+            series[-1] += value
+
+    def time(self, *labels):
+        """Context manager observing the elapsed time of its block."""
+        return _Timer(self, labels)
+
+    def summary(self, *labels):
+        """{"count", "sum", "avg"} for one label tuple."""
+        series = self._series.get(labels)
+        if series is None:
+            return {"count": 0, "sum": 0.0, "avg": 0.0}
+        count = sum(series[:-1])
+        return {"count": count, "sum": series[-1], "avg": series[-1] / count if count else 0.0}
+
+    def samples(self):
+        out = []
+        with self._lock:
+            series = {key: list(values) for key, values in self._series.items()}
+        labels = self.labels + ("le",)
+        for key, values in series.items():
+            cumulative = 0
+            for bound, n in zip(self.buckets + ("+Inf",), values[:-1]):
+                cumulative += n
+                out.append((self.name + "_bucket", labels, key + (bound,), cumulative))
+            out.append((self.name + "_count", self.labels, key, cumulative))
+            out.append((self.name + "_sum", self.labels, key, values[-1]))
+        return out
+
+
+class Gauge:
+    """Value read from a callback at scrape time, so nothing is paid per event."""
+
+    kind = "gauge"
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._callbacks = {}
+        self._lock = threading.Lock()
+
+    def set_function(self, fn, *labels):
+        with self._lock:
+            self._callbacks[labels] = fn
+
+    def remove(self, *labels):
+        with self._lock:
+            self._callbacks.pop(labels, None)
+
+    def samples(self):
+        with self._lock:
+            callbacks = list(self._callbacks.items())
+        out = []
+        for key, fn in callbacks:
+            try:
+                out.append((self.name, self.labels, key, fn()))
+            except Exception:
+                log.debug("Gauge %s%s failed", self.name, key, exc_info=True)
+        return out
+
+
+class _Timer:
+    __slots__ = ("histogram", "labels", "start")
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.histogram.observe(time.perf_counter() - self.start, *self.labels)
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name, help, labels, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help, labels, **kwargs)
+            return metric
+
+    def counter(self, name, help, labels=()):
+        return self._get(Counter, name, help, labels)
+
+    def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        return self._get(Histogram, name, help, labels, buckets=buckets)
+
+    def gauge(self, name, help, labels=()):
+        return self._get(Gauge, name, help, labels)
+
+    def render(self):
+        """Everything in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, label_names, label_values, value in metric.samples():
+                lines.append(f"{name}{_label_str(label_names, label_values)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self):
+        """Plain dict of every series, for logging or JSON."""
+        out = {}
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            if isinstance(metric, Histogram):
+                series = {",".join(map(str, key)): metric.summary(*key) for key in list(metric._series)}
+            else:
+                series = {",".join(map(str, key)): value for _, _, key, value in metric.samples()}
+            if series:
+                out[metric.name] = series
+        return out
+
+
+REGISTRY = Registry()
+counter = REGISTRY.counter
+histogram = REGISTRY.histogram
+gauge = REGISTRY.gauge
+render = REGISTRY.render
+snapshot = REGISTRY.snapshot
+
+
+# ----------------------------
+# Exposure
+# ----------------------------
+def serve(port, host="127.0.0.1"):
+    """Serve /metrics from a daemon thread; returns the server (call .shutdown() to stop)."""
+    # Imported here so modules that only record metrics don't pay for http.server
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_response(404)
+                self.end_headers()
+                return
+            body = render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            log.debug("metrics scrape: " + format, *args)
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    log.info("Serving metrics on http://%s:%d/metrics", host, server.server_address[1])
+    return server
+
+
+def start_dump(interval, logger=log):
+    """Log snapshot() every interval seconds from a daemon thread; returns an Event that stops it."""
+    stop = threading.Event()
+
+    def run():
+        while not stop.wait(interval):
+            logger.info("stats %s", snapshot())
+
+    threading.Thread(target=run, name="metrics-dump", daemon=True).start()
+    return stop
+
+
+def start(port=0, dump_seconds=0):
+    """Serve /metrics on port and/or log a snapshot every dump_seconds; 0 turns either off."""
+    if port:
+        serve(port)
+    if dump_seconds:
+        start_dump(dump_seconds)
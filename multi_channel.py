@@ -0,0 +1,193 @@
+import json
+import asyncio
+import logging
+from scopes import SCOPES
+from config import load_config, ConfigError
+from twitch_auth import TwitchAuth
+from user_resolver import UserResolver
+from title_template import TitleTemplate, TitleTemplateError
+from title_writer import TitleWriter
+from eventsub import EventSubClient, TWITCH_WS_URL
+from eventsub_dispatch import Dispatcher
+from subscriptions import SUBSCRIPTIONS, bootstrap_subscriptions
+
+# Twitch limits per websocket connection and per user token
+MAX_SUBSCRIPTIONS_PER_SOCKET = 300
+MAX_SOCKETS_PER_TOKEN = 3
+
+log = logging.getLogger(__name__)
+
+
+class ChannelContext:
+    """Everything that belongs to one broadcaster: token file, title template and counter state."""
+
+    def __init__(self, login, broadcaster_id, settings, specs):
+        self.login = login
+        self.broadcaster_id = broadcaster_id
+        defaults = load_config()
+        self.base_subs = int(settings.get("base_subs", defaults.base_subs))
+        max_subs = settings.get("max_subs", defaults.max_subs)
+        if max_subs is None:
+            raise ConfigError(f"{login}: set max_subs in the channels file or MAX_SUBS in .env")
+        self.max_subs = int(max_subs)
+        self.linear = str(settings.get("linear", defaults.linear)).lower() == "true"
+        self.base_mult = float(settings.get("base_mult", defaults.base_mult))
+        self.update_interval_minutes = float(settings.get("update_interval_minutes", defaults.update_interval_minutes))
+        try:
+            self.template = TitleTemplate(
+                settings["title_template"], defaults={**settings.get("title_values", {}), "goal": self.max_subs},
+                max_values={"subs": self.max_subs},
+            )
+        except TitleTemplateError as e:
+            raise ConfigError(f"{login}: {e}") from None
+        missing = self.template.missing("subs")
+        if missing:
+            raise ConfigError(f"{login}: title_template uses {', '.join('{%s}' % f for f in missing)} "
+                              f"but title_values doesn't set it")
+        # Created once the settings are known to be good, so a bad channel doesn't leave timers behind
+        self.auth = TwitchAuth(scopes=SCOPES, broadcaster_id=broadcaster_id)
+        self.writer = TitleWriter(self.auth, broadcaster_id)
+        self.subs = self.base_subs
+        # Per-channel copies, so a rejected subscription only disables it here
+        self.specs = [spec.copy() for spec in specs]
+
+    def advance(self):
+        if self.linear:
+            self.subs += self.base_subs
+        else:
+            self.subs = int(self.subs * self.base_mult)
+        self.subs = min(self.subs, self.max_subs)
+
+    async def title_loop(self):
+        await self.writer.sync_async()
+        while True:
+            await self.writer.set_title_async(self.template.render(subs=self.subs))
+            if self.subs >= self.max_subs:
+                await self.writer.close_async()
+                return
+            await asyncio.sleep(self.update_interval_minutes * 60)
+            self.advance()
+
+
+class _Assignment:
+    __slots__ = ("auth", "ids", "specs")
+
+    def __init__(self, auth, ids, specs):
+        self.auth = auth
+        self.ids = ids
+        self.specs = specs
+
+
+class _SocketSlot:
+    """One EventSub websocket and the subscriptions packed onto it."""
+
+    def __init__(self, dispatcher, url):
+        self.assignments = []
+        self.cost = 0
+        self.client = EventSubClient(on_welcome=self.on_welcome, dispatcher=dispatcher, url=url)
+        self.task = None
+
+    async def on_welcome(self, session_id):
+        if not self.assignments:
+            return
+        await asyncio.gather(*(
+            bootstrap_subscriptions(a.auth, session_id, a.ids, a.specs) for a in self.assignments
+        ))
+
+
+class SocketPool:
+    """
+    Packs subscriptions onto as few EventSub websockets as possible.
+
+    Subscriptions on one websocket must be created with the same user token,
+    so sockets are grouped by token owner; a new socket is opened only when
+    MAX_SUBSCRIPTIONS_PER_SOCKET is reached.
+    """
+
+    def __init__(self, dispatcher, url=TWITCH_WS_URL):
+        self.dispatcher = dispatcher
+        self.url = url
+        self._slots = {}  # token file -> [_SocketSlot]
+
+    def add(self, auth, ids, specs):
+        specs = [spec for spec in specs if spec.enabled]
+        if not specs:
+            return
+        slots = self._slots.setdefault(auth.token_file, [])
+        slot = next((s for s in slots if s.cost + len(specs) <= MAX_SUBSCRIPTIONS_PER_SOCKET), None)
+        if slot is None:
+            if len(slots) >= MAX_SOCKETS_PER_TOKEN:
+                raise RuntimeError(f"Too many subscriptions for {auth.token_file}: Twitch allows "
+                                   f"{MAX_SOCKETS_PER_TOKEN} sockets of {MAX_SUBSCRIPTIONS_PER_SOCKET} subscriptions")
+            slot = _SocketSlot(self.dispatcher, self.url)
+            slots.append(slot)
+        slot.assignments.append(_Assignment(auth, ids, specs))
+        slot.cost += len(specs)
+
+    def sockets(self):
+        return [slot for slots in self._slots.values() for slot in slots]
+
+    async def run(self):
+        for slot in self.sockets():
+            slot.task = asyncio.create_task(slot.client.run())
+        await asyncio.gather(*(slot.task for slot in self.sockets()))
+
+
+def load_channels_config(path=None):
+    """
+    Read the multi-channel config:
+
+        {"bot": "bot_login",
+         "channels": [{"broadcaster": "login", "title_template": "... {subs} ...", "max_subs": 100}, ...]}
+
+    Extra placeholders in a title_template, like {day}, take their values
+    from the channel's "title_values": {"day": 1}. Missing per-channel
+    settings fall back to the single-channel env vars.
+    """
+    path = path or load_config().channels_file
+    with open(path, "r") as f:
+        config = json.load(f)
+    if not config.get("channels"):
+        raise ConfigError(f"{path} has no channels")
+    for number, channel in enumerate(config["channels"], 1):
+        missing = [key for key in ("broadcaster", "title_template") if key not in channel]
+        if missing:
+            name = channel.get("broadcaster", f"channel {number}")
+            raise ConfigError(f"{path}: {name} needs {' and '.join(repr(key) for key in missing)}")
+    return config
+
+
+async def run_multi_channel(path=None, resolver=None):
+    """Serve every configured channel from one event loop, HTTP pool and socket pool."""
+    config = load_channels_config(path)
+    resolver = resolver or UserResolver()
+    bot_login = config.get("bot") or load_config().bot_username
+    logins = [c["broadcaster"] for c in config["channels"]]
+    # One Helix call resolves every broadcaster and the bot
+    ids = await asyncio.to_thread(resolver.resolve, logins + [bot_login])
+    bot_id = ids[bot_login.lower()]
+
+    channels = {}
+    for settings in config["channels"]:
+        login = settings["broadcaster"].lower()
+        channels[ids[login]] = ChannelContext(login, ids[login], settings, SUBSCRIPTIONS)
+    bot_auth = next((c.auth for c in channels.values() if c.broadcaster_id == bot_id), None) \
+        or TwitchAuth(scopes=SCOPES, broadcaster_id=bot_id)
+
+    dispatcher = Dispatcher()
+
+    @dispatcher.on("notification", "channel.chat.message")
+    def on_chat_message(notification):
+        chat = notification.event
+        channel = channels.get(chat.broadcaster_user_id)
+        if channel is not None:
+            log.info("[Chat: %s] %s: %s", chat.broadcaster_user_name, chat.chatter_user_name, chat.text)
+
+    pool = SocketPool(dispatcher)
+    for channel in channels.values():
+        channel_ids = {"broadcaster_id": channel.broadcaster_id, "bot_id": bot_id}
+        pool.add(bot_auth, channel_ids, [s for s in channel.specs if s.owner == "bot"])
+        pool.add(channel.auth, channel_ids, [s for s in channel.specs if s.owner != "bot"])
+
+    log.info("Serving %d channels over %d EventSub socket(s)", len(channels), len(pool.sockets()))
+    await asyncio.gather(pool.run(), *(channel.title_loop() for channel in channels.values()))
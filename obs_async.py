@@ -0,0 +1,296 @@
+import json
+import base64
+import hashlib
+import asyncio
+import logging
+import itertools
+import websockets
+from config import load_config
+from obs_websockets import TRANSFORM_KEYS, BATCH_SERIAL_REALTIME, obs_request_seconds, obs_reconnects
+
+REQUEST_TIMEOUT_SECONDS = 10
+RECONNECT_BACKOFF_SECONDS = (1, 2, 5, 10, 30)
+# Events after which cached sceneItemIds may be wrong
+ITEM_ID_EVENTS = {"SceneItemCreated", "SceneItemRemoved", "SceneNameChanged", "InputNameChanged"}
+
+log = logging.getLogger(__name__)
+
+
+class OBSRequestError(Exception):
+    def __init__(self, request_type, status):
+        self.request_type = request_type
+        self.status = status
+        super().__init__(f"{request_type} failed ({status.get('code')}): {status.get('comment', '')}")
+
+
+class AsyncOBSWebsocketsManager:
+    """
+    Asyncio counterpart of OBSWebsocketsManager, speaking obs-websocket v5 directly.
+
+    Connects lazily on first use, keeps many requests in flight over one
+    socket (matched by requestId) and reconnects with backoff. While OBS is
+    unreachable, setters don't raise: their latest value per target is kept
+    and sent once the connection is back, so the listener never stalls on OBS.
+    """
+
+    def __init__(self, host=None, port=None, password=None):
+        config = load_config()
+        host = host or config.websocket_host
+        port = port or config.websocket_port
+        password = password if password is not None else config.websocket_password
+        self.url = f"ws://{host}:{port}"
+        self.password = password or ""
+        self._ws = None
+        self._reader = None
+        self._connecting = None
+        self._pending = {}  # requestId -> Future
+        self._ids = itertools.count(1)
+        self._item_ids = {}  # (scene_name, source_name) -> sceneItemId
+        self._buffered = {}  # coalesce key -> (requestType, requestData, (scene, source) or None)
+        self._retrying = None
+        self.connected = asyncio.Event()
+        self.closed = False
+
+    # ----------------------------
+    # Connection
+    # ----------------------------
+    def _auth_string(self, salt, challenge):
+        secret = base64.b64encode(hashlib.sha256((self.password + salt).encode()).digest())
+        return base64.b64encode(hashlib.sha256(secret + challenge.encode()).digest()).decode()
+
+    async def _open(self):
+        ws = await websockets.connect(self.url)
+        try:
+            hello = json.loads(await asyncio.wait_for(ws.recv(), REQUEST_TIMEOUT_SECONDS))
+            identify = {"rpcVersion": 1, "eventSubscriptions": 1023}
+            auth = hello["d"].get("authentication")
+            if auth:
+                identify["authentication"] = self._auth_string(auth["salt"], auth["challenge"])
+            await ws.send(json.dumps({"op": 1, "d": identify}))
+            identified = json.loads(await asyncio.wait_for(ws.recv(), REQUEST_TIMEOUT_SECONDS))
+            if identified.get("op") != 2:
+                raise ConnectionError(f"OBS did not identify us: {identified}")
+        except BaseException:
+            await ws.close()
+            raise
+        return ws
+
+    async def connect(self):
+        """Connect (once) and wait until requests can be sent."""
+        if self.connected.is_set():
+            return
+        if self._connecting is None or self._connecting.done():
+            self._connecting = asyncio.create_task(self._connect_loop())
+        await asyncio.shield(self._connecting)
+
+    async def _connect_loop(self):
+        attempt = 0
+        while not self.closed:
+            try:
+                self._ws = await self._open()
+                break
+            except (OSError, asyncio.TimeoutError, websockets.WebSocketException, ConnectionError) as e:
+                delay = RECONNECT_BACKOFF_SECONDS[min(attempt, len(RECONNECT_BACKOFF_SECONDS) - 1)]
+                log.warning("OBS connection failed (%r), retrying in %ss", e, delay)
+                attempt += 1
+                await asyncio.sleep(delay)
+        else:
+            return
+
+        self._item_ids.clear()
+        self._reader = asyncio.create_task(self._read(self._ws))
+        self.connected.set()
+        log.info("Connected to OBS Websockets!")
+        await self._flush_buffered()
+
+    async def _flush_buffered(self):
+        buffered, self._buffered = self._buffered, {}
+        if not buffered:
+            return
+        requests = []
+        try:
+            for request_type, request_data, item_ref in buffered.values():
+                if item_ref is not None:
+                    # Scene item IDs can change while disconnected, so resolve them now
+                    request_data = dict(request_data, sceneItemId=await self.get_scene_item_id(*item_ref))
+                requests.append((request_type, request_data))
+            await self.call_batch(requests)
+        except (ConnectionError, asyncio.TimeoutError) as e:
+            log.warning("Could not replay buffered OBS changes, keeping them for the next try: %r", e)
+            # Values set meanwhile are newer and win
+            for key, entry in buffered.items():
+                self._buffered.setdefault(key, entry)
+        except OBSRequestError as e:
+            log.error("Could not replay buffered OBS changes: %r", e)
+
+    async def _retry_buffered(self):
+        """Replay changes buffered after a timeout while the connection stayed up, with backoff."""
+        for delay in RECONNECT_BACKOFF_SECONDS:
+            await asyncio.sleep(delay)
+            if not self.connected.is_set() or not self._buffered:
+                # Gone, or replayed by a reconnect meanwhile
+                return
+            await self._flush_buffered()
+        if self._buffered:
+            log.error("OBS is connected but not answering; %d change(s) wait for the next reconnect", len(self._buffered))
+
+    async def _read(self, ws):
+        try:
+            async for message in ws:
+                data = json.loads(message)
+                op = data["op"]
+                if op in (7, 9):
+                    future = self._pending.pop(data["d"]["requestId"], None)
+                    if future is not None and not future.done():
+                        future.set_result(data["d"])
+                elif op == 5 and data["d"]["eventType"] in ITEM_ID_EVENTS:
+                    self._item_ids.clear()
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            self.connected.clear()
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("OBS connection lost"))
+            self._pending.clear()
+            if not self.closed:
+                obs_reconnects.inc()
+                log.warning("Lost connection to OBS, reconnecting...")
+                self._connecting = asyncio.create_task(self._connect_loop())
+
+    async def disconnect(self):
+        self.closed = True
+        if self._connecting is not None:
+            self._connecting.cancel()
+        if self._retrying is not None:
+            self._retrying.cancel()
+        if self._ws is not None:
+            await self._ws.close()
+        if self._reader is not None:
+            await asyncio.gather(self._reader, return_exceptions=True)
+
+    # ----------------------------
+    # Requests
+    # ----------------------------
+    async def _send(self, op, d):
+        await self.connect()
+        request_id = str(next(self._ids))
+        d["requestId"] = request_id
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        try:
+            await self._ws.send(json.dumps({"op": op, "d": d}))
+            return await asyncio.wait_for(future, REQUEST_TIMEOUT_SECONDS)
+        except websockets.ConnectionClosed:
+            raise ConnectionError("OBS connection lost") from None
+        finally:
+            self._pending.pop(request_id, None)
+
+    async def call(self, request_type, request_data=None):
+        """Send one request and return its responseData, raising OBSRequestError on failure."""
+        with obs_request_seconds.time(request_type):
+            response = await self._send(6, {"requestType": request_type, "requestData": request_data or {}})
+        status = response["requestStatus"]
+        if not status["result"]:
+            raise OBSRequestError(request_type, status)
+        return response.get("responseData", {})
+
+    async def call_batch(self, requests, halt_on_failure=False, execution_type=BATCH_SERIAL_REALTIME):
+        """Send [(requestType, requestData), ...] as one RequestBatch; returns OBS's per-request results."""
+        with obs_request_seconds.time("RequestBatch"):
+            response = await self._send(8, {
+                "haltOnFailure": halt_on_failure,
+                "executionType": execution_type,
+                "requests": [{"requestType": t, "requestData": d} for t, d in requests],
+            })
+        return response["results"]
+
+    async def _write(self, key, request_type, request_data, item_ref=None):
+        """
+        Setter path: send now, or keep only the newest value for key while OBS
+        is away, returning None at once instead of waiting for a reconnect.
+        item_ref=(scene, source) adds that item's sceneItemId.
+        """
+        if self.connected.is_set():
+            try:
+                if item_ref is not None:
+                    request_data = dict(request_data, sceneItemId=await self.get_scene_item_id(*item_ref))
+                result = await self.call(request_type, request_data)
+            except (ConnectionError, asyncio.TimeoutError):
+                pass
+            else:
+                # An older value buffered after a timeout must not be replayed over this one
+                self._buffered.pop(key, None)
+                return result
+        # Not connected, or OBS stopped answering: buffer without waiting, the next connect replays it
+        self._buffered[key] = (request_type, request_data, item_ref)
+        if not self.connected.is_set():
+            if self._connecting is None or self._connecting.done():
+                self._connecting = asyncio.create_task(self._connect_loop())
+        elif self._retrying is None or self._retrying.done():
+            # Still connected, so no reconnect will replay it; retry on this connection
+            self._retrying = asyncio.create_task(self._retry_buffered())
+        return None
+
+    # ----------------------------
+    # Same surface as OBSWebsocketsManager
+    # ----------------------------
+    async def get_scene_item_id(self, scene_name, source_name):
+        key = (scene_name, source_name)
+        item_id = self._item_ids.get(key)
+        if item_id is None:
+            data = await self.call("GetSceneItemId", {"sceneName": scene_name, "sourceName": source_name})
+            item_id = self._item_ids[key] = data["sceneItemId"]
+        return item_id
+
+    async def set_scene(self, new_scene):
+        return await self._write(("scene",), "SetCurrentProgramScene", {"sceneName": new_scene})
+
+    async def set_filter_visibility(self, source_name, filter_name, filter_enabled=True):
+        return await self._write(("filter", source_name, filter_name), "SetSourceFilterEnabled",
+                                 {"sourceName": source_name, "filterName": filter_name, "filterEnabled": filter_enabled})
+
+    async def set_source_visibility(self, scene_name, source_name, source_visible=True):
+        return await self._write(("visible", scene_name, source_name), "SetSceneItemEnabled",
+                                 {"sceneName": scene_name, "sceneItemEnabled": source_visible},
+                                 item_ref=(scene_name, source_name))
+
+    async def get_text(self, source_name):
+        data = await self.call("GetInputSettings", {"inputName": source_name})
+        return data["inputSettings"]["text"]
+
+    async def set_text(self, source_name, new_text):
+        return await self._write(("text", source_name), "SetInputSettings",
+                                 {"inputName": source_name, "inputSettings": {"text": new_text}})
+
+    async def get_source_transform(self, scene_name, source_name):
+        item_id = await self.get_scene_item_id(scene_name, source_name)
+        data = await self.call("GetSceneItemTransform", {"sceneName": scene_name, "sceneItemId": item_id})
+        item_transform = data["sceneItemTransform"]
+        return {key: item_transform[key] for key in TRANSFORM_KEYS}
+
+    async def set_source_transform(self, scene_name, source_name, new_transform):
+        return await self._write(("transform", scene_name, source_name), "SetSceneItemTransform",
+                                 {"sceneName": scene_name, "sceneItemTransform": new_transform},
+                                 item_ref=(scene_name, source_name))
+
+    async def get_input_settings(self, input_name):
+        return await self.call("GetInputSettings", {"inputName": input_name})
+
+    async def set_input_settings(self, input_name, input_settings):
+        """Merge input_settings into the input's settings, e.g. {"file": path} for an image source."""
+        return await self._write(("settings", input_name), "SetInputSettings",
+                                 {"inputName": input_name, "inputSettings": input_settings})
+
+    async def get_input_kind_list(self):
+        return await self.call("GetInputKindList")
+
+    async def get_scene_items(self, scene_name):
+        data = await self.call("GetSceneItemList", {"sceneName": scene_name})
+        for item in data.get("sceneItems", []):
+            self._item_ids[(scene_name, item["sourceName"])] = item["sceneItemId"]
+        return data
+
+    # Immediately ends the stream. Use with caution.
+    async def stop_stream(self):
+        return await self.call("StopStream")
@@ -1,26 +1,189 @@
 import time
-import os
-from obswebsocket import obsws, requests
-from dotenv import load_dotenv
+import json
+import logging
+import threading
+import metrics
+from obswebsocket import obsws, requests, events, exceptions
+from config import load_config
 
-load_dotenv()
+# Keys copied out of GetSceneItemTransform by get_source_transform
+TRANSFORM_KEYS = (
+    "positionX", "positionY", "scaleX", "scaleY", "rotation",
+    "sourceWidth", "sourceHeight",  # original size of the source
+    "width", "height",  # size after scaling, not including cropping. Negative if the source is flipped
+    "cropLeft", "cropRight", "cropTop", "cropBottom",  # cropped off the *original* size, multiply by scaleX/scaleY for current pixels
+)
+
+# RequestBatch executionType values (obs-websocket v5)
+BATCH_SERIAL_REALTIME = 0
+BATCH_SERIAL_FRAME = 1  # one request per rendered frame, so changes land on consecutive frames
+BATCH_PARALLEL = 2
+
+log = logging.getLogger(__name__)
+obs_request_seconds = metrics.histogram("obs_request_seconds", "OBS websocket request latency", ("request",))
+obs_reconnects = metrics.counter("obs_reconnects_total", "Reconnects to OBS after a dropped connection")
+
+# obsws' receive thread only understands single request responses (op 7),
+# so RequestBatchResponse frames (op 9) are picked off the socket before it sees them
+class _BatchResponseSocket:
+    def __init__(self, ws, client):
+        self._ws = ws
+        self._client = client
+
+    def recv(self):
+        message = self._ws.recv()
+        if message and '"op":9' in message.replace(" ", ""):
+            result = json.loads(message)
+            if result.get("op") == 9:
+                request_id = result["d"]["requestId"]
+                if request_id in self._client.events:
+                    self._client.answers[request_id] = result["d"]
+                    self._client.events[request_id].set()
+                return ""  # the receive thread skips empty messages
+        return message
+
+    def __getattr__(self, name):
+        return getattr(self._ws, name)
+
+
+class BatchingObsws(obsws):
+    """obsws with support for RequestBatch (several requests in one round trip)."""
+
+    def _auth(self):
+        super()._auth()
+        self.ws = _BatchResponseSocket(self.ws, self)
+
+    def call(self, obj):
+        with obs_request_seconds.time(obj.name):
+            return super().call(obj)
+
+    def call_batch(self, request_objs, halt_on_failure=False, execution_type=BATCH_SERIAL_REALTIME):
+        """Send request_objs as one RequestBatch and fill each one in with its result."""
+        with obs_request_seconds.time("RequestBatch"):
+            return self._call_batch(request_objs, halt_on_failure, execution_type)
+
+    def _call_batch(self, request_objs, halt_on_failure, execution_type):
+        message_id = str(self.id)
+        self.id += 1
+        event = threading.Event()
+        self.events[message_id] = event
+
+        payload = {
+            "op": 8,
+            "d": {
+                "requestId": message_id,
+                "haltOnFailure": halt_on_failure,
+                "executionType": execution_type,
+                "requests": [{"requestType": obj.name, "requestData": obj.data()} for obj in request_objs],
+            }
+        }
+        self.ws.send(json.dumps(payload))
+
+        event.wait(self.timeout)
+        self.events.pop(message_id)
+
+        if message_id not in self.answers:
+            raise exceptions.MessageTimeout("No answer for batch {}".format(message_id))
+        results = self.answers.pop(message_id)["results"]
+        # With haltOnFailure OBS stops early, so there can be fewer results than requests
+        for obj, result in zip(request_objs, results):
+            obj.input(result.get("responseData", {}), result["requestStatus"]["result"])
+        return request_objs
+
+
+class OBSBatch:
+    """
+    Collects overlay changes and sends them to OBS as one RequestBatch.
+
+        with obswebsockets_manager.batch() as batch:
+            batch.set_text("Sub Counter", "42 subs")
+            batch.set_source_visibility("Main", "Confetti", True)
+            batch.set_filter_visibility("Webcam", "Glow", True)
+
+    send() (called automatically when the with block ends) returns the request
+    objects in order; check .status and .datain on each for its result.
+    """
+
+    def __init__(self, manager, halt_on_failure=False, execution_type=BATCH_SERIAL_REALTIME):
+        self.manager = manager
+        self.halt_on_failure = halt_on_failure
+        self.execution_type = execution_type
+        self.requests = []
+        self.results = None
+
+    def set_scene(self, new_scene):
+        self.requests.append(requests.SetCurrentProgramScene(sceneName=new_scene))
+
+    def set_filter_visibility(self, source_name, filter_name, filter_enabled=True):
+        self.requests.append(requests.SetSourceFilterEnabled(sourceName=source_name, filterName=filter_name, filterEnabled=filter_enabled))
+
+    def set_source_visibility(self, scene_name, source_name, source_visible=True):
+        myItemID = self.manager.get_scene_item_id(scene_name, source_name)
+        self.requests.append(requests.SetSceneItemEnabled(sceneName=scene_name, sceneItemId=myItemID, sceneItemEnabled=source_visible))
+
+    def set_text(self, source_name, new_text):
+        self.requests.append(requests.SetInputSettings(inputName=source_name, inputSettings = {'text': new_text}))
+
+    def set_source_transform(self, scene_name, source_name, new_transform):
+        myItemID = self.manager.get_scene_item_id(scene_name, source_name)
+        self.requests.append(requests.SetSceneItemTransform(sceneName=scene_name, sceneItemId=myItemID, sceneItemTransform=new_transform))
+
+    def send(self):
+        if self.results is None:
+            self.results = self.manager.ws.call_batch(self.requests, self.halt_on_failure, self.execution_type) if self.requests else []
+        return self.results
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.send()
 
-WEBSOCKET_HOST = (os.getenv("WEBSOCKET_HOST"))
-WEBSOCKET_PORT = (os.getenv("WEBSOCKET_PORT"))
-WEBSOCKET_PASSWORD = (os.getenv("WEBSOCKET_PASSWORD"))
 
 class OBSWebsocketsManager:
     ws = None
     
     def __init__(self):
+        # (scene_name, source_name) -> sceneItemId, cleared when OBS reports scene/source changes
+        self._item_ids = {}
+        self._item_ids_lock = threading.Lock()
+
         # Connect to websockets
-        self.ws = obsws(WEBSOCKET_HOST, WEBSOCKET_PORT, WEBSOCKET_PASSWORD)
+        config = load_config()
+        self.ws = BatchingObsws(config.websocket_host, config.websocket_port, config.websocket_password)
         self.ws.connect()
-        print("Connected to OBS Websockets!\n")
+        for event in (events.SceneItemCreated, events.SceneItemRemoved, events.SceneNameChanged, events.InputNameChanged):
+            self.ws.register(self._invalidate_item_ids, event)
+        log.info("Connected to OBS Websockets!")
+
+    # Scene item IDs only change when items are added/removed or scenes/inputs are renamed
+    def _invalidate_item_ids(self, event=None):
+        with self._item_ids_lock:
+            self._item_ids.clear()
+
+    # Fill the ID cache for a whole scene with one GetSceneItemList request
+    def cache_scene_items(self, scene_name):
+        self.get_scene_items(scene_name)
+
+    # Returns the sceneItemId of a source, only asking OBS the first time
+    def get_scene_item_id(self, scene_name, source_name):
+        key = (scene_name, source_name)
+        item_id = self._item_ids.get(key)
+        if item_id is None:
+            response = self.ws.call(requests.GetSceneItemId(sceneName=scene_name, sourceName=source_name))
+            item_id = response.datain['sceneItemId']
+            with self._item_ids_lock:
+                self._item_ids[key] = item_id
+        return item_id
 
     def disconnect(self):
         self.ws.disconnect()
 
+    # Start a batch of changes that are sent to OBS in one round trip, see OBSBatch
+    def batch(self, halt_on_failure=False, execution_type=BATCH_SERIAL_REALTIME):
+        return OBSBatch(self, halt_on_failure, execution_type)
+
     # Set the current scene
     def set_scene(self, new_scene):
         self.ws.call(requests.SetCurrentProgramScene(sceneName=new_scene))
@@ -31,8 +194,7 @@ class OBSWebsocketsManager:
 
     # Set the visibility of any source
     def set_source_visibility(self, scene_name, source_name, source_visible=True):
-        response = self.ws.call(requests.GetSceneItemId(sceneName=scene_name, sourceName=source_name))
-        myItemID = response.datain['sceneItemId']
+        myItemID = self.get_scene_item_id(scene_name, source_name)
         self.ws.call(requests.SetSceneItemEnabled(sceneName=scene_name, sceneItemId=myItemID, sceneItemEnabled=source_visible))
 
     # Returns the current text of a text source
@@ -45,24 +207,10 @@ class OBSWebsocketsManager:
         self.ws.call(requests.SetInputSettings(inputName=source_name, inputSettings = {'text': new_text}))
 
     def get_source_transform(self, scene_name, source_name):
-        response = self.ws.call(requests.GetSceneItemId(sceneName=scene_name, sourceName=source_name))
-        myItemID = response.datain['sceneItemId']
+        myItemID = self.get_scene_item_id(scene_name, source_name)
         response = self.ws.call(requests.GetSceneItemTransform(sceneName=scene_name, sceneItemId=myItemID))
-        transform = {}
-        transform["positionX"] = response.datain["sceneItemTransform"]["positionX"]
-        transform["positionY"] = response.datain["sceneItemTransform"]["positionY"]
-        transform["scaleX"] = response.datain["sceneItemTransform"]["scaleX"]
-        transform["scaleY"] = response.datain["sceneItemTransform"]["scaleY"]
-        transform["rotation"] = response.datain["sceneItemTransform"]["rotation"]
-        transform["sourceWidth"] = response.datain["sceneItemTransform"]["sourceWidth"] # original width of the source
-        transform["sourceHeight"] = response.datain["sceneItemTransform"]["sourceHeight"] # original width of the source
-        transform["width"] = response.datain["sceneItemTransform"]["width"] # current width of the source after scaling, not including cropping. If the source has been flipped horizontally, this number will be negative.
-        transform["height"] = response.datain["sceneItemTransform"]["height"] # current height of the source after scaling, not including cropping. If the source has been flipped vertically, this number will be negative.
-        transform["cropLeft"] = response.datain["sceneItemTransform"]["cropLeft"] # the amount cropped off the *original source width*. This is NOT scaled, must multiply by scaleX to get current # of cropped pixels
-        transform["cropRight"] = response.datain["sceneItemTransform"]["cropRight"] # the amount cropped off the *original source width*. This is NOT scaled, must multiply by scaleX to get current # of cropped pixels
-        transform["cropTop"] = response.datain["sceneItemTransform"]["cropTop"] # the amount cropped off the *original source height*. This is NOT scaled, must multiply by scaleY to get current # of cropped pixels
-        transform["cropBottom"] = response.datain["sceneItemTransform"]["cropBottom"] # the amount cropped off the *original source height*. This is NOT scaled, must multiply by scaleY to get current # of cropped pixels
-        return transform
+        item_transform = response.datain["sceneItemTransform"]
+        return {key: item_transform[key] for key in TRANSFORM_KEYS}
 
     # The transform should be a dictionary containing any of the following keys with corresponding values
     # positionX, positionY, scaleX, scaleY, rotation, width, height, sourceWidth, sourceHeight, cropTop, cropBottom, cropLeft, cropRight
@@ -70,8 +218,7 @@ class OBSWebsocketsManager:
     # Note: there are other transform settings, like alignment, etc, but these feel like the main useful ones.
     # Use get_source_transform to see the full list
     def set_source_transform(self, scene_name, source_name, new_transform):
-        response = self.ws.call(requests.GetSceneItemId(sceneName=scene_name, sourceName=source_name))
-        myItemID = response.datain['sceneItemId']
+        myItemID = self.get_scene_item_id(scene_name, source_name)
         self.ws.call(requests.SetSceneItemTransform(sceneName=scene_name, sceneItemId=myItemID, sceneItemTransform=new_transform))
 
     # Note: an input, like a text box, is a type of source. This will get *input-specific settings*, not the broader source settings like transform and scale
@@ -83,9 +230,13 @@ class OBSWebsocketsManager:
     def get_input_kind_list(self):
         return self.ws.call(requests.GetInputKindList())
 
-    # Get list of all items in a certain scene
+    # Get list of all items in a certain scene (also refreshes the scene item ID cache)
     def get_scene_items(self, scene_name):
-        return self.ws.call(requests.GetSceneItemList(sceneName=scene_name))
+        response = self.ws.call(requests.GetSceneItemList(sceneName=scene_name))
+        with self._item_ids_lock:
+            for item in response.datain.get("sceneItems", []):
+                self._item_ids[(scene_name, item["sourceName"])] = item["sceneItemId"]
+        return response
     
     # Immediately ends the stream. Use with caution.
     def stop_stream(self):
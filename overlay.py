@@ -0,0 +1,248 @@
+import os
+import time
+import asyncio
+import hashlib
+import logging
+import metrics
+
+DEFAULT_WORKERS = 2
+OVERLAY_DIR = "overlays"
+# Files are written as PNG; OBS image sources re-read a file about once a second when its mtime changes
+IMAGE_FORMAT = "PNG"
+
+PUSH_FILE = "file"
+PUSH_SETTINGS = "settings"
+
+log = logging.getLogger(__name__)
+render_seconds = metrics.histogram("overlay_render_seconds", "Time to render and write one overlay frame", ("kind",))
+frame_totals = metrics.counter("overlay_frames_total", "Overlay frames by outcome", ("kind", "result"))
+
+
+# ----------------------------
+# Worker side: runs in the pool processes, caches live for the process
+# ----------------------------
+_fonts = {}
+_backgrounds = {}
+
+
+def _font(path, size):
+    """ImageFont per (path, size); Pillow keeps rendered glyphs on the font object, so they are reused too."""
+    key = (path, size)
+    font = _fonts.get(key)
+    if font is None:
+        from PIL import ImageFont
+        font = ImageFont.truetype(path, size) if path else ImageFont.load_default(size)
+        _fonts[key] = font
+    return font
+
+
+def _background(size, color, radius):
+    """The static layer of an overlay, drawn once per size and color and copied for each frame."""
+    key = (size, color, radius)
+    background = _backgrounds.get(key)
+    if background is None:
+        from PIL import Image, ImageDraw
+        background = Image.new("RGBA", size, (0, 0, 0, 0))
+        ImageDraw.Draw(background).rounded_rectangle((0, 0, size[0] - 1, size[1] - 1), radius, fill=color)
+        _backgrounds[key] = background
+    return background.copy()
+
+
+def _save(image, path):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    image.save(tmp, IMAGE_FORMAT)
+    os.replace(tmp, path)
+
+
+def render_goal_bar(path, count, goal, label="SUBS", width=600, height=64, font=None,
+                    background=(20, 20, 20, 200), fill=(145, 70, 255, 255), text_color=(255, 255, 255, 255)):
+    from PIL import ImageDraw
+
+    image = _background((width, height), tuple(background), height // 4)
+    draw = ImageDraw.Draw(image)
+    pad = height // 8
+    if goal:
+        filled = int((width - 2 * pad) * min(count / goal, 1.0))
+        if filled > 0:
+            draw.rounded_rectangle((pad, pad, pad + filled, height - pad), height // 6, fill=tuple(fill))
+    text = f"{label} {count}/{goal}" if goal else f"{label} {count}"
+    draw.text((width // 2, height // 2), text, font=_font(font, height // 2), fill=tuple(text_color), anchor="mm")
+    _save(image, path)
+
+
+def render_counter(path, count, label="SUBS", width=300, height=120, font=None,
+                   background=(20, 20, 20, 200), text_color=(255, 255, 255, 255)):
+    from PIL import ImageDraw
+
+    image = _background((width, height), tuple(background), height // 6)
+    draw = ImageDraw.Draw(image)
+    draw.text((width // 2, height * 2 // 5), str(count), font=_font(font, height // 2), fill=tuple(text_color),
+              anchor="mm")
+    draw.text((width // 2, height * 4 // 5), label, font=_font(font, height // 6), fill=tuple(text_color), anchor="mm")
+    _save(image, path)
+
+
+def render_chat_card(path, user, text, width=700, height=160, font=None, background=(20, 20, 20, 220),
+                     name_color=(145, 70, 255, 255), text_color=(255, 255, 255, 255)):
+    from PIL import ImageDraw
+
+    image = _background((width, height), tuple(background), 16)
+    draw = ImageDraw.Draw(image)
+    pad = 16
+    name_font = _font(font, 28)
+    body_font = _font(font, 24)
+    draw.text((pad, pad), user, font=name_font, fill=tuple(name_color))
+
+    # Greedy word wrap; lines that don't fit the card are cut
+    lines, line = [], ""
+    for word in text.split():
+        candidate = f"{line} {word}".strip()
+        if line and draw.textlength(candidate, font=body_font) > width - 2 * pad:
+            lines.append(line)
+            line = word
+        else:
+            line = candidate
+    lines.append(line)
+    line_height = body_font.size + 6
+    top = pad + name_font.size + 10
+    for i, line in enumerate(lines[:max((height - top - pad) // line_height, 1)]):
+        draw.text((pad, top + i * line_height), line, font=body_font, fill=tuple(text_color))
+    _save(image, path)
+
+
+RENDERERS = {
+    "goal_bar": render_goal_bar,
+    "counter": render_counter,
+    "chat_card": render_chat_card,
+}
+
+
+def _render(kind, path, params):
+    start = time.perf_counter()
+    RENDERERS[kind](path, **params)
+    return time.perf_counter() - start
+
+
+# ----------------------------
+# Event loop side
+# ----------------------------
+class _Slot:
+    """One overlay image: what it shows now and the newest frame waiting behind a render."""
+
+    __slots__ = ("kind", "path", "input_name", "latest", "rendered", "pending", "busy", "shown")
+
+    def __init__(self, kind, path, input_name):
+        self.kind = kind
+        self.path = path
+        self.input_name = input_name
+        self.latest = None  # digest of the newest frame asked for
+        self.rendered = None  # digest of the frame on disk
+        self.pending = None  # (digest, params) to render next
+        self.busy = False
+        self.shown = None  # file the OBS input was last pointed at
+
+
+class OverlayRenderer:
+    """
+    Renders overlay images (goal bar, counter, chat card) in a process pool
+    so drawing never runs on the event loop.
+
+    update() is cheap and never waits. A frame whose inputs hash the same
+    as the previous one is skipped. While a render for the same overlay is
+    in flight, only the newest frame is kept, so a burst of changes costs
+    one render after the current one.
+
+    Frames are written to <output_dir>/<name>.png by temp file and rename,
+    so an OBS image source pointed at it never reads a half-written PNG.
+    With obs (an obs_async.AsyncOBSWebsocketsManager) and push="settings",
+    frames alternate between two files and the image source is switched
+    with SetInputSettings, which shows them immediately instead of on OBS's
+    next file check.
+    """
+
+    def __init__(self, output_dir=OVERLAY_DIR, workers=DEFAULT_WORKERS, font=None, obs=None, push=PUSH_FILE):
+        self.output_dir = output_dir
+        self.workers = workers
+        self.font = font
+        self.obs = obs
+        self.push = push
+        self._slots = {}
+        self._pool = None
+        self._tasks = set()
+
+    def _get_pool(self):
+        if self._pool is None:
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+
+            os.makedirs(self.output_dir, exist_ok=True)
+            # spawn, not fork: the parent runs an event loop and worker threads
+            self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+        return self._pool
+
+    def add(self, name, kind, input_name=None):
+        """Declare overlay name, drawn by RENDERERS[kind] and shown in OBS input input_name."""
+        if kind not in RENDERERS:
+            raise ValueError(f"Unknown overlay kind {kind!r}, expected one of {tuple(RENDERERS)}")
+        self._slots[name] = _Slot(kind, os.path.join(self.output_dir, f"{name}.png"), input_name)
+
+    def update(self, name, **params):
+        """Queue a frame for overlay name; must be called from the event loop."""
+        slot = self._slots[name]
+        if self.font is not None:
+            params.setdefault("font", self.font)
+        digest = hashlib.blake2b(repr(sorted(params.items())).encode(), digest_size=16).digest()
+        if digest == slot.latest:
+            frame_totals.inc(slot.kind, "skipped")
+            return
+        if slot.pending is not None:
+            frame_totals.inc(slot.kind, "coalesced")
+        slot.latest = digest
+        slot.pending = (digest, params)
+        if not slot.busy:
+            slot.busy = True
+            task = asyncio.get_running_loop().create_task(self._drain(slot))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _drain(self, slot):
+        loop = asyncio.get_running_loop()
+        try:
+            while slot.pending is not None:
+                digest, params = slot.pending
+                slot.pending = None
+                if digest == slot.rendered:
+                    continue
+                path = slot.path
+                if self.push == PUSH_SETTINGS and self.obs is not None and slot.input_name:
+                    # Always draw into the file OBS isn't showing, even after a failed render or switch
+                    a, b = f"{slot.path[:-4]}.a.png", f"{slot.path[:-4]}.b.png"
+                    path = b if slot.shown == a else a
+                try:
+                    seconds = await loop.run_in_executor(self._get_pool(), _render, slot.kind, path, params)
+                except Exception:
+                    frame_totals.inc(slot.kind, "error")
+                    log.exception("Rendering %s overlay failed", slot.kind)
+                    # Let the same frame be asked for again instead of being skipped as a duplicate
+                    if slot.latest == digest:
+                        slot.latest = slot.rendered
+                    continue
+                render_seconds.observe(seconds, slot.kind)
+                frame_totals.inc(slot.kind, "rendered")
+                slot.rendered = digest
+                if self.obs is not None and slot.input_name and path != slot.shown:
+                    try:
+                        await self.obs.set_input_settings(slot.input_name, {"file": os.path.abspath(path)})
+                        slot.shown = path
+                    except Exception as e:
+                        log.error("Pointing OBS input %s at %s failed: %s", slot.input_name, path, e)
+        finally:
+            slot.busy = False
+
+    async def close(self):
+        """Finish in-flight renders and shut the pool down."""
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self._pool is not None:
+            pool, self._pool = self._pool, None
+            await asyncio.get_running_loop().run_in_executor(None, pool.shutdown)
@@ -18,7 +18,6 @@ SCOPES = [
     #"channel:manage:predictions",
     #"channel:manage:raids",
     #"channel:read:redemptions",
-    #"channel:read:subscriptions",
     #"channel:read:vips",
     #"channel:moderate",
     #"moderation:read",
@@ -55,7 +54,22 @@ SCOPES = [
     #"user:read:subscriptions",
     #"user:read:whispers",
     #"user:manage:whispers",
-    #"user:write:chat"
 
     #user:edit:broadcast
-]
\ No newline at end of file
+]
+
+# Only asked for when a feature that needs them is turned on, see scopes_for()
+# Needed to count subs (listen --counter, --analytics)
+SUBSCRIPTION_SCOPES = ["channel:read:subscriptions"]
+# Needed to send chat (listen --chat)
+SEND_CHAT_SCOPES = ["user:write:chat"]
+
+
+def scopes_for(subscriptions=False, send_chat=False):
+    """SCOPES plus the scopes of the optional features in use."""
+    scopes = list(SCOPES)
+    if subscriptions:
+        scopes += SUBSCRIPTION_SCOPES
+    if send_chat:
+        scopes += SEND_CHAT_SCOPES
+    return scopes
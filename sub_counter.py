@@ -0,0 +1,303 @@
+import os
+import json
+import time
+import asyncio
+import logging
+import collections
+import metrics
+
+log = logging.getLogger(__name__)
+events_total = metrics.counter("sub_counter_events_total", "Counted sub/gift/resub/cheer events", ("type",))
+
+# Twitch sends one channel.subscribe (is_gift=true) per gifted sub on top of the
+# channel.subscription.gift summary, so gifts are counted from the summary only
+EVENT_TYPES = (
+    "channel.subscribe",
+    "channel.subscription.gift",
+    "channel.subscription.message",
+    "channel.cheer",
+)
+DEFAULT_TIER_POINTS = {"1000": 1, "2000": 1, "3000": 1}
+# Rolling windows reported by stats(), in seconds
+DEFAULT_STATS_WINDOWS = (60, 600, 3600)
+# How many recent message_ids are remembered to drop EventSub redeliveries
+SEEN_MESSAGE_IDS = 1000
+
+
+class CounterRules:
+    """
+    How events turn into the number in the title.
+
+    tier_points     points per sub by tier ("1000", "2000", "3000")
+    bits_per_point  bits that make one point (0 ignores cheers)
+    step            the shown count only moves in multiples of step
+    goal            count at which on_goal fires (None = no goal)
+    goal_step       once reached, raise the goal by this much (0 = keep it)
+    """
+
+    __slots__ = ("tier_points", "bits_per_point", "step", "goal", "goal_step")
+
+    def __init__(self, tier_points=None, bits_per_point=500, step=1, goal=None, goal_step=0):
+        self.tier_points = dict(DEFAULT_TIER_POINTS, **(tier_points or {}))
+        self.bits_per_point = bits_per_point
+        self.step = max(int(step), 1)
+        self.goal = goal
+        self.goal_step = goal_step
+
+    def points(self, sub_type, event):
+        """Points an EventSub event is worth (may be fractional for cheers)."""
+        if sub_type == "channel.subscribe":
+            if event.get("is_gift"):
+                return 0
+            return self.tier_points.get(event.get("tier"), 1)
+        if sub_type == "channel.subscription.gift":
+            return self.tier_points.get(event.get("tier"), 1) * int(event.get("total") or 0)
+        if sub_type == "channel.subscription.message":
+            return self.tier_points.get(event.get("tier"), 1)
+        if sub_type == "channel.cheer" and self.bits_per_point:
+            return int(event.get("bits") or 0) / self.bits_per_point
+        return 0
+
+
+class SubCounter:
+    """
+    Event-driven sub counter.
+
+    Sub, gift, resub and cheer notifications add points as they arrive.
+    Listeners are told about changes at most once per window_seconds (one
+    title write per burst of gifts, not one per sub). Every counted event is
+    appended to log_file and the totals are snapshotted every
+    snapshot_every events, so a restart loads the snapshot and replays only
+    the log written after it.
+
+    on_change(count, goal) and on_goal(goal) may be plain functions or
+    coroutines; the async parts must run inside the event loop.
+    """
+
+    event_types = EVENT_TYPES
+
+    def __init__(self, base=0, rules=None, window_seconds=5.0, log_file="sub_counter.log",
+                 snapshot_file=None, snapshot_every=50, on_change=None, on_goal=None,
+                 stats_windows=DEFAULT_STATS_WINDOWS):
+        self.base = base
+        self.rules = rules or CounterRules()
+        self.window_seconds = window_seconds
+        self.log_file = log_file
+        self.snapshot_file = snapshot_file or (f"{log_file}.snapshot" if log_file else None)
+        self.snapshot_every = snapshot_every
+        self.on_change = on_change
+        self.on_goal = on_goal
+        self.stats_windows = tuple(stats_windows)
+
+        self.points = 0.0
+        self.goal = self.rules.goal
+        self.published = None
+        self._log = None
+        self._log_offset = 0
+        self._since_snapshot = 0
+        self._seen = collections.OrderedDict()
+        self._recent = collections.deque()  # (timestamp, points) for the rolling windows
+        self._window = None
+        self._tasks = set()
+        self._pending_goals = []
+        self.restore()
+
+    @classmethod
+    def from_config(cls, config, **kwargs):
+        """Counter for the .env settings: starts at BASE_SUBS with MAX_SUBS as the goal."""
+        rules = CounterRules(
+            bits_per_point=config.bits_per_sub,
+            step=config.counter_step,
+            goal=config.max_subs,
+            goal_step=config.counter_goal_step,
+        )
+        kwargs.setdefault("window_seconds", config.counter_window_seconds)
+        kwargs.setdefault("log_file", config.counter_log)
+        kwargs.setdefault("snapshot_every", config.counter_snapshot_every)
+        return cls(base=config.base_subs, rules=rules, **kwargs)
+
+    # ----------------------------
+    # Counting
+    # ----------------------------
+    @property
+    def count(self):
+        """The number to show: base plus whole points, rounded down to the step."""
+        step = self.rules.step
+        return self.base + int(self.points) // step * step
+
+    def _is_duplicate(self, message_id):
+        if message_id is None:
+            return False
+        if message_id in self._seen:
+            return True
+        self._seen[message_id] = None
+        if len(self._seen) > SEEN_MESSAGE_IDS:
+            self._seen.popitem(last=False)
+        return False
+
+    def _apply(self, points, at):
+        self.points += points
+        self._recent.append((at, points))
+        while self.goal is not None and self.count >= self.goal:
+            self._pending_goals.append(self.goal)
+            # A fixed goal is announced once; a stepped one moves up
+            self.goal = self.goal + self.rules.goal_step if self.rules.goal_step else None
+
+    def add(self, sub_type, event, message_id=None, at=None):
+        """Count one event; returns the points it added."""
+        if self._is_duplicate(message_id):
+            return 0
+        points = self.rules.points(sub_type, event)
+        if not points:
+            return 0
+        at = time.time() if at is None else at
+        self._apply(points, at)
+        events_total.inc(sub_type)
+        self._append({"id": message_id, "type": sub_type, "points": points, "at": at})
+        self._schedule_publish()
+        return points
+
+    async def handle(self, notification):
+        """Dispatcher handler for the event_types notifications."""
+        self.add(notification.subscription_type, notification.event, notification.message_id)
+
+    def register(self, dispatcher):
+        for sub_type in self.event_types:
+            dispatcher.register("notification", sub_type, self.handle)
+
+    # ----------------------------
+    # Windowed publishing
+    # ----------------------------
+    def _schedule_publish(self):
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.publish_now()
+            return
+        if self._window is None:
+            self._window = loop.call_later(self.window_seconds, self._publish_window)
+
+    def _publish_window(self):
+        self._window = None
+        task = asyncio.get_running_loop().create_task(self.publish())
+        self._tasks.add(task)
+        task.add_done_callback(self._publish_done)
+
+    def _publish_done(self, task):
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            log.error("Publishing the sub count failed: %r", task.exception())
+
+    async def publish(self):
+        """Tell listeners about the current count and any goals reached since last time."""
+        goals, self._pending_goals = self._pending_goals, []
+        count = self.count
+        if count != self.published and self.on_change is not None:
+            self.published = count
+            result = self.on_change(count, self.goal)
+            if asyncio.iscoroutine(result):
+                await result
+        for goal in goals:
+            log.info("Sub goal %s reached", goal)
+            if self.on_goal is not None:
+                result = self.on_goal(goal)
+                if asyncio.iscoroutine(result):
+                    await result
+
+    def publish_now(self):
+        """Synchronous publish for use outside an event loop (coroutine callbacks are not awaited)."""
+        goals, self._pending_goals = self._pending_goals, []
+        if self.count != self.published and self.on_change is not None:
+            self.published = self.count
+            self.on_change(self.count, self.goal)
+        for goal in goals:
+            if self.on_goal is not None:
+                self.on_goal(goal)
+
+    def stats(self):
+        now = time.time()
+        horizon = now - max(self.stats_windows, default=0)
+        while self._recent and self._recent[0][0] < horizon:
+            self._recent.popleft()
+        windows = {f"last_{w}s": sum(p for t, p in self._recent if t >= now - w) for w in self.stats_windows}
+        return {"count": self.count, "points": self.points, "goal": self.goal, **windows}
+
+    # ----------------------------
+    # Persistence
+    # ----------------------------
+    def _append(self, entry):
+        if not self.log_file:
+            return
+        if self._log is None:
+            self._log = open(self.log_file, "a", encoding="utf-8")
+        self._log.write(json.dumps(entry, separators=(",", ":")) + "\n")
+        self._log.flush()
+        self._since_snapshot += 1
+        if self._since_snapshot >= self.snapshot_every:
+            self.snapshot()
+
+    def snapshot(self):
+        """Write totals plus the log offset they cover, atomically."""
+        if not self.snapshot_file:
+            return
+        offset = self._log.tell() if self._log is not None else self._log_offset
+        data = {"points": self.points, "goal": self.goal, "log_offset": offset, "saved_at": time.time()}
+        tmp = f"{self.snapshot_file}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp, self.snapshot_file)
+        self._since_snapshot = 0
+
+    def restore(self):
+        """Load the last snapshot and replay the log written after it."""
+        offset = 0
+        if self.snapshot_file and os.path.exists(self.snapshot_file):
+            with open(self.snapshot_file, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self.points = data["points"]
+            self.goal = data.get("goal", self.goal)
+            offset = data.get("log_offset", 0)
+        if not self.log_file or not os.path.exists(self.log_file):
+            return
+        if os.path.getsize(self.log_file) < offset:
+            log.warning("%s is shorter than its snapshot, replaying it from the start", self.log_file)
+            self.points, self.goal, offset = 0.0, self.rules.goal, 0
+
+        replayed = 0
+        with open(self.log_file, "rb+") as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    # A crash mid-write leaves one torn line at the end; cut it so appends start clean
+                    log.warning("Dropping a partial entry at the end of %s", self.log_file)
+                    f.truncate(offset)
+                    break
+                entry = json.loads(line)
+                self._is_duplicate(entry.get("id"))
+                self._apply(entry["points"], entry["at"])
+                offset += len(line)
+                replayed += 1
+        self._log_offset = offset
+        self._pending_goals = []
+        if replayed:
+            log.info("Restored sub counter at %s (%d events replayed)", self.count, replayed)
+
+    def close(self):
+        """Snapshot and close the log. Inside the event loop use close_async, which publishes first."""
+        if self._window is not None:
+            self._window.cancel()
+            self._window = None
+        if self._log is not None:
+            self.snapshot()
+            self._log.close()
+            self._log = None
+
+    async def close_async(self):
+        """Publish a change still waiting for its window instead of dropping it, then close."""
+        if self._window is not None:
+            self._window.cancel()
+            self._window = None
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        await self.publish()
+        self.close()
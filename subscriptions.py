@@ -0,0 +1,106 @@
+import asyncio
+import logging
+import helix_client
+from helix_scheduler import scheduler, PRIORITY_BULK
+
+SUBSCRIPTIONS_URL = f"{helix_client.HELIX_URL}/eventsub/subscriptions"
+
+log = logging.getLogger(__name__)
+
+
+class SubscriptionSpec:
+    """
+    One EventSub subscription to create on every new websocket session.
+
+    condition values may reference resolved IDs by name, e.g.
+    {"broadcaster_user_id": "{broadcaster_id}"}. owner says whose user token
+    creates it: "broadcaster", or "bot" for chat read as the bot account.
+    """
+
+    __slots__ = ("type", "version", "condition", "enabled", "owner", "error")
+
+    def __init__(self, type, version, condition, enabled=True, owner="broadcaster"):
+        self.type = type
+        self.version = str(version)
+        self.condition = condition
+        self.enabled = enabled
+        self.owner = owner
+        self.error = None  # set when Twitch rejected this subscription
+
+    def copy(self, enabled=None):
+        """A separate spec to bootstrap with, so disabling it leaves this one alone."""
+        return SubscriptionSpec(self.type, self.version, self.condition,
+                                self.enabled if enabled is None else enabled, self.owner)
+
+    def resolve_condition(self, ids):
+        return {k: v.format(**ids) for k, v in self.condition.items()}
+
+    def __repr__(self):
+        return f"SubscriptionSpec({self.type!r}, {self.version!r}, {self.condition!r})"
+
+
+# Edit this list to choose which events the listener receives
+SUBSCRIPTIONS = [
+    SubscriptionSpec("channel.chat.message", 1, {"broadcaster_user_id": "{broadcaster_id}", "user_id": "{bot_id}"}, owner="bot"),
+    SubscriptionSpec("channel.cheer", 1, {"broadcaster_user_id": "{broadcaster_id}"}, enabled=False),
+    SubscriptionSpec("channel.subscribe", 1, {"broadcaster_user_id": "{broadcaster_id}"}, enabled=False),
+    SubscriptionSpec("channel.subscription.gift", 1, {"broadcaster_user_id": "{broadcaster_id}"}, enabled=False),
+    SubscriptionSpec("channel.subscription.message", 1, {"broadcaster_user_id": "{broadcaster_id}"}, enabled=False),
+]
+
+
+async def create_subscription(headers, session_id, event_type, condition, version=1):
+    """POST one subscription; returns the HelixResponse."""
+    payload = {
+        "type": event_type,
+        "version": str(version),
+        "condition": condition,
+        "transport": {"method": "websocket", "session_id": session_id}
+    }
+    # Safe to retry: a create that already went through comes back as 409
+    return await scheduler.request("POST", SUBSCRIPTIONS_URL, priority=PRIORITY_BULK, headers=headers, json=payload,
+                                   retry=True)
+
+
+async def bootstrap_subscriptions(auth, session_id, ids, specs=None):
+    """
+    Create every enabled spec on session_id concurrently. Only called from
+    on_welcome, and a new session has no subscriptions yet, so nothing is
+    listed first; a 409 means one is already there. A rejected subscription
+    is disabled on its own spec instead of stopping the others; with specs
+    left out, that is a copy of SUBSCRIPTIONS, never the module list itself.
+    Returns {spec.type: status}.
+    """
+    specs = [spec.copy() for spec in SUBSCRIPTIONS] if specs is None else specs
+    wanted = [spec for spec in specs if spec.enabled]
+    headers = await auth.get_headers_async(json_body=True)
+
+    async def ensure(spec):
+        condition = spec.resolve_condition(ids)
+        resp = await create_subscription(headers, session_id, spec.type, condition, spec.version)
+        if resp.status == 401:
+            # Usually an expired or revoked token rather than a bad spec: refresh once and try again
+            retry_headers = await auth.refresh_headers_async(headers, json_body=True)
+            resp = await create_subscription(retry_headers, session_id, spec.type, condition, spec.version)
+        if resp.status == 202:
+            return spec.type, "created"
+        if resp.status == 409:
+            return spec.type, "exists"
+        # Bad scopes/conditions won't fix themselves on the next reconnect
+        if resp.status in (400, 403):
+            spec.enabled = False
+        spec.error = f"{resp.status}: {resp.text}"
+        log.error("Subscription %s v%s failed (%s)", spec.type, spec.version, spec.error)
+        return spec.type, f"failed ({resp.status})"
+
+    results = await asyncio.gather(*(ensure(spec) for spec in wanted), return_exceptions=True)
+    summary = {}
+    for spec, result in zip(wanted, results):
+        if isinstance(result, BaseException):
+            spec.error = repr(result)
+            log.error("Subscription %s v%s failed (%s)", spec.type, spec.version, spec.error)
+            summary[spec.type] = "failed"
+        else:
+            summary[result[0]] = result[1]
+    log.info("EventSub subscriptions: %s", summary)
+    return summary
@@ -0,0 +1,120 @@
+import json
+import types
+import asyncio
+import chat_sender
+from helix_client import HelixResponse
+from chat_sender import ChatSender, PRIORITY_MODERATION, PRIORITY_REPLY, PRIORITY_ANNOUNCE
+
+
+class FakeAuth:
+    async def get_headers_async(self, json_body=False):
+        return {}
+
+
+def fake_helix(monkeypatch, sent, status=200):
+    async def request(method, url, priority=None, **kwargs):
+        await asyncio.sleep(0)
+        sent.append(kwargs["json"]["message"])
+        return HelixResponse(status, {}, json.dumps({"data": [{"is_sent": True}]}))
+
+    monkeypatch.setattr(chat_sender, "scheduler", types.SimpleNamespace(request=request))
+
+
+def test_sends_by_priority_then_arrival(monkeypatch):
+    sent = []
+    fake_helix(monkeypatch, sent)
+
+    async def run():
+        sender = ChatSender(FakeAuth(), "1", max_in_flight=1)
+        # Queue everything before the send loop starts
+        sender._wake = asyncio.Event()
+        futures = [sender.send("announce 1", PRIORITY_ANNOUNCE), sender.send("reply", PRIORITY_REPLY),
+                   sender.send("announce 2", PRIORITY_ANNOUNCE), sender.send("timeout", PRIORITY_MODERATION)]
+        sender.start()
+        assert await asyncio.gather(*futures) == [True] * 4
+        await sender.close()
+
+    asyncio.run(run())
+    assert sent == ["timeout", "reply", "announce 1", "announce 2"]
+
+
+def test_identical_queued_messages_share_one_send(monkeypatch):
+    sent = []
+    fake_helix(monkeypatch, sent)
+
+    async def run():
+        sender = ChatSender(FakeAuth(), "1").start()
+        first = sender.send("Sub goal reached!")
+        second = sender.send("Sub goal reached!")
+        assert first is second
+        # A reply is queued on its own, but Twitch drops repeated text either way, so only one is sent
+        reply = sender.send("Sub goal reached!", PRIORITY_REPLY, reply_to="abc")
+        assert reply is not first
+        assert sorted([await first, await reply]) == [False, True]
+        await sender.close()
+
+    asyncio.run(run())
+    assert sent == ["Sub goal reached!"]
+
+
+def test_promoting_a_queued_duplicate_moves_it_ahead(monkeypatch):
+    sent = []
+    fake_helix(monkeypatch, sent)
+
+    async def run():
+        sender = ChatSender(FakeAuth(), "1", max_in_flight=1)
+        sender._wake = asyncio.Event()
+        sender.send("a", PRIORITY_ANNOUNCE)
+        sender.send("b", PRIORITY_ANNOUNCE)
+        sender.send("b", PRIORITY_MODERATION)
+        sender.start()
+        await asyncio.sleep(0.05)
+        await sender.close()
+
+    asyncio.run(run())
+    assert sent == ["b", "a"]
+
+
+def test_recently_sent_text_is_dropped_as_a_duplicate(monkeypatch):
+    sent = []
+    fake_helix(monkeypatch, sent)
+
+    async def run():
+        sender = ChatSender(FakeAuth(), "1").start()
+        assert await sender.send("hello") is True
+        assert await sender.send("hello") is False
+        assert await sender.send("hello again") is True
+        await sender.close()
+
+    asyncio.run(run())
+    assert sent == ["hello", "hello again"]
+
+
+def test_failed_send_does_not_block_a_resend(monkeypatch):
+    sent = []
+    fake_helix(monkeypatch, sent, status=500)
+
+    async def run():
+        sender = ChatSender(FakeAuth(), "1").start()
+        assert await sender.send("hello") is False
+        assert await sender.send("hello") is False
+        await sender.close()
+
+    asyncio.run(run())
+    assert sent == ["hello", "hello"]
+
+
+def test_empty_and_overflowing_messages_resolve_false(monkeypatch):
+    sent = []
+    fake_helix(monkeypatch, sent)
+
+    async def run():
+        sender = ChatSender(FakeAuth(), "1", max_queued=1)
+        sender._wake = asyncio.Event()
+        assert await sender.send("   ") is False
+        sender.send("one")
+        assert await sender.send("two") is False
+        sender.start()
+        await sender.close()
+
+    asyncio.run(run())
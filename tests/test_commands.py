@@ -0,0 +1,109 @@
+import types
+import asyncio
+import pytest
+import commands
+from commands import CommandRouter, Cooldowns, permission_level, EVERYONE, SUBSCRIBER, VIP, MODERATOR, BROADCASTER
+from eventsub_dispatch import Dispatcher
+
+
+def chat_frame(text, chatter="1", badges=()):
+    return {
+        "metadata": {"message_id": f"{chatter}-{text}", "message_type": "notification",
+                     "subscription_type": "channel.chat.message", "subscription_version": "1"},
+        "payload": {"event": {
+            "broadcaster_user_id": "100", "broadcaster_user_login": "streamer", "broadcaster_user_name": "Streamer",
+            "chatter_user_id": chatter, "chatter_user_login": f"user{chatter}", "chatter_user_name": f"User{chatter}",
+            "message_id": f"{chatter}-{text}", "message": {"text": text},
+            "badges": [{"set_id": badge, "id": "1", "info": ""} for badge in badges],
+        }},
+    }
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(commands, "time", types.SimpleNamespace(monotonic=lambda: now[0]))
+    return now
+
+
+@pytest.fixture
+def router():
+    replies = []
+
+    async def reply(chat, text):
+        replies.append((chat.chatter_user_id, text))
+
+    router = CommandRouter(reply=reply)
+    router.replies = replies
+    router.dispatcher = Dispatcher()
+    router.register(router.dispatcher)
+    return router
+
+
+def send(router, *frames):
+    async def run():
+        for frame in frames:
+            await router.dispatcher.dispatch(frame)
+
+    asyncio.run(run())
+    return [text for _, text in router.replies]
+
+
+def test_permission_level_is_the_highest_badge():
+    assert permission_level([]) == EVERYONE
+    assert permission_level([{"set_id": "subscriber"}, {"set_id": "vip"}]) == VIP
+    assert permission_level([{"set_id": "founder"}]) == SUBSCRIBER
+    assert permission_level([{"set_id": "broadcaster"}, {"set_id": "moderator"}]) == BROADCASTER
+    assert permission_level([{"set_id": "partner"}]) == EVERYONE
+
+
+def test_routes_by_name_and_alias_case_insensitively(router):
+    router.add("subs", lambda ctx: f"{ctx.invoked_as}:{ctx.args}", aliases=("goal",))
+    assert send(router, chat_frame("!subs"), chat_frame("!GOAL  now "), chat_frame("subs"),
+                chat_frame("!unknown")) == ["subs:", "GOAL:now"]
+
+
+def test_duplicate_alias_is_rejected(router):
+    router.add("subs", lambda ctx: "", aliases=("goal",))
+    with pytest.raises(ValueError):
+        router.add("goal", lambda ctx: "")
+
+
+def test_permission_routing(router):
+    router.add("mod", lambda ctx: "ok", permission=MODERATOR)
+    assert send(router, chat_frame("!mod", badges=("subscriber",)), chat_frame("!mod", badges=("vip",))) == []
+    assert send(router, chat_frame("!mod", badges=("moderator",)), chat_frame("!mod", badges=("broadcaster",))) == [
+        "ok", "ok"]
+
+
+def test_user_cooldown_is_per_chatter(router, clock):
+    router.add("hi", lambda ctx: "hi " + ctx.chat.chatter_user_id, user_cooldown=30)
+    assert send(router, chat_frame("!hi", "1"), chat_frame("!hi", "1"), chat_frame("!hi", "2")) == ["hi 1", "hi 2"]
+    clock[0] += 30
+    assert send(router, chat_frame("!hi", "1")) == ["hi 1", "hi 2", "hi 1"]
+
+
+def test_global_cooldown_is_shared_and_moderators_bypass_it(router, clock):
+    router.add("stats", lambda ctx: "stats", global_cooldown=10)
+    assert send(router, chat_frame("!stats", "1"), chat_frame("!stats", "2")) == ["stats"]
+    assert send(router, chat_frame("!stats", "3", badges=("moderator",))) == ["stats", "stats"]
+    clock[0] += 10
+    assert send(router, chat_frame("!stats", "2")) == ["stats", "stats", "stats"]
+
+
+def test_failing_handler_does_not_reply(router):
+    def broken(ctx):
+        raise RuntimeError("boom")
+
+    router.add("broken", broken)
+    assert send(router, chat_frame("!broken")) == []
+
+
+def test_cooldowns_sweep_expired_entries():
+    cooldowns = Cooldowns(5)
+    cooldowns.start("a", 0)
+    cooldowns.start("b", 1)
+    assert cooldowns.remaining("a", 3) == 2
+    assert cooldowns.remaining("a", 5) == 0
+    cooldowns.start("c", commands.SWEEP_SECONDS)
+    assert len(cooldowns) == 1
@@ -0,0 +1,119 @@
+import asyncio
+import pytest
+from event_pipeline import EventPipeline
+
+
+class GatedHandler:
+    """Records items, but holds each one until the gate opens, so the queue can be filled."""
+
+    def __init__(self):
+        self.handled = []
+        self.gate = asyncio.Event()
+
+    async def handle(self, item):
+        await self.gate.wait()
+        self.handled.append(item)
+
+
+def run(test):
+    asyncio.run(test())
+
+
+async def started(overflow, key=None):
+    handler = GatedHandler()
+    pipeline = EventPipeline(handler.handle, workers=1, maxsize=2, overflow=overflow, key=key)
+    pipeline.start()
+    return pipeline, handler
+
+
+async def fill(pipeline, first, *queued):
+    """Put first and let the worker take it, then fill the queue with queued."""
+    await pipeline.put(first)
+    await asyncio.sleep(0)
+    for item in queued:
+        await pipeline.put(item)
+
+
+async def drain(pipeline, handler):
+    handler.gate.set()
+    await pipeline.join()
+    await pipeline.stop()
+
+
+def test_block_waits_for_room_and_keeps_everything():
+    async def test():
+        pipeline, handler = await started("block")
+        await fill(pipeline, 1, 2, 3)
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(pipeline.put(4), 0.05)
+        handler.gate.set()
+        await pipeline.put(4)
+        await drain(pipeline, handler)
+        assert handler.handled == [1, 2, 3, 4]
+        assert pipeline.dropped == 0
+
+    run(test)
+
+
+def test_drop_oldest_discards_the_oldest_queued_item():
+    async def test():
+        pipeline, handler = await started("drop_oldest")
+        await fill(pipeline, 1, 2, 3, 4, 5)
+        await drain(pipeline, handler)
+        assert handler.handled == [1, 4, 5]
+        assert pipeline.dropped == 2
+
+    run(test)
+
+
+def test_coalesce_replaces_the_queued_item_with_the_same_key_only_when_full():
+    async def test():
+        pipeline, handler = await started("coalesce", key=lambda item: item[0])
+        await fill(pipeline, ("a", 1), ("a", 2))
+        # Room left: the same key is queued twice rather than coalesced
+        await pipeline.put(("b", 1))
+        await pipeline.put(("a", 3))
+        await pipeline.put(("b", 2))
+        await drain(pipeline, handler)
+        assert handler.handled == [("a", 1), ("a", 3), ("b", 2)]
+        assert pipeline.coalesced == 2
+
+    run(test)
+
+
+def test_coalesce_waits_for_room_for_a_new_key():
+    async def test():
+        pipeline, handler = await started("coalesce", key=lambda item: item[0])
+        await fill(pipeline, ("a", 1), ("a", 2), ("b", 1))
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(pipeline.put(("c", 1)), 0.05)
+        await drain(pipeline, handler)
+        assert handler.handled == [("a", 1), ("a", 2), ("b", 1)]
+
+    run(test)
+
+
+def test_handler_errors_are_counted_and_do_not_stop_the_workers():
+    async def test():
+        handled = []
+
+        def handler(item):
+            if item == 2:
+                raise ValueError(item)
+            handled.append(item)
+
+        pipeline = EventPipeline(handler, workers=2)
+        pipeline.start()
+        for item in range(1, 5):
+            await pipeline.put(item)
+        await pipeline.join()
+        await pipeline.stop()
+        assert sorted(handled) == [1, 3, 4]
+        assert pipeline.errors == 1 and pipeline.processed == 3
+
+    run(test)
+
+
+def test_coalesce_needs_a_key():
+    with pytest.raises(ValueError):
+        EventPipeline(print, overflow="coalesce")
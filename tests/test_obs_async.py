@@ -0,0 +1,115 @@
+"""
+AsyncOBSWebsocketsManager against fakes.obs_server: setters must never wait
+on OBS, and whatever they buffered while it was away reaches it afterwards.
+
+    python -m pytest tests
+"""
+import time
+import socket
+import asyncio
+import obs_async
+from obs_async import AsyncOBSWebsocketsManager
+from fakes.obs_server import FakeOBSServer
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def wait_for(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "timed out"
+        await asyncio.sleep(0.01)
+
+
+def test_setters_reach_obs():
+    async def run():
+        server = await FakeOBSServer(port=free_port(), password="secret").start()
+        obs = AsyncOBSWebsocketsManager("127.0.0.1", server.port, "secret")
+        try:
+            await obs.connect()
+            await obs.set_text("Sub Counter", "5/10")
+            await obs.set_source_visibility("Main", "Confetti", False)
+            assert server.inputs["Sub Counter"]["text"] == "5/10"
+            assert server.items[("Main", "Confetti")]["enabled"] is False
+        finally:
+            await obs.disconnect()
+            await server.stop()
+
+    asyncio.run(run())
+
+
+def test_setter_buffers_without_waiting_while_obs_is_down():
+    async def run():
+        port = free_port()
+        obs = AsyncOBSWebsocketsManager("127.0.0.1", port, "")
+        server = None
+        try:
+            started = time.monotonic()
+            assert await obs.set_text("Sub Counter", "1/10") is None
+            assert await obs.set_text("Sub Counter", "2/10") is None
+            await obs.set_source_visibility("Main", "Confetti", False)
+            assert time.monotonic() - started < 0.1
+
+            # Only the newest value per target is replayed once OBS is back
+            server = await FakeOBSServer(port=port).start()
+            await wait_for(lambda: server.items[("Main", "Confetti")]["enabled"] is False)
+            assert server.inputs["Sub Counter"]["text"] == "2/10"
+            assert [t for t, d in server.requests if t == "SetInputSettings"] == ["SetInputSettings"]
+        finally:
+            await obs.disconnect()
+            if server is not None:
+                await server.stop()
+
+    asyncio.run(run())
+
+
+def test_setter_buffers_when_obs_stops_answering(monkeypatch):
+    monkeypatch.setattr(obs_async, "REQUEST_TIMEOUT_SECONDS", 0.05)
+
+    async def run():
+        server = await FakeOBSServer(port=free_port()).start()
+        obs = AsyncOBSWebsocketsManager("127.0.0.1", server.port, "")
+        try:
+            await obs.connect()
+            server.latency = 0.2
+            assert await obs.set_text("Sub Counter", "3/10") is None
+            assert ("text", "Sub Counter") in obs._buffered
+
+            # Replayed on the next connection, after the late original
+            server.latency = 0
+            await server.drop_connections()
+            await wait_for(lambda: [t for t, d in server.requests].count("SetInputSettings") == 2)
+            assert not obs._buffered and server.inputs["Sub Counter"]["text"] == "3/10"
+        finally:
+            await obs.disconnect()
+            await server.stop()
+
+    asyncio.run(run())
+
+
+def test_timed_out_setter_is_retried_on_the_same_connection(monkeypatch):
+    monkeypatch.setattr(obs_async, "REQUEST_TIMEOUT_SECONDS", 0.05)
+    monkeypatch.setattr(obs_async, "RECONNECT_BACKOFF_SECONDS", (0.1, 0.1))
+
+    async def run():
+        server = await FakeOBSServer(port=free_port()).start()
+        obs = AsyncOBSWebsocketsManager("127.0.0.1", server.port, "")
+        try:
+            await obs.connect()
+            server.latency = 0.2
+            assert await obs.set_scene("BRB") is None
+            server.latency = 0
+
+            # The late original lands, then the retry; the connection never drops
+            await wait_for(lambda: [t for t, d in server.requests].count("SetCurrentProgramScene") == 2)
+            await wait_for(lambda: not obs._buffered)
+            assert server.program_scene == "BRB" and obs.connected.is_set()
+        finally:
+            await obs.disconnect()
+            await server.stop()
+
+    asyncio.run(run())
@@ -0,0 +1,69 @@
+from sub_counter import SubCounter, CounterRules
+
+SUB = ("channel.subscribe", {"tier": "1000"})
+GIFT = ("channel.subscription.gift", {"tier": "1000", "total": 5})
+
+
+def counter(tmp_path, **kwargs):
+    kwargs.setdefault("snapshot_every", 1000)
+    return SubCounter(base=10, log_file=str(tmp_path / "subs.log"), **kwargs)
+
+
+def test_restore_replays_the_log(tmp_path):
+    c = counter(tmp_path)
+    c.add(*SUB, message_id="m1")
+    c.add(*GIFT, message_id="m2")
+    c._log.close()  # crash: no final snapshot
+
+    restored = counter(tmp_path)
+    assert restored.count == 16
+    # Redeliveries of events already in the log are still recognized
+    assert restored.add(*SUB, message_id="m1") == 0
+
+
+def test_restore_drops_a_torn_last_line_and_keeps_appending_cleanly(tmp_path):
+    c = counter(tmp_path)
+    c.add(*SUB, message_id="m1")
+    c.add(*SUB, message_id="m2")
+    c._log.close()
+    with open(tmp_path / "subs.log", "ab") as f:
+        f.write(b'{"id":"m3","type":"channel.subscribe","poi')
+
+    restored = counter(tmp_path)
+    assert restored.count == 12
+    assert (tmp_path / "subs.log").read_bytes().endswith(b"\n")
+    restored.add(*SUB, message_id="m3")
+    restored.close()
+
+    assert counter(tmp_path).count == 13
+
+
+def test_restore_from_a_snapshot_replays_only_the_newer_entries(tmp_path):
+    c = counter(tmp_path, snapshot_every=2)
+    for i in range(3):
+        c.add(*SUB, message_id=f"m{i}")
+    c._log.close()
+
+    restored = counter(tmp_path, snapshot_every=2)
+    assert restored.count == 13
+
+
+def test_log_shorter_than_its_snapshot_is_replayed_from_the_start(tmp_path):
+    c = counter(tmp_path)
+    c.add(*SUB)
+    c.add(*SUB)
+    c.close()
+    (tmp_path / "subs.log").write_bytes(b"")
+
+    assert counter(tmp_path).count == 10
+
+
+def test_goal_steps_up_and_count_moves_in_steps(tmp_path):
+    goals = []
+    c = SubCounter(base=0, log_file=None, rules=CounterRules(step=5, goal=5, goal_step=5), on_goal=goals.append)
+    c.add(*GIFT)
+    c.add(*SUB)
+    assert c.count == 5 and c.goal == 10
+    c.add(*GIFT)
+    c.publish_now()
+    assert c.count == 10 and c.goal == 15 and goals == [5, 10]
@@ -0,0 +1,54 @@
+import pytest
+from title_template import TitleTemplate, TitleTemplateError, MAX_TITLE_LENGTH
+
+
+def test_render_fills_placeholders_and_defaults():
+    template = TitleTemplate("DAY {day} - {subs}/{goal:,} SUBS", defaults={"day": 3, "goal": 1000})
+    assert template.render(subs=12) == "DAY 3 - 12/1,000 SUBS"
+    assert template.render(subs=12, goal=2000) == "DAY 3 - 12/2,000 SUBS"
+
+
+def test_missing_placeholder_value():
+    template = TitleTemplate("DAY {day} - {subs}")
+    assert template.missing("subs") == ["day"]
+    with pytest.raises(TitleTemplateError):
+        template.render(subs=1)
+
+
+def test_fixed_text_over_the_limit_fails_at_compile_time():
+    with pytest.raises(TitleTemplateError):
+        TitleTemplate("x" * (MAX_TITLE_LENGTH + 1))
+
+
+def test_max_values_are_length_checked_at_compile_time():
+    text = "x" * (MAX_TITLE_LENGTH - 3)
+    TitleTemplate(text + "{subs}", max_values={"subs": 999})
+    with pytest.raises(TitleTemplateError):
+        TitleTemplate(text + "{subs}", max_values={"subs": 1000})
+
+
+def test_placeholders_without_a_value_are_not_measured():
+    # {day} comes from TITLE_VALUES at render time; only known values count toward the check
+    TitleTemplate("x" * (MAX_TITLE_LENGTH - 3) + "{subs}{day}", max_values={"subs": 999})
+
+
+def test_render_over_the_limit_fails():
+    template = TitleTemplate("x" * (MAX_TITLE_LENGTH - 3) + "{subs}")
+    assert len(template.render(subs=999)) == MAX_TITLE_LENGTH
+    with pytest.raises(TitleTemplateError):
+        template.render(subs=1000)
+
+
+@pytest.mark.parametrize("title, insert_after, expected", [
+    ("Hello world today", 1, "Hello {subs} world today"),
+    # A double space marks where the number goes and the rest of the gap is kept
+    ("Hello  world today", 1, "Hello {subs} world today"),
+    ("Hello   world", 1, "Hello {subs}  world"),
+    ("Hello world", 0, "{subs} Hello world"),
+    ("Hello world", 5, "Hello world {subs}"),
+    ("Sub {goal} run", 1, "Sub {subs} {{goal}} run"),
+])
+def test_from_insert_after_spacing(title, insert_after, expected):
+    template = TitleTemplate.from_insert_after(title, insert_after)
+    assert template.template == expected
+    assert template.fields == ("subs",)
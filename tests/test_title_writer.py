@@ -0,0 +1,87 @@
+import json
+import asyncio
+import title_writer
+from helix_client import HelixResponse
+from title_writer import TitleWriter
+
+
+class FakeAuth:
+    async def get_headers_async(self, json_body=False):
+        return {}
+
+
+class FakeScheduler:
+    """Stands in for helix_scheduler.scheduler, answering like Helix /channels."""
+
+    def __init__(self, title=""):
+        self.title = title
+        self.patches = []
+        self.status = 204
+
+    async def request(self, method, url, priority=None, **kwargs):
+        if method == "GET":
+            return HelixResponse(200, {}, json.dumps({"data": [{"title": self.title}]}))
+        title = kwargs["json"]["title"]
+        self.patches.append(title)
+        if self.status == 204:
+            self.title = title
+        return HelixResponse(self.status, {}, "")
+
+
+def run(monkeypatch, test, title=""):
+    fake = FakeScheduler(title)
+    monkeypatch.setattr(title_writer, "scheduler", fake)
+
+    async def main():
+        writer = TitleWriter(FakeAuth(), "1", coalesce_seconds=0.02)
+        await test(writer, fake)
+
+    asyncio.run(main())
+    return fake
+
+
+def test_unchanged_title_is_skipped(monkeypatch):
+    async def test(writer, fake):
+        assert await writer.sync_async() == "5 SUBS"
+        await writer.set_title_async("5 SUBS")
+        await asyncio.sleep(0.05)
+        assert fake.patches == [] and writer.skipped == 1
+
+    run(monkeypatch, test, title="5 SUBS")
+
+
+def test_burst_is_coalesced_into_one_patch_of_the_newest_title(monkeypatch):
+    async def test(writer, fake):
+        await writer.sync_async()
+        for subs in range(1, 6):
+            await writer.set_title_async(f"{subs} SUBS")
+        await asyncio.sleep(0.05)
+        assert fake.patches == ["5 SUBS"]
+        assert writer.confirmed_title == "5 SUBS" and writer.writes == 1 and writer.skipped == 4
+
+    run(monkeypatch, test)
+
+
+def test_title_set_back_before_the_flush_is_not_written(monkeypatch):
+    async def test(writer, fake):
+        await writer.sync_async()
+        await writer.set_title_async("6 SUBS")
+        await writer.set_title_async("5 SUBS")
+        await asyncio.sleep(0.05)
+        assert fake.patches == []
+
+    run(monkeypatch, test, title="5 SUBS")
+
+
+def test_failed_patch_is_retried(monkeypatch):
+    async def test(writer, fake):
+        await writer.sync_async()
+        fake.status = 500
+        await writer.set_title_async("7 SUBS")
+        await asyncio.sleep(0.05)
+        assert writer.pending_title == "7 SUBS" and writer.confirmed_title == ""
+        fake.status = 204
+        assert await writer.close_async() is True
+        assert fake.patches == ["7 SUBS", "7 SUBS"] and writer.confirmed_title == "7 SUBS"
+
+    run(monkeypatch, test)
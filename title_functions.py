@@ -1,30 +1,37 @@
-import os
-import requests
 import time
+import logging
+import helix_client
+from config import load_config
 from twitch_functions import get_channel_id
 from twitch_auth import TwitchAuth
+from title_template import TitleTemplate
 
-BROADCASTER_USERNAME = (os.getenv("BROADCASTER_USERNAME"))
-MAX_SUBS = os.getenv("MAX_SUBS")
-UPDATE_INTERVAL_MINUTES = int(os.getenv("UPDATE_INTERVAL_MINUTES"))
+log = logging.getLogger(__name__)
 
-#TODO: Needs better names
-LINEAR = os.getenv("LINEAR")
-title0 = os.getenv("Title0")
-title1 = os.getenv("Title1")
+_title_template = None
 
-BASE_SUBS = int(os.getenv("BASE_SUBS"))
+#TODO: Needs better names (Title0/Title1)
+def get_title_template():
+    global _title_template
+    if _title_template is None:
+        config = load_config().require("max_subs")
+        _title_template = TitleTemplate(
+            "{} {{subs}} {}".format(*(t.replace("{", "{{").replace("}", "}}") for t in (config.title0 or "", config.title1 or ""))),
+            max_values={"subs": config.max_subs},
+        )
+    return _title_template
 
 def subs_logic(SUBS):
-    mult = os.getenv("BASE_MULT")
+    config = load_config()
+    mult = config.base_mult
 
-    if SUBS == None:
-        SUBS = BASE_SUBS
+    if SUBS is None:
+        SUBS = config.base_subs
 
-    if LINEAR == True:
-        SUBS += BASE_SUBS
-    elif LINEAR == False:
-        SUBS = (SUBS * mult) // 1
+    if config.linear:
+        SUBS += config.base_subs
+    else:
+        SUBS = int(SUBS * mult)
     
     
     return SUBS
@@ -34,32 +41,33 @@ def update_title(auth: TwitchAuth ,channel_id: str, new_title: str):
     headers = auth.get_headers()
     data = {"title": new_title}
     
-    response = requests.patch(
-        f"https://api.twitch.tv/helix/channels?broadcaster_id={channel_id}",
+    response = helix_client.patch(
+        f"{helix_client.HELIX_URL}/channels?broadcaster_id={channel_id}",
         headers=headers,
         json=data
     )
     
     if response.status_code == 204:
-        print("Title updated successfully!")
+        log.info("Title updated successfully!")
     else:
-        print(f"Failed to update title ({response.status_code}): {response.text}")
+        log.error("Failed to update title (%s): %s", response.status_code, response.text)
 
-def update_title_loop():
-    print("Fetching channel ID...")
-    channel_id = get_channel_id(BROADCASTER_USERNAME)
-    print(f"Channel ID for '{BROADCASTER_USERNAME}': {channel_id}")
+def update_title_loop(auth: TwitchAuth):
+    config = load_config().require("broadcaster_username", "max_subs")
+    log.info("Fetching channel ID...")
+    channel_id = get_channel_id(config.broadcaster_username)
+    log.info("Channel ID for '%s': %s", config.broadcaster_username, channel_id)
     
-    SUBS = BASE_SUBS
+    SUBS = config.base_subs
 
     while True:
-        print("Updating title...")
-        print(SUBS)
-        NEW_TITLE = f"{title0} {SUBS} {title1}"  # Change to your desired title
-        update_title(channel_id, NEW_TITLE)
-        print(f"Waiting {UPDATE_INTERVAL_MINUTES} minutes before next update...")
-        time.sleep(UPDATE_INTERVAL_MINUTES * 15)
-        SUBS += subs_logic(SUBS)
-        if SUBS >= MAX_SUBS:
-            SUBS == MAX_SUBS
+        log.info("Updating title with %s subs...", SUBS)
+        NEW_TITLE = get_title_template().render(subs=SUBS)  # Change Title0/Title1 for your desired title
+        update_title(auth, channel_id, NEW_TITLE)
+        log.info("Waiting %s minutes before next update...", config.update_interval_minutes)
+        time.sleep(config.update_interval_minutes * 15)
+        SUBS = subs_logic(SUBS)
+        if SUBS >= config.max_subs:
+            SUBS = config.max_subs
+            update_title(auth, channel_id, get_title_template().render(subs=SUBS))
             return
\ No newline at end of file
@@ -0,0 +1,113 @@
+import re
+from functools import lru_cache
+from string import Formatter
+
+# Helix rejects channel titles longer than this
+MAX_TITLE_LENGTH = 140
+RENDER_CACHE_SIZE = 256
+
+
+class TitleTemplateError(ValueError):
+    pass
+
+
+class TitleTemplate:
+    """
+    A title parsed once into literal and placeholder segments.
+
+    Placeholders use str.format syntax, e.g. "DAY {day} - {subs}/{goal:,} SUBS".
+    Rendering is a join over the precomputed parts and is memoized per input
+    tuple, so repeated ticks with the same numbers cost a dict lookup.
+    """
+
+    def __init__(self, template, defaults=None, max_values=None):
+        self.template = template
+        self.defaults = dict(defaults or {})
+        self._parts = []  # literal str, or (field_name, format_spec) tuple
+        fields = []
+
+        try:
+            parsed = list(Formatter().parse(template))
+        except ValueError as e:
+            raise TitleTemplateError(f"Invalid title template {template!r}: {e}") from None
+
+        for literal, field, spec, conversion in parsed:
+            if literal:
+                self._parts.append(literal)
+            if field is None:
+                continue
+            if not field.isidentifier():
+                raise TitleTemplateError(f"Invalid placeholder {{{field}}} in title template")
+            if conversion:
+                raise TitleTemplateError(f"Conversions like !{conversion} are not supported in title templates")
+            self._parts.append((field, spec or ""))
+            if field not in fields:
+                fields.append(field)
+
+        self.fields = tuple(fields)
+        self._literal_length = sum(len(p) for p in self._parts if isinstance(p, str))
+        if self._literal_length > MAX_TITLE_LENGTH:
+            raise TitleTemplateError(
+                f"Title template has {self._literal_length} fixed characters, Twitch allows {MAX_TITLE_LENGTH}"
+            )
+
+        self._render_cached = lru_cache(maxsize=RENDER_CACHE_SIZE)(self._render)
+        if max_values is not None:
+            # Fail at startup instead of on the PATCH when the biggest values would overflow.
+            # Placeholders without a value yet are passed in at render time and can't be measured here.
+            values = {**self.defaults, **max_values}
+            length = self._literal_length + sum(len(format(values[part[0]], part[1])) for part in self._parts
+                                                if not isinstance(part, str) and part[0] in values)
+            if length > MAX_TITLE_LENGTH:
+                raise TitleTemplateError(
+                    f"Title would be {length} characters with {max_values}, Twitch allows {MAX_TITLE_LENGTH}"
+                )
+
+    def missing(self, *names):
+        """Placeholders that neither the defaults nor names provide."""
+        return [field for field in self.fields if field not in self.defaults and field not in names]
+
+    @classmethod
+    def from_insert_after(cls, title, insert_after, field="subs", **kwargs):
+        """
+        Build a template from the legacy title/insert_after settings, placing
+        {field} after the first insert_after words and keeping the original spacing.
+        """
+        escaped = title.replace("{", "{{").replace("}", "}}")
+        if insert_after <= 0:
+            return cls(f"{{{field}}} {escaped.lstrip()}", **kwargs)
+
+        words = list(re.finditer(r"\S+", escaped))
+        if insert_after >= len(words):
+            return cls(f"{escaped.rstrip()} {{{field}}}", **kwargs)
+
+        end = words[insert_after - 1].end()
+        gap = escaped[end:words[insert_after].start()]
+        # A double space in the title marks where the number goes; keep the rest of the gap
+        template = f"{escaped[:end]}{gap[:1]}{{{field}}}{gap[1:] or ' '}{escaped[words[insert_after].start():]}"
+        return cls(template, **kwargs)
+
+    def _render(self, values):
+        values = dict(values)
+        out = []
+        for part in self._parts:
+            if isinstance(part, str):
+                out.append(part)
+            else:
+                field, spec = part
+                out.append(format(values[field], spec))
+        title = "".join(out)
+        if len(title) > MAX_TITLE_LENGTH:
+            raise TitleTemplateError(f"Rendered title is {len(title)} characters, Twitch allows {MAX_TITLE_LENGTH}: {title!r}")
+        return title
+
+    def render(self, **values):
+        merged = self.defaults if not values else {**self.defaults, **values}
+        try:
+            key = tuple((field, merged[field]) for field in self.fields)
+        except KeyError as e:
+            raise TitleTemplateError(f"No value for placeholder {{{e.args[0]}}} in title template") from None
+        return self._render_cached(key)
+
+    def __repr__(self):
+        return f"TitleTemplate({self.template!r})"
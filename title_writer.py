@@ -0,0 +1,183 @@
+import asyncio
+import logging
+import threading
+import helix_client
+from config import load_config
+import metrics
+from helix_scheduler import scheduler, PRIORITY_TITLE
+
+CHANNELS_URL = f"{helix_client.HELIX_URL}/channels"
+
+log = logging.getLogger(__name__)
+title_writes = metrics.counter("title_writes_total", "Title changes by outcome", ("result",))
+
+
+class TitleWriter:
+    """
+    Writes a channel title only when it actually changes.
+
+    Remembers the last title Twitch confirmed, skips no-op writes and
+    collapses bursts of updates into a single PATCH of the newest value.
+    Use set_title/flush from threads and the *_async methods from asyncio.
+    """
+
+    def __init__(self, auth, channel_id, coalesce_seconds=None):
+        self.auth = auth
+        self.channel_id = channel_id
+        # Updates arriving within this many seconds are collapsed into one PATCH (TITLE_COALESCE_SECONDS)
+        self.coalesce_seconds = load_config().title_coalesce_seconds if coalesce_seconds is None else coalesce_seconds
+        self.confirmed_title = None
+        self.pending_title = None
+        self.writes = 0
+        self.skipped = 0
+        self._lock = threading.Lock()
+        self._timer = None
+        self._handle = None
+        self._tasks = set()
+
+    def _take_pending(self):
+        """Pop the pending title, or None if it would be a no-op."""
+        with self._lock:
+            title, self.pending_title = self.pending_title, None
+            self._timer = None
+            self._handle = None
+            if title is None or title == self.confirmed_title:
+                return None
+            return title
+
+    def _restore(self, title):
+        """Make a title that failed to write pending again, unless a newer one arrived meanwhile."""
+        with self._lock:
+            if self.pending_title is None:
+                self.pending_title = title
+
+    def _queue(self, title):
+        """Record title as pending; return True if a flush needs scheduling."""
+        with self._lock:
+            if title == self.confirmed_title and self.pending_title is None:
+                self.skipped += 1
+                return False
+            if self.pending_title is not None:
+                self.skipped += 1
+            self.pending_title = title
+            return self._timer is None and self._handle is None
+
+    def _confirm(self, title, status, text):
+        if status == 204:
+            with self._lock:
+                self.confirmed_title = title
+                self.writes += 1
+            title_writes.inc("ok")
+            log.info("Title updated successfully!")
+            return True
+        title_writes.inc("failed")
+        log.error("Failed to update title (%s): %s", status, text)
+        return False
+
+    # ----------------------------
+    # Sync API
+    # ----------------------------
+    def sync(self):
+        """Load the current title from Twitch with a single GET."""
+        response = helix_client.get(
+            CHANNELS_URL,
+            headers=self.auth.get_headers(),
+            params={"broadcaster_id": self.channel_id},
+        )
+        response.raise_for_status()
+        data = response.json()["data"]
+        with self._lock:
+            self.confirmed_title = data[0]["title"] if data else None
+        return self.confirmed_title
+
+    def set_title(self, title):
+        if self._queue(title):
+            self._timer = threading.Timer(self.coalesce_seconds, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def flush(self):
+        """Send the pending title now, if there is a real change."""
+        title = self._take_pending()
+        if title is None:
+            return False
+        try:
+            response = helix_client.patch(
+                CHANNELS_URL,
+                headers=self.auth.get_headers(),
+                params={"broadcaster_id": self.channel_id},
+                json={"title": title},
+            )
+        except Exception:
+            title_writes.inc("error")
+            self._restore(title)
+            raise
+        if not self._confirm(title, response.status_code, response.text):
+            self._restore(title)
+            return False
+        return True
+
+    def close(self):
+        """Cancel the coalescing timer and write out anything still pending."""
+        if self._timer is not None:
+            self._timer.cancel()
+        return self.flush()
+
+    # ----------------------------
+    # Async API
+    # ----------------------------
+    async def sync_async(self):
+        response = await scheduler.request(
+            "GET",
+            CHANNELS_URL,
+            priority=PRIORITY_TITLE,
+            headers=await self.auth.get_headers_async(),
+            params={"broadcaster_id": self.channel_id},
+        )
+        data = response.json()["data"] if response.status == 200 else []
+        with self._lock:
+            self.confirmed_title = data[0]["title"] if data else None
+        return self.confirmed_title
+
+    async def set_title_async(self, title):
+        if self._queue(title):
+            self._handle = asyncio.get_running_loop().call_later(self.coalesce_seconds, self._flush_soon)
+
+    def _flush_soon(self):
+        task = asyncio.get_running_loop().create_task(self.flush_async())
+        self._tasks.add(task)
+        task.add_done_callback(self._flush_done)
+
+    def _flush_done(self, task):
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            log.error("Failed to update title: %r", task.exception())
+
+    async def flush_async(self):
+        title = self._take_pending()
+        if title is None:
+            return False
+        try:
+            response = await scheduler.request(
+                "PATCH",
+                CHANNELS_URL,
+                priority=PRIORITY_TITLE,
+                headers=await self.auth.get_headers_async(),
+                params={"broadcaster_id": self.channel_id},
+                json={"title": title},
+            )
+        except Exception:
+            title_writes.inc("error")
+            self._restore(title)
+            raise
+        if not self._confirm(title, response.status, response.text):
+            self._restore(title)
+            return False
+        return True
+
+    async def close_async(self):
+        if self._handle is not None:
+            self._handle.cancel()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        return await self.flush_async()
@@ -0,0 +1,169 @@
+import os
+import json
+import tempfile
+import threading
+import contextlib
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+STORE_FILE = "file"
+STORE_SQLITE = "sqlite"
+STORES = (STORE_FILE, STORE_SQLITE)
+
+
+class FileTokenStore:
+    """
+    One token per JSON file, safe to share between processes.
+
+    save() writes a temp file in the same directory and renames it over the
+    old one, so readers see the old token or the new one, never half of
+    either. lock() takes an advisory lock on <path>.lock so only one process
+    refreshes at a time. version() is the file's mtime, a stat() call, which
+    is how other processes notice a new token without reading it.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._thread_lock = threading.Lock()
+
+    def load(self):
+        try:
+            with open(self.path, "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def save(self, data):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp = tempfile.mkstemp(prefix=".twitch_token-", suffix=".tmp", dir=directory)
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(data, f, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+        except BaseException:
+            with contextlib.suppress(OSError):
+                os.remove(tmp)
+            raise
+
+    def version(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    @contextlib.contextmanager
+    def lock(self):
+        """Exclusive across threads and (where fcntl exists) processes."""
+        with self._thread_lock:
+            if fcntl is None:
+                yield
+                return
+            with open(f"{self.path}.lock", "a") as f:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+class SqliteTokenStore:
+    """
+    Tokens for many broadcasters in one SQLite file, keyed by broadcaster id.
+
+    Every save() bumps the row's version, so workers notice new tokens with
+    one indexed read. lock() holds a write transaction (BEGIN IMMEDIATE) on
+    its own connection, which SQLite serializes across processes; saves made
+    inside it are committed when it exits.
+    """
+
+    def __init__(self, path="tokens.db", key=None):
+        self.path = path
+        self.key = str(key)
+        self._local = threading.local()
+        self._thread_lock = threading.Lock()
+        with self._connection() as db, db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("CREATE TABLE IF NOT EXISTS tokens (key TEXT PRIMARY KEY, data TEXT NOT NULL, "
+                       "version INTEGER NOT NULL)")
+
+    @contextlib.contextmanager
+    def _connection(self):
+        """
+        The connection of the lock() this thread holds, otherwise a short-lived
+        one: refresh and validation timers each run on a new thread, so a
+        connection kept per thread would leak one file descriptor per timer.
+        """
+        import sqlite3
+
+        db = getattr(self._local, "db", None)
+        if db is not None:
+            yield db
+            return
+        db = sqlite3.connect(self.path, timeout=30)
+        try:
+            yield db
+        finally:
+            db.close()
+
+    def load(self):
+        with self._connection() as db:
+            row = db.execute("SELECT data FROM tokens WHERE key = ?", (self.key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save(self, data):
+        with self._connection() as db, contextlib.nullcontext() if db.in_transaction else db:
+            db.execute(
+                "INSERT INTO tokens (key, data, version) VALUES (?, ?, 1) "
+                "ON CONFLICT (key) DO UPDATE SET data = excluded.data, version = version + 1",
+                (self.key, json.dumps(data)),
+            )
+
+    def version(self):
+        with self._connection() as db:
+            row = db.execute("SELECT version FROM tokens WHERE key = ?", (self.key,)).fetchone()
+        return row[0] if row else None
+
+    @contextlib.contextmanager
+    def lock(self):
+        with self._thread_lock, self._connection() as db:
+            db.execute("BEGIN IMMEDIATE")
+            self._local.db = db
+            try:
+                yield
+            except BaseException:
+                db.rollback()
+                raise
+            else:
+                db.commit()
+            finally:
+                self._local.db = None
+
+    @staticmethod
+    def keys(path="tokens.db"):
+        import sqlite3
+
+        if not os.path.exists(path):
+            return []
+        db = sqlite3.connect(path)
+        try:
+            return [row[0] for row in db.execute("SELECT key FROM tokens ORDER BY key")]
+        finally:
+            db.close()
+
+
+def make_store(kind, broadcaster_id, path=None):
+    """
+    The token store for one broadcaster. kind is TOKEN_STORE (file or
+    sqlite); path is TOKEN_STORE_PATH, the directory for token files or the
+    database file.
+    """
+    if kind in (None, STORE_FILE):
+        return FileTokenStore(os.path.join(path or "", f"twitch_token-{broadcaster_id}.json"))
+    if kind == STORE_SQLITE:
+        return SqliteTokenStore(path or "tokens.db", broadcaster_id)
+    raise ValueError(f"Unknown token store {kind!r}, expected one of {STORES}")
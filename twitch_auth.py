@@ -1,37 +1,123 @@
-import os
-import json
 import time
-import webbrowser
+import heapq
+import logging
+import itertools
 import threading
-import requests
-from http.server import BaseHTTPRequestHandler, HTTPServer
-from urllib.parse import urlparse, parse_qs
+import helix_client
+import metrics
 from datetime import datetime, timedelta, timezone
-from dotenv import load_dotenv
+from config import load_config
 from scopes import SCOPES
+from token_store import make_store
 
-load_dotenv()
-
-CLIENT_ID = os.getenv("TWITCH_CLIENT_ID")
-CLIENT_SECRET = os.getenv("TWITCH_CLIENT_SECRET")
 PORT = 8090
 REDIRECT_URI = f"http://localhost:{PORT}"
 DEFAULT_SCOPES = ["user:read:email"]
+# Refresh the access token in the background this many seconds before it expires
+REFRESH_MARGIN_SECONDS = 300
+# Twitch asks apps to call /oauth2/validate about once an hour per token
+VALIDATE_INTERVAL_SECONDS = 3600
+# Retry sooner when validation itself couldn't reach Twitch
+VALIDATE_RETRY_SECONDS = 60
+# How often the request path checks the token store for a token saved by another process
+STORE_CHECK_SECONDS = 5
+
+log = logging.getLogger(__name__)
+token_refreshes = metrics.counter("token_refresh_total", "Access token refreshes", ("result",))
+token_validations = metrics.counter("token_validate_total", "Calls to /oauth2/validate", ("result",))
+
+
+class _Timers:
+    """
+    One daemon thread that runs the refresh and validation jobs of every
+    TwitchAuth, so serving N channels doesn't cost 2N Timer threads. Jobs
+    run one at a time; they are short network calls well ahead of expiry.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._heap = []
+        self._seq = itertools.count()
+        self._thread = None
+
+    def schedule(self, delay, fn):
+        """Run fn on the timer thread after delay seconds; returns a handle for cancel()."""
+        entry = [time.monotonic() + delay, next(self._seq), fn]
+        with self._cond:
+            heapq.heappush(self._heap, entry)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="twitch-auth-timers", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+        return entry
+
+    def cancel(self, entry):
+        with self._cond:
+            # Left in the heap and skipped when it comes due
+            entry[2] = None
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    while self._heap and self._heap[0][2] is None:
+                        heapq.heappop(self._heap)
+                    if not self._heap:
+                        self._cond.wait()
+                        continue
+                    delay = self._heap[0][0] - time.monotonic()
+                    if delay <= 0:
+                        fn = heapq.heappop(self._heap)[2]
+                        break
+                    self._cond.wait(delay)
+            try:
+                fn()
+            except Exception:
+                log.exception("Token timer job failed")
+
+
+_timers = _Timers()
 
 class TwitchAuth:
-    def __init__(self, scopes=None, broadcaster_id=None, bot_id=None):
-        self.client_id = CLIENT_ID
-        self.client_secret = CLIENT_SECRET
+    def __init__(self, scopes=None, broadcaster_id=None, bot_id=None, store=None, background=True):
+        config = load_config()
+        self.client_id = config.client_id
+        self.client_secret = config.client_secret
         self.scopes = scopes if scopes is not None else DEFAULT_SCOPES
+        self.required_scopes = frozenset(self.scopes)
         self.broadcaster_id = broadcaster_id
         self.bot_id = bot_id
         self.token_file = None
+        self.store = store
+
+        # In-memory token state; only the slow path touches disk or the network
+        self._token_data = None
+        self._expires_at = 0.0
+        self._headers = None
+        self._json_headers = None
+        self._lock = threading.Lock()
+        self._refresh_timer = None
+        self._store_version = None
+        self._next_store_check = 0.0
+
+        # Result of the last background /oauth2/validate call, see validate_token()
+        self.validation = None
+        # background=False (one-shot CLI use) skips the refresh and validation timers
+        self.background = background
+        self._timer_lock = threading.Lock()
+        self._closed = False
+        self._validate_timer = None
+        self._validate_due = 0.0
+        self._method = "device"
+        self._recovering = False
 
         if not self.client_id or not self.client_secret:
             raise RuntimeError("Missing TWITCH_CLIENT_ID or TWITCH_CLIENT_SECRET")
 
         if self.broadcaster_id:
             self.token_file = f"twitch_token-{self.broadcaster_id}.json"
+            if self.store is None:
+                self.store = make_store(config.token_store, self.broadcaster_id, config.token_store_path)
         #else:
         #    # fallback to a generic token file
         #    self.token_file = "twitch_token.json"
@@ -43,16 +129,200 @@ class TwitchAuth:
         data["expires_at"] = (
             datetime.now(timezone.utc) + timedelta(seconds=data["expires_in"])
         ).isoformat()
-        with open(self.token_file, "w") as f:
-            json.dump(data, f, indent=2)
-        print(f"Tokens saved to {self.token_file}")
+        self.store.save(data)
+        self._store_version = self.store.version()
+        log.info("Tokens saved to %s", self.store.path)
+        self._set_token(data)
 
     def load_token(self):
-        print("DEBUG: self.token_file =", self.token_file)
-        if not os.path.exists(self.token_file):
-            return None
-        with open(self.token_file, "r") as f:
-            return json.load(f)
+        return self.store.load() if self.store is not None else None
+
+    def _check_store(self, now):
+        """Pick up a token another process saved; never waits on the lock."""
+        self._next_store_check = now + STORE_CHECK_SECONDS
+        version = self.store.version()
+        if version == self._store_version or not self._lock.acquire(blocking=False):
+            return
+        try:
+            data = self.store.load()
+            if data and "access_token" in data and data["access_token"] != self._token_data["access_token"]:
+                log.info("Using the token saved by another process in %s", self.store.path)
+                self._set_token(data)
+            self._store_version = version
+        finally:
+            self._lock.release()
+
+    def _refresh_shared(self):
+        """
+        Refresh under the store's lock, so processes sharing the token take
+        turns: whoever gets the lock second finds the token the first one
+        saved and adopts it instead of refreshing again (which would revoke
+        the refresh token the first one just got). Caller holds self._lock.
+        """
+        with self.store.lock():
+            stored = self.store.load()
+            if (stored and "access_token" in stored and stored["access_token"] != self._token_data["access_token"]
+                    and datetime.fromisoformat(stored["expires_at"]).timestamp() - REFRESH_MARGIN_SECONDS > time.time()):
+                log.info("Token already refreshed by another process")
+                self._store_version = self.store.version()
+                self._set_token(stored)
+                return stored["access_token"]
+            current = stored or self._token_data
+            self.save_token(self.refresh_token(current["refresh_token"]))
+            return self._token_data["access_token"]
+
+    def token_status(self):
+        """Describe the stored token from disk alone: no refresh, no network."""
+        data = self.load_token()
+        if not data or "access_token" not in data:
+            return {"token_file": self.store.path, "present": False}
+        expires_at = datetime.fromisoformat(data["expires_at"]).timestamp() if "expires_at" in data else 0
+        granted = set(data.get("scope") or ())
+        return {
+            "token_file": self.store.path,
+            "present": True,
+            "expires_in_seconds": int(expires_at - time.time()),
+            "refreshable": "refresh_token" in data,
+            "missing_scopes": sorted(self.required_scopes - granted),
+        }
+
+    def _set_token(self, data):
+        """Cache token data in memory and schedule its background refresh."""
+        self._token_data = data
+        self._expires_at = datetime.fromisoformat(data["expires_at"]).timestamp()
+        access_token = data["access_token"]
+        self._headers = {
+            "Client-ID": self.client_id,
+            "Authorization": f"Bearer {access_token}",
+        }
+        self._json_headers = dict(self._headers, **{"Content-Type": "application/json"})
+        self._schedule_refresh()
+        # A new token has not been validated yet; check it now, then hourly
+        self._schedule_validation(0)
+
+    def _schedule_refresh(self, min_delay=0):
+        with self._timer_lock:
+            if self._refresh_timer is not None:
+                _timers.cancel(self._refresh_timer)
+            if not self.background or self._closed or "refresh_token" not in self._token_data:
+                self._refresh_timer = None
+                return
+            delay = max(self._expires_at - REFRESH_MARGIN_SECONDS - time.time(), min_delay)
+            self._refresh_timer = _timers.schedule(delay, self._background_refresh)
+
+    def _background_refresh(self):
+        # The timer thread is shared by every channel, so don't wait out another caller's
+        # refresh or device flow here; look again later, or pick up the token they set
+        if not self._lock.acquire(blocking=False):
+            self._schedule_refresh(VALIDATE_RETRY_SECONDS)
+            return
+        try:
+            # Another caller may already have refreshed
+            if time.time() < self._expires_at - REFRESH_MARGIN_SECONDS:
+                return
+            try:
+                self._refresh_shared()
+            except Exception as e:
+                log.error("Background token refresh failed: %s", e)
+        finally:
+            self._lock.release()
+
+    def close(self):
+        """Stop the background refresh and validation timers."""
+        with self._timer_lock:
+            self._closed = True
+            if self._refresh_timer is not None:
+                _timers.cancel(self._refresh_timer)
+                self._refresh_timer = None
+            if self._validate_timer is not None:
+                _timers.cancel(self._validate_timer)
+                self._validate_timer = None
+
+    # ----------------------------
+    # Background validation
+    # ----------------------------
+    def _schedule_validation(self, delay):
+        # Called from request threads and the timer thread alike; the lock keeps it to one pending job
+        with self._timer_lock:
+            if self._validate_timer is not None:
+                _timers.cancel(self._validate_timer)
+            if not self.background or self._closed:
+                self._validate_timer = None
+                return
+            self._validate_due = time.time() + delay
+            self._validate_timer = _timers.schedule(delay, self._background_validate)
+
+    def validate_token(self):
+        """
+        Call /oauth2/validate for the current token and cache the result in
+        self.validation. This blocks on the network; request paths only read
+        the cached result and leave the call to the background job.
+        """
+        access_token = self._token_data["access_token"]
+        resp = helix_client.get(
+            f"{helix_client.OAUTH_URL}/validate",
+            headers={"Authorization": f"Bearer {access_token}"}
+        )
+        result = {"checked_at": time.time(), "status": resp.status_code, "valid": resp.status_code == 200,
+                  "missing_scopes": []}
+        if result["valid"]:
+            missing = self.required_scopes - set(resp.json().get("scopes") or ())
+            result["missing_scopes"] = sorted(missing)
+            token_validations.inc("missing_scopes" if missing else "ok")
+        else:
+            token_validations.inc("invalid")
+        # A newer token may have replaced this one while we waited on Twitch
+        if self._token_data is not None and self._token_data["access_token"] == access_token:
+            self.validation = result
+        return result
+
+    def _background_validate(self):
+        try:
+            result = self.validate_token()
+        except Exception as e:
+            token_validations.inc("error")
+            log.warning("Token validation failed, retrying in %ss: %s", VALIDATE_RETRY_SECONDS, e)
+            self._schedule_validation(VALIDATE_RETRY_SECONDS)
+            return
+
+        if not result["valid"]:
+            log.warning("Token rejected by Twitch (%s), refreshing in the background", result["status"])
+            self._recover(refresh=True)
+        elif result["missing_scopes"]:
+            log.warning("Token missing required scopes %s, re-authenticating in the background",
+                        result["missing_scopes"])
+            self._recover(refresh=False)
+        else:
+            log.debug("Token valid with all required scopes")
+            self._schedule_validation(VALIDATE_INTERVAL_SECONDS)
+
+    def _recover(self, refresh):
+        """Refresh, or failing that re-authenticate, on a worker thread; callers keep the current token meanwhile."""
+        # Only the timer thread gets here, so a plain flag is enough
+        if self._recovering:
+            return
+        self._recovering = True
+
+        def run():
+            try:
+                if refresh:
+                    with self._lock:
+                        if "refresh_token" in self._token_data:
+                            try:
+                                self._refresh_shared()
+                                return
+                            except Exception as e:
+                                log.warning("Refresh failed: %s", e)
+                # Waiting on the user can take minutes; requests keep using the current token meanwhile,
+                # and an expired-token refresh on the request path must not queue up behind it
+                self.reauthenticate(self._method)
+            except Exception as e:
+                log.error("Background re-authentication failed: %s", e)
+                self._schedule_validation(VALIDATE_RETRY_SECONDS)
+            finally:
+                self._recovering = False
+
+        threading.Thread(target=run, name="twitch-auth-recover", daemon=True).start()
 
     # ----------------------------
     # Device flow
@@ -71,14 +341,14 @@ class TwitchAuth:
         return token_data
 
     def _request_device_code(self):
-        url = "https://id.twitch.tv/oauth2/device"
+        url = f"{helix_client.OAUTH_URL}/device"
         payload = {"client_id": self.client_id, "scopes": " ".join(self.scopes)}
-        r = requests.post(url, data=payload)
+        r = helix_client.post(url, data=payload)
         r.raise_for_status()
         return r.json()
 
     def _poll_for_token(self, device_code, interval):
-        url = "https://id.twitch.tv/oauth2/token"
+        url = f"{helix_client.OAUTH_URL}/token"
         payload = {
             "client_id": self.client_id,
             "client_secret": self.client_secret,
@@ -88,21 +358,21 @@ class TwitchAuth:
 
         while True:
             time.sleep(interval)
-            r = requests.post(url, data=payload)
+            r = helix_client.post(url, data=payload)
 
             if r.status_code == 200:
-                print("Authorization complete!")
+                log.info("Authorization complete!")
                 return r.json()
 
             data = r.json()
             msg = data.get("error") or data.get("message")
 
             if msg == "authorization_pending":
-                print("Waiting for user authorization...")
+                log.debug("Waiting for user authorization...")
                 continue
             if msg == "slow_down":
                 interval += 5
-                print("Slowing down polling...")
+                log.info("Slowing down polling...")
                 continue
 
             raise Exception(f"Token polling failed: {data}")
@@ -111,25 +381,31 @@ class TwitchAuth:
     # Local redirect flow
     # ----------------------------
     def authenticate_local(self):
+        import webbrowser
+        from http.server import HTTPServer
+
         scope_str = "+".join(self.scopes)
         auth_url = (
-            f"https://id.twitch.tv/oauth2/authorize"
+            f"{helix_client.OAUTH_URL}/authorize"
             f"?client_id={self.client_id}"
             f"&redirect_uri={REDIRECT_URI}"
             f"&response_type=code"
             f"&scope={scope_str}"
         )
 
-        print("Opening Twitch OAuth URL in browser...")
+        log.info("Opening Twitch OAuth URL in browser...")
         webbrowser.open(auth_url)
 
         server = HTTPServer(("localhost", PORT), self._make_local_handler())
-        print(f"Waiting for Twitch redirect at {REDIRECT_URI}...")
+        log.info("Waiting for Twitch redirect at %s...", REDIRECT_URI)
         server.serve_forever()
 
         return self.load_token()
 
     def _make_local_handler(self):
+        from http.server import BaseHTTPRequestHandler
+        from urllib.parse import urlparse, parse_qs
+
         parent = self
 
         class OAuthHandler(BaseHTTPRequestHandler):
@@ -144,10 +420,10 @@ class TwitchAuth:
                     return
 
                 code = params["code"][0]
-                print(f"Received authorization code: {code}")
+                log.info("Received authorization code")
 
-                token_resp = requests.post(
-                    "https://id.twitch.tv/oauth2/token",
+                token_resp = helix_client.post(
+                    f"{helix_client.OAUTH_URL}/token",
                     params={
                         "client_id": parent.client_id,
                         "client_secret": parent.client_secret,
@@ -161,7 +437,7 @@ class TwitchAuth:
                     self.send_response(500)
                     self.end_headers()
                     self.wfile.write(b"Failed to exchange code for token.")
-                    print("Token exchange failed:", token_resp.text)
+                    log.error("Token exchange failed: %s", token_resp.text)
                     return
 
                 token_data = token_resp.json()
@@ -178,14 +454,15 @@ class TwitchAuth:
     # Refresh token
     # ----------------------------
     def refresh_token(self, refresh_token):
-        url = "https://id.twitch.tv/oauth2/token"
+        url = f"{helix_client.OAUTH_URL}/token"
         payload = {
             "grant_type": "refresh_token",
             "refresh_token": refresh_token,
             "client_id": self.client_id,
             "client_secret": self.client_secret,
         }
-        r = requests.post(url, data=payload)
+        r = helix_client.post(url, data=payload)
+        token_refreshes.inc("ok" if r.status_code == 200 else "failed")
         r.raise_for_status()
         return r.json()
 
@@ -193,46 +470,56 @@ class TwitchAuth:
     # Unified entry point
     # ----------------------------
     def get_valid_token(self, method="device", validate=False):
-        token_data = self.load_token()
-        now = datetime.now(timezone.utc)
+        """
+        Return a usable access token. validate=True no longer calls Twitch
+        inline: the token is validated in the background when it is loaded
+        and hourly after that (see self.validation); it only asks for that
+        check to happen now if the cached result is older than the interval.
+        """
+        self._method = method
+        # Hot path: a cached, unexpired token needs no lock or network, and only an occasional stat()
+        now = time.time()
+        if self._token_data is not None and now < self._expires_at:
+            if now >= self._next_store_check:
+                self._check_store(now)
+            if validate:
+                self._validate_if_stale()
+            return self._token_data["access_token"]
+
+        # Slow path is single-flight: concurrent callers wait here and reuse the result
+        with self._lock:
+            return self._get_valid_token_locked(method)
+
+    def _validate_if_stale(self):
+        now = time.time()
+        validation = self.validation
+        if validation is not None and now - validation["checked_at"] < VALIDATE_INTERVAL_SECONDS:
+            return
+        # A check due soon (including a retry after an error) is left alone
+        if self._validate_due - now > VALIDATE_RETRY_SECONDS:
+            self._schedule_validation(0)
+
+    def _get_valid_token_locked(self, method):
+        if self._token_data is None:
+            token_data = self.load_token()
+            if token_data and "access_token" in token_data:
+                self._store_version = self.store.version()
+                self._set_token(token_data)
+        token_data = self._token_data
 
         if token_data and "access_token" in token_data:
-            expires_at = datetime.fromisoformat(token_data["expires_at"])
-
-            if now < expires_at:
-                access_token = token_data["access_token"]
-
-                # Optional validation
-                if validate:
-                    resp = requests.get(
-                        "https://id.twitch.tv/oauth2/validate",
-                        headers={"Authorization": f"Bearer {access_token}"}
-                    )
-                    if resp.status_code != 200:
-                        print("Token invalid according to Twitch:", resp.text)
-                    else:
-                        data = resp.json()
-                        token_scopes = data.get("scopes", [])
-                        missing_scopes = [s for s in self.scopes if s not in token_scopes]
-                        if missing_scopes:
-                            print("Token missing required scopes:", missing_scopes)
-                            return self.reauthenticate(method)
-                        else:
-                            print("Token has all required scopes.")
-
-                return access_token
-
-            print("Token expired locally, attempting refresh...")
+            if time.time() < self._expires_at:
+                return token_data["access_token"]
+
+            log.info("Token expired locally, attempting refresh...")
             if "refresh_token" in token_data:
                 try:
-                    token_data = self.refresh_token(token_data["refresh_token"])
-                    self.save_token(token_data)
-                    return token_data["access_token"]
+                    return self._refresh_shared()
                 except Exception as e:
-                    print("Refresh failed:", e)
+                    log.warning("Refresh failed: %s", e)
 
         # Use the new reauthenticate method
-        print("Starting full re-authentication...")
+        log.warning("Starting full re-authentication...")
         return self.reauthenticate(method)
 
     def reauthenticate(self, method="device"):
@@ -245,15 +532,51 @@ class TwitchAuth:
             raise ValueError(f"Unknown authentication method: {method}")
         return token_data["access_token"]
 
+    def refresh_rejected(self, rejected_token):
+        """
+        Refresh after Twitch answered 401 for rejected_token. Callers that hit
+        the same 401 together share one refresh: whoever gets the lock second
+        finds a newer token and just returns it. Raises if the refresh fails;
+        re-authenticating is left to the background validation. With no token
+        loaded at all it takes the same path as a first request: load the
+        stored token, or run the device flow.
+        """
+        with self._lock:
+            if self._token_data is None:
+                return self._get_valid_token_locked(self._method)
+            if self._token_data["access_token"] != rejected_token:
+                return self._token_data["access_token"]
+            return self._refresh_shared()
+
     # ----------------------------
     # Headers helper
     # ----------------------------
     def get_headers(self, json_body=False, method="device", validate=False):
-        access_token = self.get_valid_token(method=method, validate=validate)
-        headers = {
-            "Client-ID": self.client_id,
-            "Authorization": f"Bearer {access_token}",
-        }
-        if json_body:
-            headers["Content-Type"] = "application/json"
-        return headers
+        """Return request headers; the returned dict is shared and must not be mutated."""
+        self.get_valid_token(method=method, validate=validate)
+        return self._json_headers if json_body else self._headers
+
+    async def get_headers_async(self, json_body=False, method="device", validate=False):
+        """
+        Asyncio-friendly get_headers. Returns immediately while the cached token
+        is valid; otherwise the refresh runs in a worker thread so the event loop
+        keeps running, and concurrent tasks share the single in-flight refresh.
+        """
+        now = time.time()
+        if self._token_data is None or now >= self._expires_at:
+            import asyncio
+            await asyncio.to_thread(self.get_valid_token, method, validate)
+        else:
+            # Same occasional store check as get_valid_token, to adopt a token another process saved
+            if now >= self._next_store_check:
+                self._check_store(now)
+            if validate:
+                self._validate_if_stale()
+        return self._json_headers if json_body else self._headers
+
+    async def refresh_headers_async(self, rejected_headers, json_body=False):
+        """Headers with a fresh token, for retrying a request that got a 401 with rejected_headers."""
+        import asyncio
+        rejected_token = rejected_headers["Authorization"].removeprefix("Bearer ")
+        await asyncio.to_thread(self.refresh_rejected, rejected_token)
+        return self._json_headers if json_body else self._headers
@@ -1,183 +1,214 @@
-import os
-import sys
 import json
 import time
-import aiohttp
 import asyncio
-import requests
-import websockets
+import logging
+import helix_client
+from config import load_config, ConfigError
+from helix_scheduler import scheduler, PRIORITY_TITLE
 from scopes import SCOPES
 from twitch_auth import TwitchAuth
-
-TWITCH_WS_URL = "wss://eventsub.wss.twitch.tv/ws"
-TWITCH_API_URL = "https://api.twitch.tv/helix/eventsub/subscriptions"
-CLIENT_ID = os.getenv("TWITCH_CLIENT_ID")
-CLIENT_SECRET = os.getenv("TWITCH_CLIENT_SECRET")
-BROADCASTER_USERNAME = os.getenv("BROADCASTER_USERNAME")
-BOT_USERNAME = os.getenv("BOT_USERNAME")
-
-#Title variables
-MAX_SUBS = int(os.getenv("MAX_SUBS"))
-UPDATE_INTERVAL_MINUTES = int(os.getenv("UPDATE_INTERVAL_MINUTES"))
-BASE_SUBS = int(os.getenv("BASE_SUBS"))
-LINEAR = os.getenv("LINEAR")
-title = os.getenv("title")
-insert_after = int(os.getenv("insert_after"))
+from user_resolver import UserResolver
+from title_writer import TitleWriter
+from title_template import TitleTemplate
+from eventsub import EventSubClient, TWITCH_WS_URL
+from eventsub_dispatch import Dispatcher
+from event_pipeline import EventPipeline
+from subscriptions import bootstrap_subscriptions, create_subscription, SUBSCRIPTIONS, SUBSCRIPTIONS_URL
+
+TWITCH_API_URL = SUBSCRIPTIONS_URL
+log = logging.getLogger(__name__)
+
+# The old module-level settings, now read from config.load_config() on first access
+_SETTINGS = {
+    "CLIENT_ID": "client_id",
+    "CLIENT_SECRET": "client_secret",
+    "BROADCASTER_USERNAME": "broadcaster_username",
+    "BOT_USERNAME": "bot_username",
+    "MAX_SUBS": "max_subs",
+    "UPDATE_INTERVAL_MINUTES": "update_interval_minutes",
+    "BASE_SUBS": "base_subs",
+    "LINEAR": "linear",
+    "title": "title",
+    "insert_after": "insert_after",
+    "TITLE_TEMPLATE": "title_template",
+}
+
+_title_template = None
+_user_resolver = None
+
+def __getattr__(name):
+    if name in _SETTINGS:
+        return getattr(load_config(), _SETTINGS[name])
+    if name == "title_template":
+        return get_title_template()
+    if name == "user_resolver":
+        return get_user_resolver()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def get_title_template() -> TitleTemplate:
+    """Parse the configured title template once; rendering just joins the precomputed segments."""
+    global _title_template
+    if _title_template is None:
+        config = load_config().require("max_subs", "title_values")
+        limits = {"defaults": {**config.title_values, "goal": config.max_subs},
+                  "max_values": {"subs": config.max_subs}}
+        if config.title_template:
+            template = TitleTemplate(config.title_template, **limits)
+        else:
+            config.require("title", "insert_after")
+            template = TitleTemplate.from_insert_after(config.title, config.insert_after, **limits)
+        # Only subs (and goal) are filled in when the title is written, everything else comes from TITLE_VALUES
+        missing = template.missing("subs")
+        if missing:
+            raise ConfigError(f"Invalid configuration:\n  TITLE_TEMPLATE uses {', '.join('{%s}' % f for f in missing)}"
+                              f" but TITLE_VALUES doesn't set it (e.g. TITLE_VALUES=\"{missing[0]}=1\")")
+        _title_template = template
+    return _title_template
+
+def get_user_resolver() -> UserResolver:
+    global _user_resolver
+    if _user_resolver is None:
+        config = load_config().require("client_id", "client_secret")
+        _user_resolver = UserResolver(config.client_id, config.client_secret)
+    return _user_resolver
 
 def get_app_token(client_id: str, client_secret: str) -> str:
-    url = "https://id.twitch.tv/oauth2/token"
-    payload = {
-        "client_id": client_id,
-        "client_secret": client_secret,
-        "grant_type": "client_credentials",
-    }
-    r = requests.post(url, data=payload)
-    r.raise_for_status()
-    return r.json()["access_token"]
+    """Return a cached app access token, minting a new one only when it has expired."""
+    user_resolver = get_user_resolver()
+    if client_id == user_resolver.client_id and client_secret == user_resolver.client_secret:
+        return user_resolver.get_app_token()
+    return UserResolver(client_id, client_secret, cache_file=None).get_app_token()
 
 def get_channel_id(username: str) -> str:
-    """Fetch the broadcaster's user ID using an app access token."""
-    app_token = get_app_token(CLIENT_ID, CLIENT_SECRET)
-    headers = {
-        "Client-ID": CLIENT_ID,
-        "Authorization": f"Bearer {app_token}"
-    }
-    params = {"login": username}
-    response = requests.get("https://api.twitch.tv/helix/users", headers=headers, params=params)
-    response.raise_for_status()
-    data = response.json()
-    if not data["data"]:
-        raise ValueError(f"No user found with username '{username}'")
-    return data["data"][0]["id"]
+    """Fetch the broadcaster's user ID, served from the resolver cache when known."""
+    return get_user_resolver().get_id(username)
+
+def get_channel_ids(*usernames: str) -> dict:
+    """Resolve several logins at once (one Helix call per 100 unknown logins)."""
+    return get_user_resolver().resolve(usernames)
 
 async def subscribe_event(auth: TwitchAuth, session_id, event_type, condition, version=1):
     """
     Subscribes to a Twitch EventSub topic with debug logging.
+    Returns the response body, or None if Twitch rejected the subscription.
     """
+    headers = await auth.get_headers_async(json_body=True)
+    debug = log.isEnabledFor(logging.DEBUG)
 
-    payload = {
-        "type": event_type,
-        "version": version,
-        "condition": condition,
-        "transport": {"method": "websocket", "session_id": session_id}
-    }
-    headers = auth.get_headers(json_body=True)
-
-    print("\n=== EventSub Debug ===")
-    print("Payload:", json.dumps(payload, indent=2))
-    print("Headers:", json.dumps(headers, indent=2))
-    print("Sending Request...\n")
-
-    async with aiohttp.ClientSession() as session:
-        async with session.post(TWITCH_API_URL, headers=headers, json=payload) as resp:
-            try:
-                data = await resp.json()
-            except Exception:
-                text = await resp.text()
-                print("Non-JSON Response:", text)
-                return
-
-            print("Status:", resp.status)
-            print("Response:", json.dumps(data, indent=2))
-
-            if resp.status == 403:
-                print(f"\nAuthorization failed for subscription {event_type} v{version} with condition {condition}")
-                sys.exit(1)
-
-            return data
-
-message_queue = asyncio.Queue()
-
-async def twitch_listener(auth: TwitchAuth):
-    async with websockets.connect(TWITCH_WS_URL) as ws:
-        async for msg in ws:
-            #print(msg)
-            data = json.loads(msg)
-            mtype = data["metadata"]["message_type"]
-
-            if mtype == "session_welcome":
-                session_id = data["payload"]["session"]["id"]
-                print(f"Connected with session {session_id}")
-
-                broadcaster_id = get_channel_id(BROADCASTER_USERNAME)
-                user_id = get_channel_id(BOT_USERNAME)
-                # Chat messages
-                await subscribe_event(
-                    auth,
-                    session_id,
-                    "channel.chat.message",
-                    {
-                        "broadcaster_user_id": broadcaster_id,
-                        "user_id": user_id
-                    }
-                )
-
-                # Uncomment if needed:
-                # await subscribe_event(
-                #     session_id,
-                #     "channel.cheer",
-                #     { "broadcaster_user_id": broadcaster_id }
-                # )
-
-                #await subscribe_event(
-                #    auth,
-                #    session_id,
-                #    "channel.cheer",
-                #    { "broadcaster_user_id": broadcaster_id }
-                #)
-
-            elif mtype == "notification":
-                event_type = data["metadata"]["subscription_type"]
-                event = data["payload"]["event"]
-
-                if event_type == "channel.chat.message":
-                    user = event["chatter_user_name"]
-                    msg_text = event["message"]["text"]
-                    broadcaster_user_name = event["broadcaster_user_name"]
-                    print(f"[Chat: {broadcaster_user_name}] {user}: {msg_text}")
-                    #await message_queue.put({'user': user, 'message': msg_text})
-                
-                elif event_type == "":
-                    pass
-
-            elif mtype == "session_reconnect":
-                new_url = data["payload"]["session"]["reconnect_url"]
-                print("Reconnect to:", new_url)
-                return await twitch_listener()  # Reconnect loop
-
-async def process_messages(rate_per_second=1):
-    if rate_per_second == -1:
-        pass
-    else:
-        interval = 1 / rate_per_second
-        while True:
-            event = await message_queue.get()
-            user = event['user']
-            msg_text = event['message']
+    if debug:
+        # Only pay for the JSON dumps when someone is reading them
+        log.debug("EventSub subscribe %s v%s\nCondition: %s\nHeaders: %s", event_type, version,
+                  json.dumps(condition, indent=2), json.dumps(helix_client.redact_headers(headers), indent=2))
+
+    resp = await create_subscription(headers, session_id, event_type, condition, version)
+    try:
+        data = resp.json()
+    except ValueError:
+        log.error("Non-JSON response to subscribe %s: %s", event_type, resp.text)
+        return
+
+    if debug:
+        log.debug("Status: %s\nResponse: %s", resp.status, json.dumps(data, indent=2))
 
-            # Here you can do anything with the message
-            print(f"Processing message from {user}: {msg_text}")
+    if resp.status == 403:
+        log.error("Authorization failed for subscription %s v%s with condition %s", event_type, version, condition)
+        return None
 
-            await asyncio.sleep(interval)  # Wait before processing next message
+    return data
+
+async def twitch_listener(auth: TwitchAuth, pipeline: EventPipeline = None, counter=None, archive=None,
+                          commands=None, analytics=None):
+    """
+    Listen to chat (and, given a sub_counter.SubCounter or an
+    analytics.StreamAnalytics, sub/gift/resub/cheer events) until cancelled.
+    Chat lines also go to archive, a started chat_archive.ChatArchive, to
+    commands, a commands.CommandRouter, and to analytics when those are passed.
+    """
+    config = load_config().require_for("listen")
+    wanted = set(counter.event_types if counter is not None else ()) | set(
+        analytics.event_types if analytics is not None else ())
+    # This listener's own specs: the counter's and analytics' event types are turned on here
+    # only, and a subscription Twitch rejects is disabled for this listener, not the module list
+    specs = [spec.copy(enabled=spec.enabled or spec.type in wanted) for spec in SUBSCRIPTIONS]
+
+    async def on_welcome(session_id):
+        # Resolved off the loop so a slow Helix lookup doesn't stall other sockets
+        user_ids = await asyncio.to_thread(get_channel_ids, config.broadcaster_username, config.bot_username)
+        ids = {
+            "broadcaster_id": user_ids[config.broadcaster_username.lower()],
+            "bot_id": user_ids[config.bot_username.lower()],
+        }
+        # Enable more event types in subscriptions.SUBSCRIPTIONS
+        await bootstrap_subscriptions(auth, session_id, ids, specs=specs)
+
+    dispatcher = Dispatcher()
+    if counter is not None:
+        counter.register(dispatcher)
+    if commands is not None:
+        commands.register(dispatcher)
+    if analytics is not None:
+        analytics.register(dispatcher)
+
+    @dispatcher.on("notification", "channel.chat.message")
+    async def on_chat_message(notification):
+        chat = notification.event
+        log.info("[Chat: %s] %s: %s", chat.broadcaster_user_name, chat.chatter_user_name, chat.text)
+        if archive is not None:
+            archive.put(notification)
+        if pipeline is not None:
+            await pipeline.put({'user': chat.chatter_user_name, 'message': chat.text})
+
+    # Reconnects are handled inside the client without recursion or re-subscribing
+    client = EventSubClient(on_welcome=on_welcome, dispatcher=dispatcher, url=TWITCH_WS_URL)
+    try:
+        await client.run()
+    finally:
+        if counter is not None:
+            await counter.close_async()
+        if archive is not None:
+            await asyncio.to_thread(archive.close)
+        if analytics is not None:
+            await analytics.close()
+
+async def handle_message(event):
+    user = event['user']
+    msg_text = event['message']
+
+    # Here you can do anything with the message
+    log.info("Processing message from %s: %s", user, msg_text)
+
+async def process_messages(rate_per_second=1, workers=4, maxsize=1000, overflow="block"):
+    """
+    Start the message pipeline inside the running loop and return it.
+    Pass it to twitch_listener to feed it; rate_per_second=-1 means unlimited.
+    """
+    pipeline = EventPipeline(
+        handle_message,
+        workers=workers,
+        maxsize=maxsize,
+        rate_per_second=None if rate_per_second == -1 else rate_per_second,
+        overflow=overflow,
+        key=lambda event: event['user'],
+    )
+    pipeline.start()
+    return pipeline
 
 ######### Title Functions #########
 
-def insertSubs(subs):
-    words = title.split()
-    words.insert(insert_after, str(subs))
-    new_title = " ".join(words)
-    return new_title
+def insertSubs(subs, **values):
+    return get_title_template().render(subs=subs, **values)
 
 def subs_logic(subs):
-    mult = os.getenv("BASE_MULT")
+    """Next sub count for the timed loop: add BASE_SUBS (LINEAR) or multiply by BASE_MULT."""
+    config = load_config()
 
-    if subs == None:
-        subs = BASE_SUBS
+    if subs is None:
+        subs = config.base_subs
 
-    if LINEAR == True:
-        subs += BASE_SUBS
-    elif LINEAR == False:
-        subs = (subs * mult) // 1
+    if config.linear:
+        subs += config.base_subs
+    else:
+        subs = int(subs * config.base_mult)
     return subs
 
 def update_title(auth: TwitchAuth ,channel_id: str, new_title: str):
@@ -185,32 +216,62 @@ def update_title(auth: TwitchAuth ,channel_id: str, new_title: str):
     headers = auth.get_headers()
     data = {"title": new_title}
 
-    response = requests.patch(
-        f"https://api.twitch.tv/helix/channels?broadcaster_id={channel_id}",
+    for _ in range(2):
+        response = helix_client.patch(
+            f"{helix_client.HELIX_URL}/channels?broadcaster_id={channel_id}",
+            headers=headers,
+            json=data
+        )
+        if response.status_code != 429:
+            break
+        # Wait for the bucket to refill instead of dropping the change
+        reset_at = float(response.headers.get("Ratelimit-Reset", time.time() + 1))
+        time.sleep(max(reset_at - time.time(), 1))
+
+    if response.status_code == 204:
+        log.info("Title updated successfully!")
+    else:
+        log.error("Failed to update title (%s): %s", response.status_code, response.text)
+
+async def update_title_async(auth: TwitchAuth, channel_id: str, new_title: str):
+    """Update the channel title through the scheduler's high-priority lane."""
+    headers = await auth.get_headers_async()
+    response = await scheduler.request(
+        "PATCH",
+        f"{helix_client.HELIX_URL}/channels",
+        priority=PRIORITY_TITLE,
         headers=headers,
-        json=data
+        params={"broadcaster_id": channel_id},
+        json={"title": new_title},
     )
-    
-    if response.status_code == 204:
-        print("Title updated successfully!")
+
+    if response.status == 204:
+        log.info("Title updated successfully!")
     else:
-        print(f"Failed to update title ({response.status_code}): {response.text}")
+        log.error("Failed to update title (%s): %s", response.status, response.text)
+    return response.status == 204
 
 def update_title_loop(auth):
-    print("Fetching channel ID...")
-    channel_id = get_channel_id(BROADCASTER_USERNAME)
-    print(f"Channel ID for '{BROADCASTER_USERNAME}': {channel_id}")
-    
-    subs = BASE_SUBS
+    config = load_config().require_for("title-loop")
+    log.info("Fetching channel ID...")
+    channel_id = get_channel_id(config.broadcaster_username)
+    log.info("Channel ID for '%s': %s", config.broadcaster_username, channel_id)
+
+    writer = TitleWriter(auth, channel_id)
+    log.info("Current title: %s", writer.sync())
+
+    subs = config.base_subs
 
     while True:
-        print("Updating title...")
-        print(subs)
-        new_title = insertSubs(subs)
-        update_title(auth, channel_id, new_title)
-        print(f"Waiting {UPDATE_INTERVAL_MINUTES} minutes before next update...")
-        time.sleep(UPDATE_INTERVAL_MINUTES * 60)
-        subs += subs_logic(subs)
-        if subs >= MAX_SUBS:
-            subs == MAX_SUBS
+        log.info("Updating title with %s subs...", subs)
+        writer.set_title(insertSubs(subs))
+        writer.flush()
+        log.info("Waiting %s minutes before next update...", config.update_interval_minutes)
+        time.sleep(config.update_interval_minutes * 60)
+        subs = subs_logic(subs)
+        if subs >= config.max_subs:
+            subs = config.max_subs
+            log.info("Reached %s subs, writing the final title", subs)
+            writer.set_title(insertSubs(subs))
+            writer.close()
             return
\ No newline at end of file
@@ -0,0 +1,142 @@
+import os
+import json
+import time
+import logging
+import tempfile
+import threading
+import contextlib
+import helix_client
+from config import load_config
+
+TOKEN_URL = f"{helix_client.OAUTH_URL}/token"
+USERS_URL = f"{helix_client.HELIX_URL}/users"
+USER_CACHE_FILE = "twitch_users.json"
+USER_CACHE_TTL_SECONDS = 7 * 24 * 60 * 60
+# Helix accepts at most 100 login= params per /users request
+MAX_LOGINS_PER_REQUEST = 100
+# Mint a new app token this many seconds before the old one expires
+APP_TOKEN_EXPIRY_MARGIN = 60
+
+log = logging.getLogger(__name__)
+
+
+class UserResolver:
+    """
+    Resolves Twitch logins to user IDs.
+
+    App access tokens are cached until they expire and login -> ID mappings
+    are kept in memory and in USER_CACHE_FILE, so IDs that are already known
+    never touch the network.
+    """
+
+    def __init__(self, client_id=None, client_secret=None,
+                 cache_file=USER_CACHE_FILE, ttl=USER_CACHE_TTL_SECONDS):
+        config = load_config()
+        self.client_id = client_id or config.client_id
+        self.client_secret = client_secret or config.client_secret
+        self.cache_file = cache_file
+        self.ttl = ttl
+        self._app_token = None
+        self._app_token_expires_at = 0
+        self._users = None  # login -> {"id": ..., "fetched_at": ...}
+        self._lock = threading.Lock()
+
+    # ----------------------------
+    # App access token
+    # ----------------------------
+    def get_app_token(self):
+        with self._lock:
+            if self._app_token and time.time() < self._app_token_expires_at:
+                return self._app_token
+
+            payload = {
+                "client_id": self.client_id,
+                "client_secret": self.client_secret,
+                "grant_type": "client_credentials",
+            }
+            r = helix_client.post(TOKEN_URL, data=payload)
+            r.raise_for_status()
+            data = r.json()
+            self._app_token = data["access_token"]
+            self._app_token_expires_at = time.time() + data.get("expires_in", 0) - APP_TOKEN_EXPIRY_MARGIN
+            return self._app_token
+
+    # ----------------------------
+    # Cache storage
+    # ----------------------------
+    def _load_cache(self):
+        if self._users is not None:
+            return self._users
+        self._users = {}
+        if self.cache_file and os.path.exists(self.cache_file):
+            try:
+                with open(self.cache_file, "r") as f:
+                    self._users = json.load(f)
+            except (OSError, ValueError) as e:
+                log.warning("Ignoring unreadable user cache %s: %s", self.cache_file, e)
+        return self._users
+
+    def _save_cache(self):
+        if not self.cache_file:
+            return
+        # Temp file and rename, so a crash mid-write leaves the old cache rather than broken JSON
+        directory = os.path.dirname(os.path.abspath(self.cache_file))
+        fd, tmp = tempfile.mkstemp(prefix=".twitch_users-", suffix=".tmp", dir=directory)
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(self._users, f, indent=2)
+            os.replace(tmp, self.cache_file)
+        except BaseException:
+            with contextlib.suppress(OSError):
+                os.remove(tmp)
+            raise
+
+    # ----------------------------
+    # Lookups
+    # ----------------------------
+    def resolve(self, logins):
+        """Return a {login: user_id} dict, fetching only unknown or stale logins."""
+        logins = [login.lower() for login in logins if login]
+        now = time.time()
+        result = {}
+        missing = []
+
+        with self._lock:
+            users = self._load_cache()
+            for login in dict.fromkeys(logins):
+                entry = users.get(login)
+                if entry and now - entry["fetched_at"] < self.ttl:
+                    result[login] = entry["id"]
+                else:
+                    missing.append(login)
+
+        if not missing:
+            return result
+
+        app_token = self.get_app_token()
+        headers = {
+            "Client-ID": self.client_id,
+            "Authorization": f"Bearer {app_token}"
+        }
+        fetched = {}
+        for i in range(0, len(missing), MAX_LOGINS_PER_REQUEST):
+            params = [("login", login) for login in missing[i:i + MAX_LOGINS_PER_REQUEST]]
+            response = helix_client.get(USERS_URL, headers=headers, params=params)
+            response.raise_for_status()
+            for user in response.json()["data"]:
+                fetched[user["login"].lower()] = user["id"]
+
+        with self._lock:
+            for login, user_id in fetched.items():
+                self._users[login] = {"id": user_id, "fetched_at": now}
+            self._save_cache()
+
+        result.update(fetched)
+        return result
+
+    def get_id(self, login):
+        """Resolve a single login, raising ValueError if Twitch does not know it."""
+        user_id = self.resolve([login]).get(login.lower())
+        if user_id is None:
+            raise ValueError(f"No user found with username '{login}'")
+        return user_id